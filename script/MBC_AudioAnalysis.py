@@ -0,0 +1,362 @@
+"""
+纯音频输入 - 没有MIDI时从WAV/MP3的频谱中检测按键
+
+AudioAnalysis在后台线程中按块读取音频（与人声流式播放共用open_audio_source），
+对每块做向量化的短时傅里叶变换：
+- 频谱按半音合并到128个MIDI音符上（对数频率的三角滤波器组，类似恒Q/色度特征）
+- 每个音符的能量（dB）相对上一帧的上升超过analysis_onset_db即为一次按键（onset），
+  只保留频率上的局部峰值和最响的若干个音，减少泛音和频谱泄漏造成的误检
+- 力度由音符能量相对已出现的最大能量换算到1~127
+
+检测结果按分析帧存入数组，并提供与MidiTimeline相同的查询接口
+（event_count / key_state / coalesce / average_volume），
+因此MidiVisualizer按播放时钟发布按键状态的路径完全不变。
+分析线程比实时快得多，始终保持在播放位置之前；每次查询都是O(1)的数组切片。
+
+使用方法：
+    analysis = AudioAnalysis.from_config("song.mp3")
+    analysis.start()
+    analysis.wait_ready(1.0)
+    pygame.mixer.music.load("song.mp3"); pygame.mixer.music.play()
+    active, velocity = analysis.key_state(pygame.mixer.music.get_pos() / 1000.0)
+"""
+
+import os
+import threading
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from MBC_MidiTimeline import MIDI_NOTE_COUNT
+from MBC_VocalStream import open_audio_source
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".ogg")
+SILENCE_DB = -120.0
+
+
+def is_audio_file(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in AUDIO_EXTENSIONS
+
+
+def note_filterbank(fft_size: int, sample_rate: int, note_min: int = 21, note_max: int = 108) -> np.ndarray:
+    """
+    频谱到MIDI音符的滤波器组
+
+    每个FFT频点按到音符中心的半音距离做三角加权后求和（纯音的能量落在
+    中心附近的几个频点上，求和不受高音区频点更密的影响）；
+    低音区一个半音内没有频点时取最近的频点。
+
+    Returns:
+        float32 (fft_size // 2 + 1, 128)，音域外的列为0
+    """
+    freqs = np.arange(fft_size // 2 + 1) * sample_rate / fft_size
+    positions = np.full(freqs.shape, -np.inf)
+    positions[1:] = 69 + 12 * np.log2(freqs[1:] / 440.0)
+    bank = np.zeros((freqs.size, MIDI_NOTE_COUNT), dtype=np.float32)
+    for note in range(note_min, note_max + 1):
+        weights = np.clip(1 - np.abs(positions - note), 0, None)
+        if not weights.any():
+            weights[np.argmin(np.abs(positions - note))] = 1
+        bank[:, note] = weights
+    return bank
+
+
+def _to_mono(block: np.ndarray) -> np.ndarray:
+    """音源输出（float32或mixer整数格式）转换为单声道float32"""
+    if np.issubdtype(block.dtype, np.integer):
+        block = block.astype(np.float32) / float(np.iinfo(block.dtype).max + 1)
+    return block.mean(axis=1, dtype=np.float32) if block.ndim == 2 else block.astype(np.float32)
+
+
+class AudioAnalysis:
+    """
+    音频文件的按键检测结果，接口与MidiTimeline相同
+
+    分析线程是唯一的写入者；数组扩容时先复制再替换引用，最后才更新frames_ready，
+    查询端先读frames_ready再读数组，因此不需要加锁。
+    """
+
+    def __init__(self, path: str, rate: int = 22050, fft_size: int = 4096, hop: int = 512,
+                 chunk_seconds: float = 2.0, lookahead: float = 20.0, onset_db: float = 6.0,
+                 range_db: float = 60.0, frame_range_db: float = 30.0,
+                 max_polyphony: int = 6, hold: float = 0.08,
+                 note_min: int = 21, note_max: int = 108):
+        """
+        Args:
+            path: 音频文件路径
+            rate: 分析采样率（没有ffmpeg的MP3后备方案使用mixer的采样率，窗长按比例换算）
+            fft_size, hop: STFT窗长和帧移（采样点）
+            chunk_seconds: 每次读取并分析的音频长度
+            lookahead: 领先播放位置超过该秒数时暂停分析
+            onset_db: 判定为按键的能量上升（dB）
+            range_db: 只检测比已出现的最大能量低range_db以内的音符，也是力度的动态范围
+            frame_range_db: 只检测比同一帧最响音符低frame_range_db以内的音符
+            max_polyphony: 每帧最多检测的按键数
+            hold: 检测到的按键保持按下的时间（秒）
+            note_min, note_max: 检测的音域
+        """
+        self.path = path
+        self.file_type = "wav" if path.lower().endswith(".wav") else "mp3"
+        self.rate = rate
+        self.fft_size = fft_size
+        self.hop = hop
+        self.chunk_seconds = chunk_seconds
+        self.lookahead = lookahead
+        self.onset_db = onset_db
+        self.range_db = range_db
+        self.frame_range_db = frame_range_db
+        self.max_polyphony = max_polyphony
+        self.hold = hold
+        self.note_min = note_min
+        self.note_max = note_max
+
+        self.frame_rate = rate / hop
+        self.hold_frames = 1
+        self.estimated_duration = 0.0
+        self._onsets = np.zeros((0, MIDI_NOTE_COUNT), dtype=bool)
+        self._velocity = np.zeros((0, MIDI_NOTE_COUNT), dtype=np.uint8)
+        self._cum_onsets = np.zeros(1, dtype=np.int64)     # [i]为前i帧的按键总数
+        self._cum_velocity = np.zeros(1, dtype=np.int64)   # [i]为前i帧的力度总和
+        self.frames_ready = 0
+        self.finished = False
+        self.error: Optional[str] = None
+        self.playhead = 0.0
+        self.late_queries = 0
+        self.analysis_seconds = 0.0     # 分析本身耗费的时间
+
+        self._previous_level = None
+        self._previous_onsets = np.zeros(MIDI_NOTE_COUNT, dtype=bool)
+        self._peak_db = -np.inf
+        self._thread = None
+        self._running = False
+
+    @classmethod
+    def from_config(cls, path: str, config=None) -> "AudioAnalysis":
+        if config is None:
+            from MBC_config import get_config
+            config = get_config()
+        audio = config.audio
+        return cls(path, rate=audio.analysis_rate, fft_size=audio.analysis_fft_size,
+                   hop=audio.analysis_hop, chunk_seconds=audio.analysis_chunk_seconds,
+                   lookahead=audio.analysis_lookahead_s, onset_db=audio.analysis_onset_db,
+                   range_db=audio.analysis_range_db, frame_range_db=audio.analysis_frame_range_db,
+                   max_polyphony=audio.analysis_max_polyphony,
+                   hold=audio.analysis_hold_s, note_min=audio.midi_note_min, note_max=audio.midi_note_max)
+
+    # ---- 分析线程 ----
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._analyze, name="audio-analysis", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def wait_ready(self, seconds: float, timeout: float = 30.0) -> bool:
+        """等待分析领先到seconds秒（或整个文件分析完），返回是否就绪"""
+        deadline = time.perf_counter() + timeout
+        while not self.finished and self.analyzed_until < seconds:
+            if time.perf_counter() > deadline:
+                return False
+            time.sleep(0.01)
+        return self.error is None
+
+    @property
+    def analyzed_until(self) -> float:
+        return self.frames_ready / self.frame_rate
+
+    def _analyze(self):
+        source = None
+        try:
+            source = open_audio_source(self.path, self.file_type, self.rate, 1)
+            sample_rate = source.mixer_rate
+            if sample_rate != self.rate:
+                ratio = sample_rate / self.rate
+                self.fft_size = 1 << int(round(np.log2(self.fft_size * ratio)))
+                self.hop = max(1, int(round(self.hop * ratio)))
+            self.frame_rate = sample_rate / self.hop
+            self.hold_frames = max(1, int(round(self.hold * self.frame_rate)))
+            if hasattr(source, "frames"):
+                self.estimated_duration = source.frames / source.rate
+            self._reserve(int(max(self.estimated_duration, 60.0) * self.frame_rate) + 1)
+
+            bank = note_filterbank(self.fft_size, sample_rate, self.note_min, self.note_max)
+            window = np.hanning(self.fft_size).astype(np.float32)
+            # 帧i的窗口中心在i * hop，前面补半个窗口
+            buffer = np.zeros(self.fft_size // 2, dtype=np.float32)
+            chunk_frames = int(self.chunk_seconds * sample_rate)
+
+            while self._running:
+                while self._running and self.analyzed_until - self.playhead > self.lookahead:
+                    time.sleep(0.05)
+                block = source.read(chunk_frames)
+                if block is None:
+                    buffer = np.concatenate([buffer, np.zeros(self.fft_size // 2, dtype=np.float32)])
+                else:
+                    buffer = np.concatenate([buffer, _to_mono(block)])
+                began = time.perf_counter()
+                count = (buffer.size - self.fft_size) // self.hop + 1
+                if count > 0:
+                    frames = sliding_window_view(buffer, self.fft_size)[::self.hop][:count]
+                    power = np.abs(np.fft.rfft(frames * window, axis=1)) ** 2
+                    self._append(*self._detect(power.astype(np.float32) @ bank))
+                    buffer = buffer[count * self.hop:]
+                self.analysis_seconds += time.perf_counter() - began
+                if block is None:
+                    break
+        except Exception as e:
+            self.error = str(e)
+            print(f"Audio analysis of {self.path} failed: {e}")
+        finally:
+            if source is not None and hasattr(source, "close"):
+                source.close()
+            self.finished = True
+
+    def _detect(self, energy: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        一块分析帧的按键检测
+
+        Args:
+            energy: (帧数, 128) 每个音符的平均功率
+        Returns:
+            (bool按键, uint8力度)，形状与energy相同
+        """
+        level = np.maximum(10 * np.log10(energy + 1e-12), SILENCE_DB)
+        if self._previous_level is None:
+            self._previous_level = np.full(MIDI_NOTE_COUNT, SILENCE_DB)
+        previous = self._previous_level[None, :]
+        rise = level - np.concatenate([previous, level[:-1]])
+        self._previous_level = level[-1]
+
+        peak = np.maximum.accumulate(np.maximum(level.max(axis=1), self._peak_db))
+        self._peak_db = float(peak[-1])
+        relative = level - peak[:, None]
+
+        # 频率上的局部峰值：抑制相邻半音的频谱泄漏
+        padded = np.pad(level, ((0, 0), (1, 1)), constant_values=-np.inf)
+        local_peak = (level >= padded[:, :-2]) & (level >= padded[:, 2:])
+        # 同一帧中远弱于最响音符的只是泄漏或瞬态噪声
+        dominant = level > level.max(axis=1, keepdims=True) - self.frame_range_db
+        onsets = (rise > self.onset_db) & (relative > -self.range_db) & local_peak & dominant
+
+        if self.max_polyphony < MIDI_NOTE_COUNT:
+            score = np.where(onsets, level, -np.inf)
+            loudest = np.argpartition(-score, self.max_polyphony, axis=1)[:, :self.max_polyphony]
+            keep = np.zeros_like(onsets)
+            np.put_along_axis(keep, loudest, True, axis=1)
+            onsets &= keep
+
+        # 起音较慢时能量会连续几帧上升，只算第一帧
+        onsets &= ~np.concatenate([self._previous_onsets[None, :], onsets[:-1]])
+        self._previous_onsets = onsets[-1].copy()
+
+        velocity = np.clip(127 * (1 + relative / self.range_db), 1, 127).astype(np.uint8)
+        velocity[~onsets] = 0
+        return onsets, velocity
+
+    def _reserve(self, capacity: int):
+        """确保数组至少能容纳capacity帧（扩容时复制后替换引用）"""
+        if capacity <= self._onsets.shape[0]:
+            return
+        capacity = max(capacity, 2 * self._onsets.shape[0])
+        onsets = np.zeros((capacity, MIDI_NOTE_COUNT), dtype=bool)
+        velocity = np.zeros((capacity, MIDI_NOTE_COUNT), dtype=np.uint8)
+        cum_onsets = np.zeros(capacity + 1, dtype=np.int64)
+        cum_velocity = np.zeros(capacity + 1, dtype=np.int64)
+        n = self.frames_ready
+        onsets[:n] = self._onsets[:n]
+        velocity[:n] = self._velocity[:n]
+        cum_onsets[:n + 1] = self._cum_onsets[:n + 1]
+        cum_velocity[:n + 1] = self._cum_velocity[:n + 1]
+        self._onsets, self._velocity = onsets, velocity
+        self._cum_onsets, self._cum_velocity = cum_onsets, cum_velocity
+
+    def _append(self, onsets: np.ndarray, velocity: np.ndarray):
+        n, count = self.frames_ready, onsets.shape[0]
+        self._reserve(n + count)
+        self._onsets[n:n + count] = onsets
+        self._velocity[n:n + count] = velocity
+        self._cum_onsets[n + 1:n + count + 1] = self._cum_onsets[n] + np.cumsum(onsets.sum(axis=1))
+        self._cum_velocity[n + 1:n + count + 1] = self._cum_velocity[n] + np.cumsum(velocity.sum(axis=1, dtype=np.int64))
+        self.frames_ready = n + count
+
+    # ---- 与MidiTimeline相同的查询接口 ----
+
+    def _frame(self, t: float, track_playhead: bool = True) -> Tuple[int, int]:
+        """时间t对应的分析帧（限制在已分析范围内）和已分析帧数"""
+        n = self.frames_ready
+        frame = int(t * self.frame_rate)
+        if track_playhead:
+            self.playhead = max(self.playhead, t)
+            if frame >= n and not self.finished:
+                self.late_queries += 1
+        return min(frame, n - 1), n
+
+    def __len__(self) -> int:
+        return int(self._cum_onsets[self.frames_ready])
+
+    @property
+    def duration(self) -> float:
+        if self.finished or self.estimated_duration == 0.0:
+            return self.analyzed_until
+        return self.estimated_duration
+
+    @property
+    def events_per_second(self) -> float:
+        return len(self) / self.analyzed_until if self.frames_ready else 0.0
+
+    def note_range(self) -> Tuple[int, int]:
+        n = self.frames_ready
+        notes = np.flatnonzero(self._onsets[:n].any(axis=0))
+        if notes.size == 0:
+            return self.note_min, self.note_max
+        return int(notes[0]), int(notes[-1])
+
+    def event_count(self, t: float) -> int:
+        """
+        时间t之前按下和松开的累计次数：按键在hold时间后自动松开，
+        所以松开也要使计数变化，调用方才会发布松开后的状态
+        """
+        frame, _ = self._frame(t)
+        if frame < 0:
+            return 0
+        cum = self._cum_onsets
+        return int(cum[frame + 1] + cum[max(frame + 1 - self.hold_frames, 0)])
+
+    def key_state(self, t: float) -> Tuple[np.ndarray, np.ndarray]:
+        """时间t按下的音符（hold时间内检测到的按键）和力度"""
+        frame, _ = self._frame(t)
+        if frame < 0:
+            return np.zeros(MIDI_NOTE_COUNT, dtype=bool), np.zeros(MIDI_NOTE_COUNT, dtype=np.uint8)
+        first = max(frame + 1 - self.hold_frames, 0)
+        velocity = self._velocity[first:frame + 1].max(axis=0)
+        return velocity > 0, velocity
+
+    def coalesce(self, t0: float, t1: float) -> Tuple[np.ndarray, np.ndarray]:
+        """(t0, t1]内每个音符的按键次数和最大力度"""
+        frame1, _ = self._frame(t1)
+        frame0, _ = self._frame(t0, track_playhead=False)
+        first = max(frame0 + 1, 0)
+        if frame1 < first:
+            return np.zeros(MIDI_NOTE_COUNT, dtype=np.int32), np.zeros(MIDI_NOTE_COUNT, dtype=np.uint8)
+        hits = self._onsets[first:frame1 + 1].sum(axis=0, dtype=np.int32)
+        return hits, self._velocity[first:frame1 + 1].max(axis=0)
+
+    def average_volume(self, t: float, window: int = 240) -> float:
+        """时间t之前最近window次按键的平均力度"""
+        frame, _ = self._frame(t, track_playhead=False)
+        if frame < 0:
+            return 0
+        cum_onsets, cum_velocity = self._cum_onsets, self._cum_velocity
+        total = cum_onsets[frame + 1]
+        if total == 0:
+            return 0
+        first = int(np.searchsorted(cum_onsets[:frame + 2], total - window, side="left")) if total > window else 0
+        count = total - cum_onsets[first]
+        return float(cum_velocity[frame + 1] - cum_velocity[first]) / count
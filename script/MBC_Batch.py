@@ -0,0 +1,261 @@
+"""
+曲库批量预览 - 为几百首MIDI生成缩略图、短片和统计
+
+每首歌在进程池的一个工作进程中无界面地完整模拟一遍（BubbleColumnSimulation +
+TimelinePlayer），输出到 <out_dir>/<文件名>_<哈希前8位>/：
+- stats.json：时长、帧数、峰值粒子数、合并次数、各阶段每帧耗时
+- clip.gif：clip_start_s开始的clip_seconds秒短片（歌曲太短时提前）
+- thumbnail.png：短片中粒子最多的一帧（更高分辨率）
+
+- 工作进程启动时预热一次njit函数和Agg画布，之后每首歌只重置状态
+- 以文件内容哈希（与MIDI缓存相同）和输出设置判断是否需要重新生成：
+  内容和设置都没变、输出文件都在的歌曲直接跳过
+- 每完成一首就更新 <out_dir>/batch_index.json，中断后再次运行从未完成的歌曲继续
+
+使用方法：
+    python MBC_Batch.py /path/to/midi
+    python MBC_Batch.py songs.txt --out previews --workers 8      # 每行一个路径的清单
+    python MBC_Batch.py /path/to/midi --force
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List
+
+import numpy as np
+
+from MBC_Cache import atomic_write, file_hash
+from MBC_config import get_config
+
+INDEX_NAME = "batch_index.json"
+BATCH_VERSION = 1
+
+
+def read_manifest(source: str) -> List[str]:
+    """目录（递归查找MIDI）、每行一个路径的文本清单，或JSON路径列表"""
+    if os.path.isdir(source):
+        from MBC_LibraryIndex import scan_midi_files
+        return sorted(scan_midi_files([source]))
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding="utf-8") as f:
+        text = f.read()
+    if source.lower().endswith(".json"):
+        paths = json.loads(text)
+    else:
+        paths = [line.strip() for line in text.splitlines() if line.strip() and not line.lstrip().startswith("#")]
+    return [os.path.abspath(os.path.join(base, path)) for path in paths]
+
+
+def settings_signature(orientation: str, pos_type: str) -> Dict:
+    """影响输出的设置；与索引中记录的不同时重新生成"""
+    batch = get_config().batch
+    return {
+        "version": BATCH_VERSION,
+        "orientation": orientation,
+        "pos_type": pos_type,
+        "fps": batch.fps,
+        "clip": [batch.clip_start_s, batch.clip_seconds, batch.clip_fps, list(batch.clip_size)],
+        "thumbnail": list(batch.thumbnail_size),
+    }
+
+
+def song_dir_name(path: str, key: str) -> str:
+    return f"{os.path.splitext(os.path.basename(path))[0]}_{key[:8]}"
+
+
+# ---- 工作进程 ----
+
+_worker = {}
+
+
+def _init_worker(orientation: str, pos_type: str):
+    """每个工作进程只创建和预热一次模拟与画布"""
+    from MBC_Export import FrameRasterizer
+    from MBC_Simulation import BubbleColumnSimulation
+    config = get_config()
+    batch = config.batch
+    background = config.theme.fig_themes_rgba[config.theme.default_theme_index]
+    simulation = BubbleColumnSimulation(orientation=orientation, pos_type=pos_type)
+    simulation.warm_up()
+    _worker.update(
+        simulation=simulation,
+        clip=FrameRasterizer(*batch.clip_size, background),
+        thumbnail=FrameRasterizer(*batch.thumbnail_size, background),
+    )
+
+
+def render_song(path: str, song_dir: str) -> Dict:
+    """
+    模拟一首歌并写出统计、短片和缩略图（在工作进程中运行）
+
+    Returns:
+        统计；失败时包含error
+    """
+    from PIL import Image
+    from MBC_Cache import get_midi_cache
+    from MBC_Simulation import TimelinePlayer
+    batch_config = get_config().batch
+    simulation = _worker["simulation"]
+    began = time.perf_counter()
+    try:
+        timeline = get_midi_cache().load(path).timeline
+        simulation.reset()
+        engine = simulation.physics_engine
+        merges_before = np.array(getattr(engine, "merge_counts", np.zeros(2)), copy=True)
+        fps = batch_config.fps
+        player = TimelinePlayer(simulation, timeline, fps=fps)
+
+        clip_start = max(0.0, min(batch_config.clip_start_s, timeline.duration - batch_config.clip_seconds))
+        clip_end = clip_start + batch_config.clip_seconds
+        clip_step = max(1, int(round(fps / batch_config.clip_fps)))
+        frames, best = [], (-1, None, None)
+        particle_counts = []
+        for t in player.frames():
+            batch = simulation.render_batch()
+            particle_counts.append(len(batch))
+            index = simulation.frame - 1
+            if clip_start <= t < clip_end and index % clip_step == 0:
+                rgba = _worker["clip"].render(batch, simulation.camera)
+                frames.append(Image.fromarray(rgba, "RGBA").convert("RGB").quantize(colors=256))
+                if len(batch) > best[0]:
+                    best = (len(batch), batch, simulation.camera.to_array())
+
+        os.makedirs(song_dir, exist_ok=True)
+        if frames:
+            frames[0].save(os.path.join(song_dir, "clip.gif"), save_all=True, append_images=frames[1:],
+                           duration=int(round(1000 * clip_step / fps)), loop=0, disposal=1)
+        if best[1] is not None:
+            from MBC_RenderInterface import CameraState
+            rgba = _worker["thumbnail"].render(best[1], CameraState.from_array(best[2]))
+            Image.fromarray(rgba, "RGBA").save(os.path.join(song_dir, "thumbnail.png"))
+
+        merges = np.array(getattr(engine, "merge_counts", np.zeros(2))) - merges_before
+        frame_count = max(simulation.frame, 1)
+        stats = {
+            "path": path,
+            "duration": timeline.duration,
+            "notes": int(np.count_nonzero(timeline.is_on)),
+            "frames": simulation.frame,
+            "fps": fps,
+            "particles_peak": int(max(particle_counts)) if particle_counts else 0,
+            "particles_mean": float(np.mean(particle_counts)) if particle_counts else 0.0,
+            "collision_merges": int(merges[0]),
+            "neighbour_merges": int(merges[1]),
+            "stage_ms_per_frame": {stage: seconds * 1000 / frame_count
+                                   for stage, seconds in simulation.timings.items()},
+            "clip": [clip_start, clip_end],
+            "wall_seconds": time.perf_counter() - began,
+        }
+        with open(os.path.join(song_dir, "stats.json"), "w", encoding="utf-8") as f:
+            json.dump(stats, f, indent=2)
+        return stats
+    except Exception as e:
+        return {"path": path, "error": str(e) or type(e).__name__, "wall_seconds": time.perf_counter() - began}
+
+
+# ---- 主进程 ----
+
+class BatchRenderer:
+    """批量生成预览；索引记录每首歌的内容哈希、设置和结果"""
+
+    def __init__(self, out_dir: str = None, workers: int = None, orientation: str = None, pos_type: str = None):
+        config = get_config()
+        self.out_dir = out_dir or config.batch.out_dir
+        self.workers = workers or config.batch.workers or os.cpu_count() or 1
+        self.orientation = orientation or config.visualization.default_orientation
+        self.pos_type = pos_type or config.visualization.default_pos_type
+        self.signature = settings_signature(self.orientation, self.pos_type)
+        self.index_path = os.path.join(self.out_dir, INDEX_NAME)
+        self.index: Dict[str, Dict] = {}
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, encoding="utf-8") as f:
+                    self.index = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable batch index {self.index_path}: {e}")
+
+    def is_current(self, path: str, key: str) -> bool:
+        entry = self.index.get(path)
+        if not entry or entry.get("key") != key or entry.get("settings") != self.signature or "error" in entry["stats"]:
+            return False
+        song_dir = os.path.join(self.out_dir, entry["dir"])
+        return all(os.path.exists(os.path.join(song_dir, name)) for name in ("stats.json", "thumbnail.png"))
+
+    def _save_index(self):
+        def write_index(target):
+            with open(target, "w", encoding="utf-8") as f:
+                json.dump(self.index, f, indent=1)
+        atomic_write(self.index_path, write_index)
+
+    def run(self, paths: List[str], force: bool = False, progress=print) -> Dict[str, int]:
+        """
+        为paths生成预览，跳过未变化的歌曲
+
+        Returns:
+            {"rendered": n, "skipped": n, "failed": n}
+        """
+        os.makedirs(self.out_dir, exist_ok=True)
+        pending = []
+        skipped = 0
+        for path in paths:
+            try:
+                key = file_hash(path)
+            except OSError as e:
+                progress(f"  skip {path}: {e}")
+                continue
+            if not force and self.is_current(path, key):
+                skipped += 1
+            else:
+                pending.append((path, key))
+        counts = {"rendered": 0, "skipped": skipped, "failed": 0}
+        if not pending:
+            return counts
+
+        progress(f"Rendering {len(pending)} songs ({skipped} unchanged) with {min(self.workers, len(pending))} workers")
+        began = time.perf_counter()
+        # 与其他子进程一样使用spawn
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(pending)),
+                                 mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(self.orientation, self.pos_type)) as executor:
+            futures = {}
+            for path, key in pending:
+                song_dir = song_dir_name(path, key)
+                futures[executor.submit(render_song, path, os.path.join(self.out_dir, song_dir))] = (path, key, song_dir)
+            for done, future in enumerate(as_completed(futures), 1):
+                path, key, song_dir = futures[future]
+                stats = future.result()
+                self.index[path] = {"key": key, "dir": song_dir, "settings": self.signature, "stats": stats}
+                self._save_index()
+                if "error" in stats:
+                    counts["failed"] += 1
+                    progress(f"  [{done}/{len(pending)}] {os.path.basename(path)}: failed: {stats['error']}")
+                else:
+                    counts["rendered"] += 1
+                    progress(f"  [{done}/{len(pending)}] {os.path.basename(path)}: {stats['frames']} frames, "
+                             f"peak {stats['particles_peak']} particles, {stats['wall_seconds']:.1f} s")
+        progress(f"Done in {time.perf_counter() - began:.1f} s")
+        return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render thumbnails, short clips and statistics for a MIDI catalogue.")
+    parser.add_argument("source", help="directory of MIDI files, or a manifest (.txt one path per line, or .json list)")
+    parser.add_argument("--out", default=None, help="output directory (default: batch.out_dir)")
+    parser.add_argument("--workers", type=int, default=None, help="song processes (default: CPU count)")
+    parser.add_argument("--orientation", choices=["up", "down"], default=None)
+    parser.add_argument("--pos-type", choices=["Fibonacci", "circle", "arc"], default=None)
+    parser.add_argument("--force", action="store_true", help="re-render songs even if unchanged")
+    args = parser.parse_args()
+
+    renderer = BatchRenderer(args.out, args.workers, args.orientation, args.pos_type)
+    counts = renderer.run(read_manifest(args.source), force=args.force)
+    print(f"{counts['rendered']} rendered, {counts['skipped']} unchanged, {counts['failed']} failed "
+          f"-> {renderer.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+MIDI解析结果的磁盘缓存 - 以文件内容哈希为键
+
+加载一首歌原来要用mido把文件完整解析、改写音色并保存到工作目录下的
+temp_midi_file.mid，之后还要再遍历消息求音域、播放。
+MidiCache把解析结果按文件内容的blake2b哈希保存到缓存目录：
+- <hash>.npz: 事件时间轴数组（见MidiTimeline.arrays）和音域
+- <hash>.mid: 把所有program_change改为钢琴后的MIDI，直接交给pygame播放
+- <hash>_env<fps>_v<版本>.npy: 人声音轨的响度包络（见MBC_VocalEnvelope）
+再次打开同一首歌（即使改了文件名或路径）时无需mido解析。
+
+写入使用临时文件 + os.replace，多个线程/进程同时填充缓存也是安全的。
+
+使用方法：
+    cache = MidiCache()
+    entry = cache.load(midi_path)
+    pygame.mixer.music.load(entry.piano_midi_path)
+    entry.timeline.key_state(t)
+"""
+
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+import numpy as np
+from mido import MidiFile
+
+from MBC_MidiTimeline import MidiTimeline
+
+CACHE_VERSION = 1
+
+
+@dataclass
+class CachedMidi:
+    """一首MIDI的缓存条目"""
+    key: str
+    timeline: MidiTimeline
+    note_range: Tuple[int, int]
+    piano_midi_path: str
+
+
+def file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    """文件内容的blake2b哈希（16字节，十六进制）"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def atomic_write(target: str, write):
+    """在同一目录下写临时文件后原子替换，避免读到写了一半的缓存"""
+    directory = os.path.dirname(target)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(fd)
+    try:
+        write(temp_path)
+        os.replace(temp_path, target)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class MidiCache:
+    """以内容哈希为键的MIDI解析缓存"""
+
+    def __init__(self, cache_dir: str = None):
+        """
+        Args:
+            cache_dir: 缓存目录，默认使用配置中的 file_paths.cache_dir
+        """
+        if cache_dir is None:
+            from MBC_config import get_config
+            cache_dir = get_config().file_paths.cache_dir
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # (路径, 大小, 修改时间) -> 哈希，同一次运行中重复打开时连哈希也不用重新计算
+        self._hash_memo: Dict[Tuple[str, int, int], str] = {}
+
+    def key_for(self, midi_path: str) -> str:
+        stat = os.stat(midi_path)
+        memo_key = (os.path.abspath(midi_path), stat.st_size, stat.st_mtime_ns)
+        key = self._hash_memo.get(memo_key)
+        if key is None:
+            key = file_hash(midi_path)
+            self._hash_memo[memo_key] = key
+        return key
+
+    def paths_for(self, key: str) -> Tuple[str, str]:
+        """缓存条目的 (时间轴.npz, 钢琴MIDI) 路径"""
+        return (os.path.join(self.cache_dir, key + ".npz"),
+                os.path.join(self.cache_dir, key + ".mid"))
+
+    def contains(self, midi_path: str) -> bool:
+        timeline_path, piano_path = self.paths_for(self.key_for(midi_path))
+        return os.path.exists(timeline_path) and os.path.exists(piano_path)
+
+    def load(self, midi_path: str) -> CachedMidi:
+        """
+        读取缓存条目，不存在或版本不符时解析文件并写入缓存
+        """
+        key = self.key_for(midi_path)
+        timeline_path, piano_path = self.paths_for(key)
+        if os.path.exists(timeline_path) and os.path.exists(piano_path):
+            try:
+                with np.load(timeline_path) as data:
+                    if int(data["version"]) == CACHE_VERSION:
+                        arrays = {name: data[name] for name in data.files if name not in ("version", "note_range")}
+                        note_range = tuple(int(n) for n in data["note_range"])
+                        return CachedMidi(key, MidiTimeline(**arrays), note_range, piano_path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Ignoring unreadable cache entry for {midi_path}: {e}")
+        return self._build(midi_path, key, timeline_path, piano_path)
+
+    def _build(self, midi_path: str, key: str, timeline_path: str, piano_path: str) -> CachedMidi:
+        midi = MidiFile(midi_path)
+        timeline = MidiTimeline.from_midi(midi)
+        note_range = timeline.note_range()
+
+        for track in midi.tracks:
+            for msg in track:
+                if msg.type == 'program_change':
+                    msg.program = 0  # Piano sound
+        atomic_write(piano_path, lambda path: midi.save(path))
+
+        def write_timeline(path):
+            with open(path, "wb") as f:
+                np.savez(f, version=CACHE_VERSION, note_range=np.array(note_range), **timeline.arrays())
+        atomic_write(timeline_path, write_timeline)
+
+        return CachedMidi(key, timeline, note_range, piano_path)
+
+    def clear(self):
+        """删除所有缓存条目"""
+        for name in os.listdir(self.cache_dir):
+            if name.endswith((".npz", ".mid", ".npy")):
+                os.remove(os.path.join(self.cache_dir, name))
+
+
+_midi_cache: MidiCache = None
+
+
+def get_midi_cache() -> MidiCache:
+    """进程内共享的缓存实例"""
+    global _midi_cache
+    if _midi_cache is None:
+        _midi_cache = MidiCache()
+    return _midi_cache
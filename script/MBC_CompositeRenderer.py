@@ -0,0 +1,260 @@
+"""
+组合渲染器 - 把同一批粒子分发给多个渲染后端
+
+PatternVisualizer3D只持有一个render_engine。CompositeRenderer本身实现
+RenderEngineInterface，每帧接收一次计算好的粒子批次（颜色已计算），
+再分发给多个后端（本地窗口、浏览器推流、帧录制等）：
+- 每个后端在自己的工作线程上渲染，只保留最新一帧，慢后端只会跳帧
+- 每个后端有独立的跳帧策略（最大帧率 / 每N帧渲染一帧）
+- 需要在主线程绘制的后端（主窗口中的Matplotlib）可以设置为同步执行
+- 需要逐粒子列表的后端共享同一次转换结果
+
+使用方法：
+    在配置中设置 visualization.render_engine = "composite"，
+    并在 visualization.composite_backends 中列出后端
+"""
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional
+
+from MBC_RenderInterface import (RenderEngineInterface, RenderableParticle, ParticleBatch,
+                                 CameraState, RenderSettings)
+
+
+@dataclass
+class BackendPolicy:
+    """单个后端的调度策略"""
+    max_fps: float = 0.0        # 最大渲染帧率，0表示不限制
+    frame_interval: int = 1     # 每N帧渲染一帧
+    threaded: bool = True       # False时在调用线程上同步渲染（如主窗口中的Matplotlib）
+
+
+class _SharedFrame:
+    """一帧的共享数据：批次只构建一次，粒子列表按需转换一次"""
+
+    def __init__(self, batch: Optional[ParticleBatch] = None,
+                 particles: Optional[List[RenderableParticle]] = None):
+        self.batch = batch
+        self._particles = particles
+        self._lock = threading.Lock()
+
+    def particles(self) -> List[RenderableParticle]:
+        with self._lock:
+            if self._particles is None:
+                self._particles = self.batch.to_particles()
+            return self._particles
+
+
+class _Backend:
+    """一个后端及其工作线程、最新帧槽和统计信息"""
+
+    def __init__(self, name: str, engine: RenderEngineInterface, policy: BackendPolicy):
+        self.name = name
+        self.engine = engine
+        self.policy = policy
+        # 只覆盖了render_frame的后端需要粒子列表
+        self.wants_batch = type(engine).render_batch is not RenderEngineInterface.render_batch
+
+        self.frame_counter = 0
+        self.last_render_time = 0.0
+        self.rendered = 0
+        self.skipped = 0        # 被跳帧策略跳过
+        self.dropped = 0        # 工作线程来不及处理而被新帧覆盖
+        self.failed = 0
+        self.render_seconds = 0.0
+
+        self._cond = threading.Condition()
+        self._pending = None
+        self._commands = deque()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self.policy.threaded:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name=f"render-{self.name}", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        if self._thread is not None:
+            with self._cond:
+                self._running = False
+                self._cond.notify()
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def accepts_frame(self) -> bool:
+        """根据跳帧策略决定是否渲染本帧"""
+        self.frame_counter += 1
+        if self.policy.frame_interval > 1 and self.frame_counter % self.policy.frame_interval:
+            return False
+        if self.policy.max_fps > 0:
+            now = time.perf_counter()
+            if now - self.last_render_time < 1.0 / self.policy.max_fps:
+                return False
+            self.last_render_time = now
+        return True
+
+    def submit_frame(self, frame: _SharedFrame, camera: CameraState):
+        if not self.accepts_frame():
+            self.skipped += 1
+            return
+        if self._thread is None:
+            self._render(frame, camera)
+            return
+        with self._cond:
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = (frame, camera)
+            self._cond.notify()
+
+    def submit_command(self, method: str, *args):
+        """设置更新等控制命令：线程后端按顺序在工作线程上执行，不会被丢弃"""
+        if self._thread is None:
+            getattr(self.engine, method)(*args)
+            return
+        with self._cond:
+            self._commands.append((method, args))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and self._pending is None and not self._commands:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                commands = list(self._commands)
+                self._commands.clear()
+                pending, self._pending = self._pending, None
+            for method, args in commands:
+                try:
+                    getattr(self.engine, method)(*args)
+                except Exception as e:
+                    print(f"渲染后端 {self.name} 执行 {method} 失败: {e}")
+            if pending is not None:
+                self._render(*pending)
+
+    def _render(self, frame: _SharedFrame, camera: CameraState):
+        start = time.perf_counter()
+        try:
+            if self.wants_batch and frame.batch is not None:
+                ok = self.engine.render_batch(frame.batch, camera)
+            else:
+                ok = self.engine.render_frame(frame.particles(), camera)
+        except Exception as e:
+            print(f"渲染后端 {self.name} 失败: {e}")
+            ok = False
+        self.render_seconds += time.perf_counter() - start
+        if ok:
+            self.rendered += 1
+        else:
+            self.failed += 1
+
+    def statistics(self) -> Dict[str, Any]:
+        return {
+            "threaded": self._thread is not None,
+            "rendered": self.rendered,
+            "skipped": self.skipped,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "avg_render_ms": self.render_seconds / max(self.rendered + self.failed, 1) * 1000,
+        }
+
+
+class CompositeRenderer(RenderEngineInterface):
+    """
+    组合渲染引擎
+
+    对调用方来说就是一个普通的渲染引擎；内部把每帧分发给所有后端，
+    任何一个后端变慢都不会阻塞其他后端或模拟循环。
+    """
+
+    def __init__(self):
+        self.backends: List[_Backend] = []
+        self.settings = None
+        self.is_initialized = False
+
+    def add_backend(self, engine: RenderEngineInterface, policy: Optional[BackendPolicy] = None,
+                    name: Optional[str] = None):
+        """
+        添加一个渲染后端（需在initialize之前调用）
+
+        Args:
+            engine: 后端渲染引擎
+            policy: 调度策略，默认在工作线程上渲染且不限帧率
+            name: 后端名称，用于统计信息
+        """
+        name = name or engine.get_engine_info().get("name", f"backend-{len(self.backends)}")
+        self.backends.append(_Backend(name, engine, policy or BackendPolicy()))
+
+    def initialize(self, settings: RenderSettings) -> bool:
+        """初始化所有后端并启动工作线程（初始化失败的后端会被移除）"""
+        self.settings = settings
+        working = []
+        for backend in self.backends:
+            if backend.engine.initialize(settings):
+                backend.start()
+                working.append(backend)
+            else:
+                print(f"渲染后端 {backend.name} 初始化失败，已忽略")
+        self.backends = working
+        self.is_initialized = bool(working)
+        return self.is_initialized
+
+    def set_matplotlib_objects(self, fig, ax):
+        """把主窗口的matplotlib对象交给需要它的后端"""
+        for backend in self.backends:
+            if hasattr(backend.engine, 'set_matplotlib_objects'):
+                backend.engine.set_matplotlib_objects(fig, ax)
+
+    def render_frame(self, particles: List[RenderableParticle],
+                     camera: CameraState) -> bool:
+        if not self.is_initialized:
+            return False
+        frame = _SharedFrame(particles=particles)
+        for backend in self.backends:
+            backend.submit_frame(frame, camera)
+        return True
+
+    def render_batch(self, batch: ParticleBatch, camera: CameraState) -> bool:
+        if not self.is_initialized:
+            return False
+        frame = _SharedFrame(batch=batch)
+        for backend in self.backends:
+            backend.submit_frame(frame, camera)
+        return True
+
+    def set_camera(self, camera: CameraState):
+        for backend in self.backends:
+            backend.submit_command("set_camera", camera)
+
+    def clear_scene(self):
+        for backend in self.backends:
+            backend.submit_command("clear_scene")
+
+    def update_settings(self, settings: RenderSettings):
+        self.settings = settings
+        for backend in self.backends:
+            backend.submit_command("update_settings", settings)
+
+    def cleanup(self):
+        for backend in self.backends:
+            backend.stop()
+            backend.engine.cleanup()
+        self.is_initialized = False
+
+    def get_engine_info(self) -> Dict[str, Any]:
+        return {
+            "name": "Composite Renderer",
+            "version": "1.0.0",
+            "backend": "composite",
+            "capabilities": ["multi_backend", "threaded_dispatch", "per_backend_frame_skip"],
+            "backends": {
+                backend.name: dict(backend.engine.get_engine_info(), **backend.statistics())
+                for backend in self.backends
+            }
+        }
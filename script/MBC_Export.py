@@ -0,0 +1,438 @@
+"""
+离线导出 - 把一首歌渲染成视频、PNG序列或GIF
+
+宣传片原来靠录屏得到，画质和帧率受限于实时循环能跑到多少帧。
+导出不经过窗口和音频时钟：
+- 主进程用BubbleColumnSimulation + TimelinePlayer按导出帧率的虚拟时钟模拟
+  （也可以直接读取MBC_FrameRecorder的录制，不再模拟）
+- 每帧的粒子和相机交给进程池，工作进程用Matplotlib Agg画布栅格化，
+  与窗口使用同一个MatplotlibRenderer，画面一致
+- 结果按帧序号顺序输出：视频为原始RGBA写入ffmpeg管道；PNG序列由工作进程直接编码保存；
+  GIF由工作进程量化调色板，主进程按顺序合成
+- 同时在途的帧数有上限（每个工作进程frames_in_flight帧），内存不随歌曲长度增长
+
+分辨率与窗口等比缩放：画布的英寸尺寸与default_figure_size的宽度相同，
+DPI随输出宽度变化，气泡大小相对画面不变。
+吞吐量随CPU核数增长，直到受限于主进程的单线程模拟。
+
+分段导出（--chunks N）去掉这个限制：模拟本身是顺序的，但气泡柱只记得
+大约 data_height / 最慢上升速度 帧的历史（BubbleColumnSimulation.memory_frames）。
+歌曲按时间切成N段，每段在单独的进程中从段首之前一个预热窗口开始模拟，
+预热期间只计算物理，之后的帧写入该段的临时录制；栅格化进程池按段的顺序读取拼接，
+前面的段模拟完即开始输出。段边界处气泡的统计状态一致，具体位置有随机抖动的差别。
+多台机器可以各自导出一段（--chunk-index i --chunk-count N）：帧序号是全局的，
+PNG序列直接放到同一目录，视频段用ffmpeg的concat拼接。
+
+使用方法：
+    python MBC_Export.py City_Of_Stars.mid preview.mp4 --audio City_Of_Stars_vocal.wav
+    python MBC_Export.py song.mid frames/ --size 1920x1080 --fps 30     # PNG序列
+    python MBC_Export.py song.mbcrec preview.gif --size 400x480 --fps 20
+    python MBC_Export.py song.mid song.mp4 --chunks 8              # 8段并行模拟
+    python MBC_Export.py song.mid part3.mp4 --chunk-index 3 --chunk-count 8
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from MBC_config import get_config
+from MBC_RenderInterface import CameraState, ParticleBatch, RenderSettings
+
+
+def export_kind(out_path: str) -> str:
+    """按输出路径判断格式："gif"、"png"（目录）或"video"（交给ffmpeg）"""
+    lower = out_path.lower()
+    if lower.endswith(".gif"):
+        return "gif"
+    if os.path.isdir(out_path) or lower.endswith((os.sep, "/")) or not os.path.splitext(lower)[1]:
+        return "png"
+    return "video"
+
+
+class FrameRasterizer:
+    """在离屏Agg画布上用MatplotlibRenderer绘制帧"""
+
+    def __init__(self, width: int, height: int, background: Tuple[float, float, float, float]):
+        import matplotlib
+        matplotlib.use("Agg")
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from MBC_RenderInterface import MatplotlibRenderer
+
+        figure_width = get_config().ui.default_figure_size[0]
+        dpi = width / figure_width
+        self.fig = Figure(figsize=(figure_width, height / dpi), dpi=dpi, facecolor=background)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot(projection="3d")
+        self.ax.set_facecolor(background)
+        # 与PatternVisualizer3D.on_resize相同的纵横比
+        self.ax.set_box_aspect([1, 1, 3 * height / width])
+        self.ax.set_position([0, 0, 1, 1])
+        settings = RenderSettings(background_color=background)
+        self.renderer = MatplotlibRenderer()
+        self.renderer.initialize(settings)
+        self.renderer.set_matplotlib_objects(self.fig, self.ax)
+
+    def render(self, batch: ParticleBatch, camera: CameraState) -> np.ndarray:
+        """绘制一帧，返回 (height, width, 4) 的uint8 RGBA"""
+        self.renderer.render_batch(batch, camera)
+        self.canvas.draw()
+        return np.asarray(self.canvas.buffer_rgba())
+
+
+# ---- 工作进程 ----
+
+_rasterizer: Optional[FrameRasterizer] = None
+_recordings: Dict[str, object] = {}
+
+
+def _init_worker(width: int, height: int, background):
+    global _rasterizer
+    _rasterizer = FrameRasterizer(width, height, background)
+
+
+def _recorded_frame(path: str, index: int) -> Tuple[ParticleBatch, CameraState]:
+    """读取录制中的一帧（每个录制在本进程中只映射一次）"""
+    recording = _recordings.get(path)
+    if recording is None:
+        from MBC_FrameRecorder import FrameRecording
+        recording = _recordings[path] = FrameRecording(path)
+    return recording.frame(index)
+
+
+def _rasterize(index: int, frame, kind: str, out_path: str, gif_colors: int):
+    """
+    栅格化一帧
+
+    Args:
+        frame: (录制路径, 帧序号)，或 (x, y, z, sizes, colors, 相机数组)
+    Returns:
+        video: RGBA字节；gif: 调色板图像；png: None（已由本进程写入文件）
+    """
+    if isinstance(frame[0], str):
+        batch, camera = _recorded_frame(*frame)
+    else:
+        x, y, z, sizes, colors, camera_values = frame
+        batch = ParticleBatch(x, y, z, sizes, colors, None, None, None)
+        camera = CameraState.from_array(camera_values)
+    rgba = _rasterizer.render(batch, camera)
+    if kind == "video":
+        return rgba.tobytes()
+    from PIL import Image
+    image = Image.fromarray(rgba, "RGBA")
+    if kind == "png":
+        image.save(os.path.join(out_path, f"frame_{index:06d}.png"))
+        return None
+    return image.convert("RGB").quantize(colors=gif_colors)
+
+
+# ---- 帧来源 ----
+
+def simulated_frames(midi_path: str, fps: float, duration: float = None, orientation: str = None,
+                     pos_type: str = None, drain_seconds: float = 10.0) -> Iterator[tuple]:
+    """模拟一首MIDI，逐帧产出栅格化所需的粒子列和相机"""
+    from MBC_Cache import get_midi_cache
+    from MBC_Simulation import BubbleColumnSimulation, TimelinePlayer
+    timeline = get_midi_cache().load(midi_path).timeline
+    simulation = BubbleColumnSimulation(orientation=orientation, pos_type=pos_type)
+    simulation.warm_up()
+    player = TimelinePlayer(simulation, timeline, fps=fps)
+    for _ in player.frames(duration, drain_seconds):
+        batch = simulation.render_batch()
+        yield (batch.x, batch.y, batch.z, batch.sizes, batch.colors, np.array(simulation.camera.to_array()))
+
+
+def recorded_frames(path: str, fps: float, duration: float = None) -> Iterator[Tuple[str, int]]:
+    """按导出帧率对录制重新取样，产出 (录制路径, 帧序号)"""
+    from MBC_FrameRecorder import FrameRecording
+    recording = FrameRecording(path)
+    end = recording.duration if duration is None else min(duration, recording.duration)
+    for frame in range(int(end * fps) + 1):
+        yield path, recording.index_at(frame / fps)
+
+
+def chunk_ranges(total_frames: int, chunk_count: int) -> List[Tuple[int, int]]:
+    """把 [0, total_frames) 切成chunk_count段 [start, end)"""
+    bounds = np.linspace(0, total_frames, chunk_count + 1).round().astype(int)
+    return [(int(bounds[i]), int(bounds[i + 1])) for i in range(chunk_count)]
+
+
+def simulate_chunk(midi_path: str, fps: float, start_frame: int, end_frame: Optional[int],
+                   warmup_frames: Optional[int], recording_path: str, orientation: str = None,
+                   pos_type: str = None, drain_seconds: float = 10.0) -> int:
+    """
+    模拟一段并写入录制（在工作进程中运行）
+
+    Args:
+        start_frame, end_frame: 输出的帧范围 [start, end)，end为None表示模拟到音乐结束并等待气泡消失
+        warmup_frames: 段首之前预热的帧数，None表示按memory_frames()
+    Returns:
+        写入的帧数
+    """
+    from MBC_Cache import get_midi_cache
+    from MBC_FrameRecorder import FrameRecorder
+    from MBC_Simulation import BubbleColumnSimulation, TimelinePlayer
+    timeline = get_midi_cache().load(midi_path).timeline
+    simulation = BubbleColumnSimulation(orientation=orientation, pos_type=pos_type)
+    simulation.warm_up()
+    if warmup_frames is None:
+        warmup_frames = simulation.memory_frames()
+    player = TimelinePlayer(simulation, timeline, fps=fps)
+    frame = max(0, start_frame - warmup_frames)
+    with FrameRecorder(recording_path, fps=fps) as recorder:
+        for t in player.frames(None, drain_seconds, start_frame=frame):
+            if end_frame is not None and frame >= end_frame:
+                break
+            if frame >= start_frame:
+                recorder.write(simulation.render_batch(), simulation.camera, t)
+            frame += 1
+        return recorder.frame_count
+
+
+def chunked_frames(midi_path: str, fps: float, chunk_count: int, chunk_indices: List[int],
+                   workers: int, duration: float = None, warmup_seconds: float = None,
+                   orientation: str = None, pos_type: str = None,
+                   drain_seconds: float = 10.0) -> Iterator[Tuple[str, int]]:
+    """
+    分段并行模拟，按顺序产出各段录制中的帧 (录制路径, 帧序号)
+
+    各段在进程池中同时模拟，产出第k段时后面的段仍在模拟；结束后删除临时录制。
+    """
+    from MBC_Cache import get_midi_cache
+    timeline = get_midi_cache().load(midi_path).timeline
+    end = timeline.duration if duration is None else min(duration, timeline.duration)
+    ranges = chunk_ranges(int(end * fps) + 1, chunk_count)
+    warmup_frames = None if warmup_seconds is None else int(round(warmup_seconds * fps))
+    temp_dir = tempfile.mkdtemp(prefix="mbc_export_")
+    executor = ProcessPoolExecutor(max_workers=max(1, min(workers, len(chunk_indices))),
+                                   mp_context=multiprocessing.get_context("spawn"))
+    try:
+        futures = []
+        for i in chunk_indices:
+            start_frame, end_frame = ranges[i]
+            # 最后一段模拟到气泡消失（指定时长时正好截止）
+            if i == chunk_count - 1 and duration is None:
+                end_frame = None
+            path = os.path.join(temp_dir, f"chunk_{i:04d}.mbcrec")
+            futures.append((path, executor.submit(
+                simulate_chunk, midi_path, fps, start_frame, end_frame, warmup_frames, path,
+                orientation, pos_type, drain_seconds)))
+        for path, future in futures:
+            for index in range(future.result()):
+                yield path, index
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+# ---- 输出 ----
+
+class _VideoSink:
+    """原始RGBA帧写入ffmpeg的标准输入"""
+
+    def __init__(self, out_path: str, width: int, height: int, fps: float, audio_path: str = None,
+                 audio_offset: float = 0.0):
+        export = get_config().export
+        command = [export.ffmpeg_path, "-y", "-loglevel", "error",
+                   "-f", "rawvideo", "-pix_fmt", "rgba", "-s", f"{width}x{height}", "-r", f"{fps:g}", "-i", "-"]
+        if audio_path:
+            command += ["-ss", f"{audio_offset:.3f}", "-i", audio_path, "-shortest"]
+        command += list(export.video_args) + [out_path]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, index: int, frame: bytes):
+        self.process.stdin.write(frame)
+
+    def close(self) -> bool:
+        self.process.stdin.close()
+        return self.process.wait() == 0
+
+
+class _GifSink:
+    """收集调色板帧，结束时一次写出GIF"""
+
+    def __init__(self, out_path: str, fps: float):
+        self.out_path = out_path
+        self.fps = fps
+        self.frames = []
+
+    def write(self, index: int, frame):
+        self.frames.append(frame)
+
+    def close(self) -> bool:
+        if self.frames:
+            self.frames[0].save(self.out_path, save_all=True, append_images=self.frames[1:],
+                                duration=int(round(1000 / self.fps)), loop=0, disposal=1)
+        return True
+
+
+class _PngSink:
+    """PNG已由工作进程写入，这里只计数"""
+
+    def write(self, index: int, frame):
+        pass
+
+    def close(self) -> bool:
+        return True
+
+
+def export(source: str, out_path: str, fps: float = None, width: int = None, height: int = None,
+           workers: int = None, duration: float = None, orientation: str = None, pos_type: str = None,
+           audio_path: str = None, drain_seconds: float = 10.0, report_interval: float = 5.0,
+           chunks: int = 1, chunk_index: int = None, warmup_seconds: float = None) -> Dict:
+    """
+    导出一首歌
+
+    Args:
+        source: MIDI文件，或MBC_FrameRecorder的录制目录（.mbcrec）
+        out_path: .gif、PNG序列目录，或ffmpeg支持的视频文件（.mp4、.webm等）
+        fps, width, height, workers: 默认取ExportConfig
+        duration: 只导出前duration秒（之后不再等待气泡消失）
+        orientation, pos_type: 覆盖配置中的方向和布局（仅MIDI来源）
+        audio_path: 合入视频的音轨
+        report_interval: 每隔多少秒（墙钟）打印一次进度，0表示不打印
+        chunks: 分段并行模拟的段数（仅MIDI来源）
+        chunk_index: 只导出第几段（多台机器分别导出），None表示全部
+        warmup_seconds: 每段提前开始模拟的秒数，None表示按气泡柱的记忆长度
+    Returns:
+        统计报告；失败时为None
+    """
+    config = get_config()
+    settings = config.export
+    fps = fps or settings.fps
+    width, height = width or settings.width, height or settings.height
+    workers = workers or settings.workers or os.cpu_count() or 1
+    kind = export_kind(out_path)
+    background = config.theme.fig_themes_rgba[config.theme.default_theme_index]
+
+    first_index = 0
+    if os.path.isdir(source):
+        frames = recorded_frames(source, fps, duration)
+    elif chunks > 1 or chunk_index is not None:
+        chunks = max(chunks, 1)
+        if chunk_index is not None:
+            if not 0 <= chunk_index < chunks:
+                print(f"Chunk index {chunk_index} out of range for {chunks} chunks")
+                return None
+            from MBC_Cache import get_midi_cache
+            timeline = get_midi_cache().load(source).timeline
+            end = timeline.duration if duration is None else min(duration, timeline.duration)
+            first_index = chunk_ranges(int(end * fps) + 1, chunks)[chunk_index][0]
+        frames = chunked_frames(source, fps, chunks, [chunk_index] if chunk_index is not None else list(range(chunks)),
+                                workers, duration, warmup_seconds, orientation, pos_type, drain_seconds)
+    else:
+        # 指定时长时正好导出这么长，不等待气泡消失
+        frames = simulated_frames(source, fps, duration, orientation, pos_type,
+                                  0.0 if duration is not None else drain_seconds)
+
+    if kind == "png":
+        os.makedirs(out_path, exist_ok=True)
+        sink = _PngSink()
+    elif kind == "gif":
+        sink = _GifSink(out_path, fps)
+    else:
+        try:
+            sink = _VideoSink(out_path, width, height, fps, audio_path, first_index / fps)
+        except OSError as e:
+            print(f"Failed to start ffmpeg ({settings.ffmpeg_path}): {e}")
+            return None
+
+    began = last_report = time.perf_counter()
+    written = 0
+    in_flight = deque()
+    limit = workers * max(1, settings.frames_in_flight)
+    # 与其他子进程一样使用spawn
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker,
+                             initargs=(width, height, background)) as executor:
+        try:
+            for index, frame in enumerate(frames, first_index):
+                in_flight.append(executor.submit(_rasterize, index, frame, kind, out_path, settings.gif_colors))
+                # 按提交顺序取回，保证输出按帧序号排列
+                while len(in_flight) >= limit or (in_flight and in_flight[0].done()):
+                    sink.write(written, in_flight.popleft().result())
+                    written += 1
+                if report_interval and time.perf_counter() - last_report >= report_interval:
+                    elapsed = time.perf_counter() - began
+                    print(f"  frame {written:6d}  {written / elapsed:6.1f} frames/s  "
+                          f"{written / fps / elapsed:5.2f}x real time")
+                    last_report = time.perf_counter()
+            while in_flight:
+                sink.write(written, in_flight.popleft().result())
+                written += 1
+        except BaseException:
+            for future in in_flight:
+                future.cancel()
+            sink.close()
+            raise
+        finally:
+            if hasattr(frames, "close"):
+                frames.close()
+    ok = sink.close()
+    wall_seconds = time.perf_counter() - began
+    if not ok:
+        print(f"Export to {out_path} failed")
+        return None
+    return {
+        "source": source,
+        "out_path": out_path,
+        "kind": kind,
+        "frames": written,
+        "fps": fps,
+        "size": (width, height),
+        "workers": workers,
+        "first_frame": first_index,
+        "wall_seconds": wall_seconds,
+        "frames_per_second": written / wall_seconds if wall_seconds else 0.0,
+        "realtime_factor": written / fps / wall_seconds if wall_seconds else 0.0,
+    }
+
+
+def _parse_size(text: str) -> Tuple[int, int]:
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a song to a video, PNG sequence or GIF without a display.")
+    parser.add_argument("source", help="MIDI file or .mbcrec recording")
+    parser.add_argument("out", help="output .mp4/.webm/... (via ffmpeg), .gif, or a directory for PNG frames")
+    parser.add_argument("--fps", type=float, default=None, help="output frame rate")
+    parser.add_argument("--size", type=_parse_size, default=None, help="output size as WIDTHxHEIGHT")
+    parser.add_argument("--workers", type=int, default=None, help="rasterizer processes (default: CPU count)")
+    parser.add_argument("--duration", type=float, default=None, help="only export the first N seconds")
+    parser.add_argument("--orientation", choices=["up", "down"], default=None)
+    parser.add_argument("--pos-type", choices=["Fibonacci", "circle", "arc"], default=None)
+    parser.add_argument("--audio", default=None, help="audio track to mux into the video")
+    parser.add_argument("--drain", type=float, default=10.0, help="max seconds to keep simulating after the music ends")
+    parser.add_argument("--report-interval", type=float, default=5.0, help="print progress every N wall-clock seconds")
+    parser.add_argument("--chunks", type=int, default=1, help="simulate N time chunks in parallel and stitch them")
+    parser.add_argument("--chunk-index", type=int, default=None, help="only export this chunk (with --chunk-count)")
+    parser.add_argument("--chunk-count", type=int, default=None, help="number of chunks the song is split into across machines")
+    parser.add_argument("--warmup", type=float, default=None, help="seconds each chunk starts simulating early (default: column memory)")
+    args = parser.parse_args()
+
+    width, height = args.size or (None, None)
+    report = export(args.source, args.out, fps=args.fps, width=width, height=height, workers=args.workers,
+                    duration=args.duration, orientation=args.orientation, pos_type=args.pos_type,
+                    audio_path=args.audio, drain_seconds=args.drain, report_interval=args.report_interval,
+                    chunks=args.chunk_count or args.chunks, chunk_index=args.chunk_index,
+                    warmup_seconds=args.warmup)
+    if report:
+        print(f"{report['out_path']}: {report['frames']} frames at {report['fps']:g} fps, "
+              f"{report['size'][0]}x{report['size'][1]}, {report['workers']} workers, "
+              f"{report['wall_seconds']:.1f} s ({report['frames_per_second']:.1f} frames/s, "
+              f"{report['realtime_factor']:.2f}x real time)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,427 @@
+"""
+粒子帧录制文件 - 只追加写入，内存映射随机访问
+
+录制一次模拟的每帧粒子列（calculate_pattern_data_3d的输出和颜色）和相机状态，
+之后演示、展台循环播放时不必重新模拟，两次运行的结果也可以逐帧比较。
+
+录制是一个目录（<名称>.mbcrec）：
+    meta.json        版本、列定义、录制帧率
+    x.bin ... colors.bin
+                     各粒子列，所有帧的粒子按顺序拼接（变长帧不补齐）
+    frames.bin       帧索引，每帧一条定长记录：该帧结束时各列的粒子数、时间、相机
+- 每帧先追加各列数据，最后追加帧记录；帧记录写完该帧才算存在，
+  中途崩溃留下的半帧在读取时被忽略，在追加打开时被截掉
+- 读取端用np.memmap映射各列，第i帧 = frames[i-1].end 到 frames[i].end 的切片，
+  定位任意帧都是O(1)，不需要读取之前的帧
+- 录制进行中也可以读取：refresh()映射新追加的帧
+
+使用方法：
+    with FrameRecorder("song.mbcrec", fps=60) as recorder:
+        recorder.write(batch, camera, t)
+
+    recording = FrameRecording("song.mbcrec")
+    batch, camera = recording.frame(1200)
+
+    python MBC_FrameRecorder.py info song.mbcrec
+    python MBC_FrameRecorder.py play song.mbcrec --engine threejs --loop
+    python MBC_FrameRecorder.py diff a.mbcrec b.mbcrec
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from MBC_RenderInterface import (RenderEngineInterface, RenderableParticle, ParticleBatch,
+                                 CameraState, RenderSettings)
+
+RECORDING_VERSION = 1
+RECORDING_SUFFIX = ".mbcrec"
+
+# 粒子列：(名称, dtype, 每粒子分量数)，名称与ParticleBatch的字段相同
+COLUMNS = (
+    ("x", "<f4", 1),
+    ("y", "<f4", 1),
+    ("z", "<f4", 1),
+    ("sizes", "<f4", 1),
+    ("opacity", "<f4", 1),
+    ("blend_factors", "<f4", 1),
+    ("types", "<i4", 1),
+    ("colors", "<f4", 4),
+)
+
+FRAME_DTYPE = np.dtype([
+    ("end", "<i8"),             # 该帧结束时的累计粒子数
+    ("time", "<f8"),            # 帧时间（秒，相对录制开始）
+    ("camera", "<f8", (8,)),    # CameraState.to_array()
+])
+
+
+def _column_path(path: str, name: str) -> str:
+    return os.path.join(path, name + ".bin")
+
+
+class FrameRecorder:
+    """把粒子帧追加到录制目录"""
+
+    def __init__(self, path: str, fps: float = 0.0, append: bool = False):
+        """
+        Args:
+            path: 录制目录
+            fps: 录制帧率（仅记录在meta.json中，0表示按帧时间回放）
+            append: 目录已存在时在末尾继续录制，否则覆盖
+        """
+        self.path = path
+        self.fps = fps
+        os.makedirs(path, exist_ok=True)
+        frames_path = os.path.join(path, "frames.bin")
+        if append and os.path.exists(frames_path):
+            self._repair()
+        else:
+            with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"version": RECORDING_VERSION, "fps": fps,
+                           "columns": [list(column) for column in COLUMNS]}, f, indent=2)
+            for name, _, _ in COLUMNS:
+                open(_column_path(path, name), "wb").close()
+            open(frames_path, "wb").close()
+
+        frames = np.fromfile(frames_path, dtype=FRAME_DTYPE)
+        self.frame_count = len(frames)
+        self.particle_count = int(frames["end"][-1]) if len(frames) else 0
+        self._files = {name: open(_column_path(path, name), "ab") for name, _, _ in COLUMNS}
+        self._frames_file = open(frames_path, "ab")
+        self._record = np.zeros(1, dtype=FRAME_DTYPE)
+
+    def _repair(self):
+        """截掉崩溃时写了一半的帧：帧记录取整，各列截到最后一帧的结尾"""
+        frames_path = os.path.join(self.path, "frames.bin")
+        whole = os.path.getsize(frames_path) // FRAME_DTYPE.itemsize
+        with open(frames_path, "r+b") as f:
+            f.truncate(whole * FRAME_DTYPE.itemsize)
+        frames = np.fromfile(frames_path, dtype=FRAME_DTYPE)
+        end = int(frames["end"][-1]) if len(frames) else 0
+        for name, dtype, width in COLUMNS:
+            with open(_column_path(self.path, name), "r+b") as f:
+                f.truncate(end * np.dtype(dtype).itemsize * width)
+
+    def write(self, batch: ParticleBatch, camera: CameraState, t: float = None):
+        """
+        追加一帧
+
+        Args:
+            batch: 粒子批次
+            camera: 该帧的相机
+            t: 帧时间（秒），默认按fps由帧序号计算
+        """
+        for name, dtype, width in COLUMNS:
+            values = np.ascontiguousarray(getattr(batch, name), dtype=dtype)
+            self._files[name].write(values.tobytes())
+        self.particle_count += len(batch)
+        record = self._record[0]
+        record["end"] = self.particle_count
+        record["time"] = t if t is not None else (self.frame_count / self.fps if self.fps else 0.0)
+        record["camera"] = camera.to_array()
+        # 先刷新列数据，帧记录落盘时该帧的数据一定已在文件中
+        for f in self._files.values():
+            f.flush()
+        self._frames_file.write(self._record.tobytes())
+        self._frames_file.flush()
+        self.frame_count += 1
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._frames_file.close()
+        self._files = {}
+
+    def __enter__(self) -> 'FrameRecorder':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FrameRecording:
+    """内存映射的录制（只读）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != RECORDING_VERSION:
+            raise ValueError(f"Unsupported recording version {meta.get('version')} in {path}")
+        self.fps = meta.get("fps", 0.0)
+        self.frames = np.zeros(0, dtype=FRAME_DTYPE)
+        self.columns: Dict[str, np.ndarray] = {}
+        self.refresh()
+
+    @staticmethod
+    def _map(path: str, dtype, shape) -> np.ndarray:
+        # 空文件不能映射
+        if shape[0] == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+    def refresh(self) -> int:
+        """映射录制中新追加的帧，返回帧数"""
+        frames_path = os.path.join(self.path, "frames.bin")
+        count = os.path.getsize(frames_path) // FRAME_DTYPE.itemsize
+        if count == len(self.frames) and self.columns:
+            return count
+        self.frames = self._map(frames_path, FRAME_DTYPE, (count,))
+        total = int(self.frames["end"][-1]) if count else 0
+        for name, dtype, width in COLUMNS:
+            shape = (total, width) if width > 1 else (total,)
+            self.columns[name] = self._map(_column_path(self.path, name), dtype, shape)
+        return count
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    @property
+    def duration(self) -> float:
+        return float(self.frames["time"][-1]) if len(self.frames) else 0.0
+
+    def frame_range(self, index: int) -> Tuple[int, int]:
+        """第index帧在各列中的[start, end)"""
+        if not 0 <= index < len(self.frames):
+            raise IndexError(f"frame {index} out of range (0..{len(self.frames) - 1})")
+        start = int(self.frames["end"][index - 1]) if index else 0
+        return start, int(self.frames["end"][index])
+
+    def batch(self, index: int) -> ParticleBatch:
+        """第index帧的粒子（各列为内存映射的切片，不复制）"""
+        start, end = self.frame_range(index)
+        return ParticleBatch(**{name: values[start:end] for name, values in self.columns.items()})
+
+    def camera(self, index: int) -> CameraState:
+        return CameraState.from_array(self.frames["camera"][index])
+
+    def frame(self, index: int) -> Tuple[ParticleBatch, CameraState]:
+        return self.batch(index), self.camera(index)
+
+    def index_at(self, t: float) -> int:
+        """时间t（秒）时显示的帧"""
+        return max(0, int(np.searchsorted(self.frames["time"], t, side="right")) - 1)
+
+
+class FrameRecorderRenderer(RenderEngineInterface):
+    """
+    把渲染的每帧写入录制的渲染引擎
+
+    可以单独使用，也可以作为CompositeRenderer的一个后端，与窗口同时录制。
+    """
+
+    def __init__(self, path: str, fps: float = 0.0, append: bool = False):
+        self.path = path
+        self.fps = fps
+        self.append = append
+        self.settings = None
+        self.is_initialized = False
+        self.recorder: Optional[FrameRecorder] = None
+        self.started = 0.0
+
+    def initialize(self, settings: RenderSettings) -> bool:
+        try:
+            self.recorder = FrameRecorder(self.path, self.fps, self.append)
+        except OSError as e:
+            print(f"Failed to open frame recording {self.path}: {e}")
+            return False
+        self.settings = settings
+        self.started = time.perf_counter()
+        self.is_initialized = True
+        print(f"Recording frames to {self.path}")
+        return True
+
+    def render_frame(self, particles: List[RenderableParticle], camera: CameraState) -> bool:
+        return self.render_batch(ParticleBatch.from_particles(particles), camera)
+
+    def render_batch(self, batch: ParticleBatch, camera: CameraState) -> bool:
+        if not self.is_initialized:
+            return False
+        t = None if self.fps else time.perf_counter() - self.started
+        try:
+            self.recorder.write(batch, camera, t)
+        except OSError as e:
+            print(f"Frame recording stopped: {e}")
+            self.cleanup()
+            return False
+        return True
+
+    def set_camera(self, camera: CameraState):
+        """相机状态随每帧一起记录"""
+        pass
+
+    def clear_scene(self):
+        pass
+
+    def update_settings(self, settings: RenderSettings):
+        self.settings = settings
+
+    def cleanup(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+        self.is_initialized = False
+
+
+class FramePlayer:
+    """把录制的帧按录制时间送给渲染引擎"""
+
+    def __init__(self, recording: FrameRecording, engine: RenderEngineInterface):
+        self.recording = recording
+        self.engine = engine
+        self.index = 0
+
+    def seek(self, index: int):
+        self.index = min(max(index, 0), max(len(self.recording) - 1, 0))
+
+    def render(self, index: int = None) -> bool:
+        """渲染一帧（默认为当前帧）"""
+        if index is not None:
+            self.seek(index)
+        batch, camera = self.recording.frame(self.index)
+        return self.engine.render_batch(batch, camera)
+
+    def play(self, fps: float = None, loop: bool = False, start: int = 0):
+        """
+        从start帧开始播放
+
+        Args:
+            fps: 回放帧率，None表示按录制的帧时间
+            loop: 播放到结尾后从头开始
+        """
+        recording = self.recording
+        times = recording.frames["time"]
+        self.seek(start)
+        while len(recording):
+            began = time.perf_counter() - (self.index / fps if fps else float(times[self.index]))
+            while self.index < len(recording):
+                due = began + (self.index / fps if fps else float(times[self.index]))
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                if not self.render():
+                    return
+                self.index += 1
+            if not loop:
+                return
+            self.index = 0
+
+
+def diff_recordings(a: FrameRecording, b: FrameRecording) -> Dict:
+    """
+    逐帧比较两个录制
+
+    Returns:
+        帧数、粒子数不同的第一帧、内容不同的第一帧、位置的最大差值
+    """
+    frames = min(len(a), len(b))
+    ends_a, ends_b = a.frames["end"][:frames], b.frames["end"][:frames]
+    counts_a = np.diff(ends_a, prepend=0)
+    counts_b = np.diff(ends_b, prepend=0)
+    count_mismatch = np.flatnonzero(counts_a != counts_b)
+    first_count_mismatch = int(count_mismatch[0]) if count_mismatch.size else None
+
+    # 粒子数一致的前缀中各列可以整段比较
+    same = frames if first_count_mismatch is None else first_count_mismatch
+    particles = int(ends_a[same - 1]) if same else 0
+    first_difference = first_count_mismatch
+    max_position_diff = 0.0
+    if particles:
+        differs = np.zeros(particles, dtype=bool)
+        for name, _, width in COLUMNS:
+            column_a, column_b = a.columns[name][:particles], b.columns[name][:particles]
+            unequal = column_a != column_b
+            differs |= unequal.any(axis=1) if width > 1 else unequal
+            if name in ("x", "y", "z"):
+                max_position_diff = max(max_position_diff,
+                                        float(np.max(np.abs(column_a - column_b))))
+        if differs.any():
+            first_particle = int(np.argmax(differs))
+            first_difference = int(np.searchsorted(ends_a[:same], first_particle, side="right"))
+        camera_diff = np.flatnonzero((a.frames["camera"][:same] != b.frames["camera"][:same]).any(axis=1))
+        if camera_diff.size and (first_difference is None or camera_diff[0] < first_difference):
+            first_difference = int(camera_diff[0])
+    if first_difference is None and len(a) != len(b):
+        first_difference = frames
+    return {
+        "frames": (len(a), len(b)),
+        "first_count_mismatch": first_count_mismatch,
+        "first_difference": first_difference,
+        "max_position_diff": max_position_diff,
+        "identical": first_difference is None,
+    }
+
+
+def create_player_engine(name: str) -> RenderEngineInterface:
+    """按名称创建显示用的渲染引擎（"threejs"或"matplotlib_process"）"""
+    from MBC_config import get_config
+    config = get_config()
+    if name == "matplotlib_process":
+        from MBC_ProcessRenderer import ProcessMatplotlibRenderer
+        # 回放只显示画面：不显示钢琴，也不把窗口交互发回（没有人读取管道）
+        return ProcessMatplotlibRenderer(
+            window_options=dict(
+                background_color=config.theme.fig_themes_rgba[config.theme.default_theme_index],
+                window_opacity=config.visualization.window_opacity,
+                visualize_piano=False,
+                elev=config.visualization.default_elev,
+                azim=config.visualization.default_azim_angle,
+                azim_speed=config.visualization.default_azim_speed
+            ),
+            max_particles=config.streaming.frame_ring_max_particles,
+            forward_events=False
+        )
+    from MBC_ThreeJSRenderer import ThreeJSRenderer
+    return ThreeJSRenderer(websocket_port=config.streaming.websocket_port,
+                           host=config.streaming.websocket_host)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect, replay and compare recorded particle frames.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    info = commands.add_parser("info", help="print frame count, duration and particle statistics")
+    info.add_argument("recording")
+    play = commands.add_parser("play", help="replay a recording through a render engine")
+    play.add_argument("recording")
+    play.add_argument("--engine", choices=["threejs", "matplotlib_process"], default="threejs")
+    play.add_argument("--fps", type=float, default=None, help="playback rate (default: recorded frame times)")
+    play.add_argument("--start", type=int, default=0, help="first frame")
+    play.add_argument("--loop", action="store_true")
+    diff = commands.add_parser("diff", help="find the first frame where two recordings differ")
+    diff.add_argument("a")
+    diff.add_argument("b")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        recording = FrameRecording(args.recording)
+        counts = np.diff(recording.frames["end"], prepend=0)
+        print(f"{args.recording}: {len(recording)} frames, {recording.duration:.2f} s"
+              + (f", recorded at {recording.fps:g} fps" if recording.fps else ""))
+        if len(recording):
+            print(f"  particles per frame: mean {counts.mean():.0f}, max {counts.max()}, "
+                  f"total {int(recording.frames['end'][-1])}")
+    elif args.command == "play":
+        recording = FrameRecording(args.recording)
+        engine = create_player_engine(args.engine)
+        from MBC_config import get_config
+        theme = get_config().theme
+        if not engine.initialize(RenderSettings(background_color=theme.fig_themes_rgba[theme.default_theme_index])):
+            return
+        try:
+            FramePlayer(recording, engine).play(args.fps, args.loop, args.start)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            engine.cleanup()
+    else:
+        result = diff_recordings(FrameRecording(args.a), FrameRecording(args.b))
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
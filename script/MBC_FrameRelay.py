@@ -0,0 +1,341 @@
+"""
+多进程转发（Relay）模式 - 让观看端数量不再影响模拟帧时间
+
+ThreeJSRenderer的事件循环线程与物理计算、MIDI处理共享GIL，
+每增加一个观看端都会挤占模拟时间。Relay模式下：
+- 可视化进程只把每帧编码一次，通过本地socket发布给转发进程
+- 一个或多个独立的转发进程持有WebSocket连接，把帧分发给大量观看端
+- 每个观看端只保留最新一帧，慢速观看端跳帧而不会拖慢其他端
+
+使用方法：
+1. 在配置中设置 streaming.relay_enabled = True（转发进程会自动启动）
+2. 或手动启动转发进程：
+   python MBC_FrameRelay.py --publisher localhost:8770 --port 8765
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import threading
+import time
+from collections import deque
+from multiprocessing.connection import Listener, Client
+from typing import Dict, Any, Optional, Tuple
+
+import websockets
+
+from MBC_RenderInterface import RenderSettings
+from MBC_ThreeJSRenderer import ThreeJSRenderer
+
+
+# 发布通道上的消息类型前缀
+FRAME_MESSAGE = b"F"      # 渲染帧，可丢弃（只保留最新）
+SETTINGS_MESSAGE = b"S"   # 设置，转发进程缓存后发给新连接的观看端
+CONTROL_MESSAGE = b"C"    # 其他控制消息（相机、清屏），不可丢弃
+
+# 观看端连接的发送缓冲上限（字节）：缓冲超过上限时不发送新帧
+VIEWER_WRITE_LIMIT = 64 * 1024
+
+
+class FrameRelayPublisher(ThreeJSRenderer):
+    """
+    Relay模式的发布端渲染器
+
+    复用ThreeJSRenderer的消息格式，但不直接持有WebSocket连接：
+    每帧在调用线程上编码一次，由后台发送线程写给所有已连接的转发进程。
+    转发进程跟不上时只发送最新一帧。
+    """
+
+    def __init__(self, publish_port: int = 8770, host: str = "localhost",
+                 authkey: str = "mbc-relay", relay_count: int = 1,
+                 relay_base_port: int = 8765, relay_host: str = "localhost"):
+        """
+        初始化发布端
+
+        Args:
+            publish_port: 转发进程连接的本地端口
+            host: 发布端监听地址
+            authkey: 连接认证密钥
+            relay_count: 自动启动的转发进程数量（0表示手动启动）
+            relay_base_port: 第i个转发进程的WebSocket端口为 relay_base_port + i
+            relay_host: 转发进程的WebSocket监听地址
+        """
+        super().__init__(websocket_port=relay_base_port, host=relay_host)
+        self.publish_port = publish_port
+        self.publish_host = host
+        self.authkey = authkey.encode()
+        self.relay_count = relay_count
+
+        self.listener = None
+        self.relay_connections = []
+        self.relay_processes = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._latest_frame: Optional[bytes] = None
+        self._control_messages = deque()
+        self._running = False
+        self.dropped_frames = 0
+
+    def initialize(self, settings: RenderSettings) -> bool:
+        """启动发布socket、发送线程和转发进程"""
+        try:
+            self.settings = settings
+            self.listener = Listener((self.publish_host, self.publish_port), authkey=self.authkey)
+            self._running = True
+            threading.Thread(target=self._accept_relays, daemon=True).start()
+            threading.Thread(target=self._send_loop, daemon=True).start()
+
+            ctx = multiprocessing.get_context("spawn")
+            for i in range(self.relay_count):
+                process = ctx.Process(
+                    target=run_relay,
+                    args=((self.publish_host, self.publish_port), self.authkey.decode(),
+                          self.host, self.port + i),
+                    daemon=True
+                )
+                process.start()
+                self.relay_processes.append(process)
+
+            self.is_initialized = True
+            self.logger.info(f"Relay发布端运行在 {self.publish_host}:{self.publish_port}，"
+                             f"{self.relay_count} 个转发进程从 ws://{self.host}:{self.port} 开始")
+            return True
+
+        except Exception as e:
+            self.logger.error(f"Relay发布端初始化失败: {e}")
+            return False
+
+    def _accept_relays(self):
+        """接受转发进程的连接"""
+        while self._running:
+            try:
+                connection = self.listener.accept()
+            except (OSError, EOFError):
+                break
+            except Exception as e:
+                self.logger.warning(f"转发进程连接失败: {e}")
+                continue
+            if self.settings:
+                connection.send_bytes(SETTINGS_MESSAGE + json.dumps(self._build_settings_data("settings")).encode())
+            with self._lock:
+                self.relay_connections.append(connection)
+            self.logger.info(f"转发进程已连接，当前 {len(self.relay_connections)} 个")
+
+    def _has_clients(self) -> bool:
+        return bool(self.relay_connections)
+
+    def _publish(self, data: Dict):
+        """在调用线程上编码一次，交给发送线程"""
+        payload = json.dumps(data).encode()
+        msg_type = data.get("type")
+        with self._wakeup:
+            if msg_type == "render_frame":
+                if self._latest_frame is not None:
+                    self.dropped_frames += 1
+                self._latest_frame = FRAME_MESSAGE + payload
+            elif msg_type in ("settings", "settings_update"):
+                self._control_messages.append(SETTINGS_MESSAGE + payload)
+            else:
+                self._control_messages.append(CONTROL_MESSAGE + payload)
+            self._wakeup.notify()
+
+    def _send_loop(self):
+        """后台发送线程：控制消息全部发送，帧只发送最新一帧"""
+        while self._running:
+            with self._wakeup:
+                while self._running and self._latest_frame is None and not self._control_messages:
+                    self._wakeup.wait()
+                messages = list(self._control_messages)
+                self._control_messages.clear()
+                if self._latest_frame is not None:
+                    messages.append(self._latest_frame)
+                    self._latest_frame = None
+                connections = list(self.relay_connections)
+
+            for connection in connections:
+                try:
+                    for message in messages:
+                        connection.send_bytes(message)
+                except (OSError, EOFError, ValueError):
+                    with self._lock:
+                        if connection in self.relay_connections:
+                            self.relay_connections.remove(connection)
+                    self.logger.info("转发进程断开连接")
+
+    def cleanup(self):
+        """停止发送线程、关闭连接并结束转发进程"""
+        with self._wakeup:
+            self._running = False
+            self._wakeup.notify_all()
+        if self.listener:
+            self.listener.close()
+        with self._lock:
+            for connection in self.relay_connections:
+                connection.close()
+            self.relay_connections.clear()
+        for process in self.relay_processes:
+            process.join(timeout=1.0)
+            if process.is_alive():
+                process.terminate()
+        self.relay_processes.clear()
+        self.is_initialized = False
+        self.logger.info("Relay发布端清理完成")
+
+    def get_engine_info(self) -> Dict[str, Any]:
+        info = super().get_engine_info()
+        info.update({
+            "name": "Three.js Relay Publisher",
+            "publish_address": f"{self.publish_host}:{self.publish_port}",
+            "websocket_urls": [f"ws://{self.host}:{self.port + i}" for i in range(self.relay_count)],
+            "connected_relays": len(self.relay_connections),
+            "dropped_frames": self.dropped_frames,
+        })
+        info["capabilities"] = info["capabilities"] + ["multi_process_fanout"]
+        return info
+
+
+class _RelayViewer:
+    """转发进程中的单个观看端：最新帧槽 + 待发送控制消息"""
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.latest_frame: Optional[str] = None
+        self.controls = deque()
+        self.wakeup = asyncio.Event()
+        self.skipped_frames = 0
+
+
+class FrameRelayServer:
+    """
+    转发进程：从发布端读取编码好的消息，分发给所有WebSocket观看端
+
+    每个观看端有独立的发送任务，慢速观看端只会跳帧。
+    """
+
+    def __init__(self, publisher_address: Tuple[str, int], authkey: str,
+                 host: str = "localhost", port: int = 8765):
+        self.publisher_address = publisher_address
+        self.authkey = authkey.encode()
+        self.host = host
+        self.port = port
+        self.viewers = set()
+        self.last_settings: Optional[str] = None
+        self.loop = None
+        self._closed = None
+
+    def run(self):
+        """阻塞运行直到发布端断开"""
+        asyncio.run(self._main())
+
+    async def _main(self):
+        self.loop = asyncio.get_running_loop()
+        self._closed = asyncio.Event()
+        server = await websockets.serve(self._handle_viewer, self.host, self.port, write_limit=VIEWER_WRITE_LIMIT)
+        threading.Thread(target=self._read_publisher, daemon=True).start()
+        await self._closed.wait()
+        server.close()
+        await server.wait_closed()
+
+    def _read_publisher(self):
+        """阻塞读取发布端消息（独立线程），交给事件循环分发"""
+        connection = None
+        for _ in range(100):
+            try:
+                connection = Client(self.publisher_address, authkey=self.authkey)
+                break
+            except (ConnectionRefusedError, OSError):
+                time.sleep(0.1)
+        if connection is None:
+            print(f"Relay: could not connect to publisher at {self.publisher_address}")
+            self.loop.call_soon_threadsafe(self._closed.set)
+            return
+
+        try:
+            while True:
+                payload = connection.recv_bytes()
+                self.loop.call_soon_threadsafe(self._dispatch, payload[:1], payload[1:].decode())
+        except (EOFError, OSError):
+            pass
+        finally:
+            connection.close()
+            self.loop.call_soon_threadsafe(self._closed.set)
+
+    def _dispatch(self, kind: bytes, message: str):
+        if kind == SETTINGS_MESSAGE:
+            self.last_settings = message
+        for viewer in self.viewers:
+            if kind == FRAME_MESSAGE:
+                if viewer.latest_frame is not None:
+                    viewer.skipped_frames += 1
+                viewer.latest_frame = message
+            else:
+                viewer.controls.append(message)
+            viewer.wakeup.set()
+
+    async def _handle_viewer(self, websocket, path=None):
+        viewer = _RelayViewer(websocket)
+        if self.last_settings:
+            viewer.controls.append(self.last_settings)
+            viewer.wakeup.set()
+        self.viewers.add(viewer)
+        sender = asyncio.ensure_future(self._send_to_viewer(viewer))
+        try:
+            # 观看端消息（相机控制等）目前不需要处理，只需读取以保持连接
+            async for _ in websocket:
+                pass
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            self.viewers.discard(viewer)
+            sender.cancel()
+
+    async def _send_to_viewer(self, viewer: _RelayViewer):
+        """
+        send()在数据进入发送缓冲后就返回，慢速观看端的帧会积压在两端的socket缓冲里。
+        每帧之后发送一个ping，观看端读到这一帧之后才会回复pong：
+        上一帧的pong返回、发送缓冲低于上限之前不发送新帧，期间到达的帧继续覆盖最新帧槽
+        """
+        delivered = None
+        try:
+            while True:
+                await viewer.wakeup.wait()
+                viewer.wakeup.clear()
+                while viewer.controls:
+                    await viewer.websocket.send(viewer.controls.popleft())
+                if viewer.latest_frame is None:
+                    continue
+                if delivered is not None:
+                    await delivered
+                while viewer.websocket.transport.get_write_buffer_size() > VIEWER_WRITE_LIMIT:
+                    await asyncio.sleep(0.005)
+                frame, viewer.latest_frame = viewer.latest_frame, None
+                await viewer.websocket.send(frame)
+                delivered = await viewer.websocket.ping()
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+
+def run_relay(publisher_address: Tuple[str, int], authkey: str, host: str, port: int):
+    """转发进程入口（也被发布端用作子进程目标）"""
+    FrameRelayServer(tuple(publisher_address), authkey, host, port).run()
+
+
+def main():
+    from MBC_config import get_config
+    streaming = get_config().streaming
+
+    parser = argparse.ArgumentParser(description="Fan out published Three.js frames to WebSocket viewers.")
+    parser.add_argument("--publisher", default=f"localhost:{streaming.relay_publish_port}",
+                        help="host:port of the visualizer's relay publisher")
+    parser.add_argument("--host", default=streaming.websocket_host, help="WebSocket listen host")
+    parser.add_argument("--port", type=int, default=streaming.websocket_port, help="WebSocket listen port")
+    parser.add_argument("--authkey", default=streaming.relay_authkey)
+    args = parser.parse_args()
+
+    publisher_host, publisher_port = args.publisher.rsplit(":", 1)
+    run_relay((publisher_host, int(publisher_port)), args.authkey, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
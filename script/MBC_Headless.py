@@ -0,0 +1,140 @@
+"""
+无界面离线模拟命令行 - 在服务器上预渲染、测试和基准测试
+
+用BubbleColumnSimulation + TimelinePlayer按固定帧率的虚拟时钟模拟一首MIDI，
+不打开窗口也不播放音频，以CPU允许的最快速度运行，输出：
+- 统计报告：帧数、实时倍数、各阶段每帧耗时、粒子数
+- 可选的粒子帧录制（.mbcrec目录，见MBC_FrameRecorder，可回放、比较或作为MBC_LoadTest的--source）
+
+使用方法：
+    python MBC_Headless.py City_Of_Stars.mid
+    python MBC_Headless.py song.mid --fps 30 --duration 60 --json report.json
+    python MBC_Headless.py song.mid --out song.mbcrec
+    python MBC_Headless.py song.mid --no-render     # 只计算物理
+"""
+
+import argparse
+import json
+import time
+from typing import Callable, Dict
+
+import numpy as np
+
+from MBC_Cache import get_midi_cache
+from MBC_FrameRecorder import FrameRecorder
+from MBC_Simulation import BubbleColumnSimulation, TimelinePlayer
+
+def run_headless(midi_path: str, fps: float = 60.0, duration: float = None,
+                 orientation: str = None, pos_type: str = None, render: bool = True,
+                 out_path: str = None, drain_seconds: float = 10.0,
+                 report_interval: float = 0.0, simulation: BubbleColumnSimulation = None,
+                 progress: Callable[[int, float], None] = None) -> Dict:
+    """
+    模拟一首MIDI并返回统计报告
+
+    Args:
+        midi_path: MIDI文件路径
+        fps: 虚拟时钟帧率
+        duration: 只模拟前duration秒
+        orientation, pos_type: 覆盖配置中的方向和布局
+        render: 是否每帧计算粒子数据（False时只计算物理）
+        out_path: 粒子帧录制目录
+        drain_seconds: 音乐结束后等待气泡消失的最长时间
+        report_interval: 每隔多少秒（墙钟）打印一次进度，0表示不打印
+        simulation: 复用已预热的模拟（重置后使用，忽略orientation和pos_type）
+        progress: 代替打印的进度回调 progress(帧序号, 虚拟时间)
+    """
+    timeline = get_midi_cache().load(midi_path).timeline
+    began = time.perf_counter()
+    if simulation is None:
+        simulation = BubbleColumnSimulation(orientation=orientation, pos_type=pos_type)
+        simulation.warm_up()
+    else:
+        simulation.reset()
+    warm_up_seconds = time.perf_counter() - began
+
+    player = TimelinePlayer(simulation, timeline, fps=fps)
+    recorder = FrameRecorder(out_path, fps=fps) if out_path else None
+    particle_counts = []
+    virtual_time = 0.0
+    began = last_report = time.perf_counter()
+    for virtual_time in player.frames(duration, drain_seconds):
+        if render or recorder is not None:
+            batch = simulation.render_batch()
+            particle_counts.append(len(batch))
+            if recorder is not None:
+                recorder.write(batch, simulation.camera, virtual_time)
+        if report_interval and time.perf_counter() - last_report >= report_interval:
+            elapsed = time.perf_counter() - began
+            if progress is not None:
+                progress(simulation.frame, virtual_time)
+            else:
+                print(f"  t={virtual_time:7.1f}s  frame {simulation.frame:6d}  "
+                      f"{simulation.frame / elapsed:7.1f} fps  {virtual_time / elapsed:5.1f}x real time")
+            last_report = time.perf_counter()
+    wall_seconds = time.perf_counter() - began
+
+    if recorder is not None:
+        recorder.close()
+
+    frames = simulation.frame
+    per_frame_ms = {stage: seconds * 1000 / max(frames, 1) for stage, seconds in simulation.timings.items()}
+    return {
+        "midi_path": midi_path,
+        "fps": fps,
+        "frames": frames,
+        "virtual_seconds": virtual_time,
+        "wall_seconds": wall_seconds,
+        "warm_up_seconds": warm_up_seconds,
+        "simulated_fps": frames / wall_seconds if wall_seconds else 0.0,
+        "realtime_factor": virtual_time / wall_seconds if wall_seconds else 0.0,
+        "coalesce": player.coalesce,
+        "stage_ms_per_frame": per_frame_ms,
+        "particles_mean": float(np.mean(particle_counts)) if particle_counts else 0.0,
+        "particles_max": int(np.max(particle_counts)) if particle_counts else 0,
+        "final_state": simulation.get_statistics(),
+        "out_path": out_path,
+    }
+
+
+def print_report(report: Dict):
+    print(f"{report['midi_path']}: {report['frames']} frames at {report['fps']:g} fps "
+          f"({report['virtual_seconds']:.1f} s of music) in {report['wall_seconds']:.2f} s "
+          f"(+{report['warm_up_seconds']:.2f} s JIT warm-up)")
+    print(f"  {report['simulated_fps']:.1f} frames/s, {report['realtime_factor']:.1f}x real time"
+          + (", coalescing dense MIDI" if report["coalesce"] else ""))
+    for stage, ms in report["stage_ms_per_frame"].items():
+        print(f"  {stage:<18}{ms:8.3f} ms/frame")
+    if report["particles_max"]:
+        print(f"  particles: mean {report['particles_mean']:.0f}, max {report['particles_max']}")
+    if report["out_path"]:
+        print(f"  particle frames written to {report['out_path']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate the bubble column from a MIDI file without a display or audio.")
+    parser.add_argument("midi", help="MIDI file to simulate")
+    parser.add_argument("--fps", type=float, default=60.0, help="virtual clock frame rate")
+    parser.add_argument("--duration", type=float, default=None, help="only simulate the first N seconds")
+    parser.add_argument("--orientation", choices=["up", "down"], default=None)
+    parser.add_argument("--pos-type", choices=["Fibonacci", "circle", "arc"], default=None)
+    parser.add_argument("--no-render", action="store_true", help="skip per-frame particle data (physics only)")
+    parser.add_argument("--out", default=None, help="record particle frames to this .mbcrec directory")
+    parser.add_argument("--drain", type=float, default=10.0, help="max seconds to keep simulating after the music ends")
+    parser.add_argument("--report-interval", type=float, default=0.0, help="print progress every N wall-clock seconds")
+    parser.add_argument("--json", default=None, help="write the report to this JSON file")
+    args = parser.parse_args()
+
+    report = run_headless(
+        args.midi, fps=args.fps, duration=args.duration, orientation=args.orientation,
+        pos_type=args.pos_type, render=not args.no_render, out_path=args.out,
+        drain_seconds=args.drain, report_interval=args.report_interval,
+    )
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
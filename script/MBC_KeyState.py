@@ -0,0 +1,309 @@
+"""
+按键状态缓冲区 - 生产者（MIDI文件时钟/实时输入线程）与渲染循环之间的无锁交接
+
+生产者每次发布完整的一帧按键状态（模式键位、音量、真实钢琴键位、平均音量），
+渲染循环每帧读取一份一致的快照，不需要packbits/unpackbits，也不复制数组。
+
+实现是seqlock风格的多缓冲：
+- 每个槽有自己的序号，写入时为奇数，写完后为偶数
+- 生产者总是写入既不是最新帧、也没有被读取端占用的槽（因此需要3个槽），
+  写完后再把该槽发布为最新帧
+- 读取端占用最新槽后校验序号为偶数，之后该槽在下一次read()之前不会被改写
+
+只依赖GIL保证单个属性赋值的原子性，读写两端都不加锁。
+
+使用方法：
+    buffer = KeyStateBuffer()
+    # 生产者线程
+    buffer.publish_notes(active, velocity, average_volume)
+    # 渲染循环
+    state = buffer.read()
+    visualizer.update_pattern(state.pattern, state.volumes, state.average_volume,
+                              state.real_keys, state.real_volumes)
+
+KeyStateDriver在缓冲区两端加上MIDI时间轴的规则（窗口播放MidiVisualizer和
+无界面的TimelinePlayer共用）：
+    driver = KeyStateDriver()
+    driver.begin_timeline(timeline)
+    driver.publish(t)               # 按时钟发布按键状态
+    frame = driver.next_frame()     # 本帧送给气泡柱的模式
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import numpy as np
+
+from MBC_config import get_config
+from MBC_MidiTimeline import MIDI_NOTE_COUNT
+
+
+@dataclass
+class KeyState:
+    """一个槽中的按键状态（数组属于缓冲区，读取端不应修改）"""
+    frame: int                  # 发布序号，变化说明有新的按键事件
+    pattern: np.ndarray         # uint8[pattern_key_count]，模式键位是否按下
+    volumes: np.ndarray         # int64[pattern_key_count]，模式键位音量
+    hits: np.ndarray            # int32[pattern_key_count]，上一帧以来模式键位被按下的次数
+    real_keys: np.ndarray       # uint8[128]，按MIDI音符号索引的钢琴键是否按下
+    real_volumes: np.ndarray    # uint8[128]，钢琴键音量
+    meta: np.ndarray            # float64[2]：平均音量、事件时间戳（time.perf_counter）
+
+    @property
+    def average_volume(self) -> float:
+        return float(self.meta[0])
+
+    @property
+    def timestamp(self) -> float:
+        return float(self.meta[1])
+
+
+class KeyStateBuffer:
+    """单生产者、单消费者的按键状态缓冲区"""
+
+    SLOT_COUNT = 3
+
+    def __init__(self, pattern_key_count: int = 120, note_min: int = 21, note_max: int = 108):
+        """
+        Args:
+            pattern_key_count: 模式键位数量
+            note_min, note_max: 钢琴音域，范围外的音符合并到模式的两端键位，钢琴上不显示
+        """
+        self.slots = [
+            KeyState(
+                frame=-1,
+                pattern=np.zeros(pattern_key_count, dtype=np.uint8),
+                volumes=np.zeros(pattern_key_count, dtype=np.int64),
+                hits=np.zeros(pattern_key_count, dtype=np.int32),
+                real_keys=np.zeros(MIDI_NOTE_COUNT, dtype=np.uint8),
+                real_volumes=np.zeros(MIDI_NOTE_COUNT, dtype=np.uint8),
+                meta=np.zeros(2, dtype=np.float64)
+            )
+            for _ in range(self.SLOT_COUNT)
+        ]
+        self.slot_seq = [0] * self.SLOT_COUNT
+        self.latest = 0             # 最新已发布的槽
+        self.reader_slot = 0        # 读取端当前占用的槽
+        self.published = 0
+        self._writing = None
+
+        notes = np.arange(MIDI_NOTE_COUNT)
+        self.note_to_key = np.clip(notes - note_min, 0, note_max - note_min)
+        self.piano_note_mask = (notes >= note_min) & (notes <= note_max)
+
+    # ---- 生产者 ----
+
+    def begin_write(self) -> KeyState:
+        """取得一个可写的槽（既不是最新帧也没有被读取端占用），写完后调用publish()"""
+        slot = next(i for i in range(self.SLOT_COUNT) if i != self.latest and i != self.reader_slot)
+        self.slot_seq[slot] += 1    # 奇数：写入中
+        self._writing = slot
+        return self.slots[slot]
+
+    def publish(self, timestamp: float = None):
+        """发布begin_write()取得的槽"""
+        slot = self._writing
+        state = self.slots[slot]
+        state.frame = self.published
+        state.meta[1] = time.perf_counter() if timestamp is None else timestamp
+        self.slot_seq[slot] += 1    # 偶数：已就绪
+        self.latest = slot
+        self.published += 1
+        self._writing = None
+
+    def publish_notes(self, active: np.ndarray, velocity: np.ndarray, average_volume: float,
+                      timestamp: float = None, hits: np.ndarray = None):
+        """
+        由128个MIDI音符的状态生成并发布一帧
+
+        Args:
+            active: bool[128]，音符是否按下
+            velocity: uint8[128]，按下音符的力度（未按下为0）
+            average_volume: 最近note_on的平均力度
+            timestamp: 触发本帧的事件时间（time.perf_counter），默认为当前时间
+            hits: int32[128]，上一帧以来每个音符被按下的次数，默认按是否按下计为0或1
+        """
+        state = self.begin_write()
+        state.pattern[:] = 0
+        np.maximum.at(state.pattern, self.note_to_key, active.astype(np.uint8))
+        state.volumes[:] = 0
+        np.maximum.at(state.volumes, self.note_to_key, velocity)
+        state.hits[:] = 0
+        np.add.at(state.hits, self.note_to_key, active if hits is None else hits)
+        np.logical_and(active, self.piano_note_mask, out=state.real_keys, casting='unsafe')
+        np.multiply(velocity, self.piano_note_mask, out=state.real_volumes, casting='unsafe')
+        state.meta[0] = average_volume
+        self.publish(timestamp)
+
+    def release_all(self, average_volume: float = None):
+        """发布一帧所有键都松开的状态（默认沿用上一帧的平均音量）"""
+        if average_volume is None:
+            average_volume = float(self.slots[self.latest].meta[0])
+        self.publish_notes(np.zeros(MIDI_NOTE_COUNT, dtype=bool),
+                           np.zeros(MIDI_NOTE_COUNT, dtype=np.uint8), average_volume)
+
+    # ---- 消费者 ----
+
+    def read(self) -> KeyState:
+        """
+        占用并返回最新帧；返回的数组在下一次read()之前不会被生产者改写
+        """
+        while True:
+            slot = self.latest
+            self.reader_slot = slot
+            # 占用之后开始的写入不会选中该槽；占用之前开始的写入会使序号为奇数或最新槽发生变化
+            if self.slot_seq[slot] % 2 == 0 and self.latest == slot:
+                return self.slots[slot]
+            time.sleep(0)
+
+
+@dataclass
+class PatternFrame:
+    """KeyStateDriver.next_frame()得到的一帧模式输入"""
+    state: KeyState             # 本帧读取的按键状态
+    new_state: bool             # 本帧包含新的按键事件
+    cleared: bool               # 清零帧：发送全0模式，不显示按键
+    pattern: np.ndarray         # 送给气泡柱的模式
+    volumes: np.ndarray
+    hit_counts: Optional[np.ndarray]  # 密集MIDI合并模式下的敲击次数，否则为None
+
+
+class KeyStateDriver:
+    """
+    按MIDI时间轴发布按键状态，并把按键状态变成每帧的模式输入
+
+    - publish(t)：时钟t处有新事件时发布按键状态；合并模式下两帧之间按下又松开的音符也计入
+    - next_frame()：事件之后的帧发送新模式，之后每zero_pattern_interval帧清零一次
+    """
+
+    def __init__(self):
+        audio = get_config().audio
+        self.audio = audio
+        self.key_state = KeyStateBuffer(audio.pattern_key_count, audio.midi_note_min, audio.midi_note_max)
+        self.zero_pattern = np.zeros(audio.pattern_key_count, dtype=np.uint8)
+        self.one_volumes = np.ones(audio.pattern_key_count, dtype=np.int64)
+        self.zero_pattern_interval = audio.zero_pattern_interval
+        self.timeline = None
+        self.coalesce = False
+        self.last_event_count = 0
+        self.last_clock = -1.0
+        self.keys_down = False
+        self.last_state_frame = -1
+        self.pattern_pending = False
+        self.update_count = 0
+
+    def use_coalescing(self, timeline) -> bool:
+        """根据配置和文件的事件密度决定是否启用密集MIDI合并模式"""
+        if self.audio.coalesce_mode == "auto":
+            return timeline.events_per_second > self.audio.coalesce_auto_events_per_second
+        return self.audio.coalesce_mode == "on"
+
+    def begin_timeline(self, timeline, coalesce: Optional[bool] = None):
+        """
+        切换到新的时间轴（从头开始），松开仍按下的键
+
+        Args:
+            coalesce: 是否合并两帧之间的音符，None表示按配置和事件密度决定
+        """
+        self.timeline = timeline
+        self.coalesce = self.use_coalescing(timeline) if coalesce is None else coalesce
+        self.last_event_count = 0
+        self.last_clock = -1.0
+        if self.keys_down:
+            self.release_all()
+
+    def release_all(self, average_volume: float = None):
+        self.key_state.release_all(average_volume)
+        self.keys_down = False
+
+    def reset(self):
+        """回到时间轴开头：松开所有键（平均音量为0），清零节奏从头开始"""
+        self.release_all(0.0)
+        self.last_event_count = 0
+        self.last_clock = -1.0
+        self.last_state_frame = -1
+        self.pattern_pending = False
+        self.update_count = 0
+
+    def publish(self, t: Optional[float]):
+        """根据时钟t（秒）发布按键状态；t为None表示音乐已停止，松开所有键"""
+        if t is None:
+            if self.keys_down:
+                self.release_all()
+            return
+        event_count = self.timeline.event_count(t)
+        window_start, self.last_clock = self.last_clock, t
+        if event_count == self.last_event_count:
+            return
+        self.last_event_count = event_count
+        active, velocity = self.timeline.key_state(t)
+        hits = None
+        if self.coalesce:
+            # 两帧之间按下又松开的音符也要画出来：按下次数、最大力度和按住的键合并
+            hits, max_velocity = self.timeline.coalesce(window_start, t)
+            active = active | (hits > 0)
+            velocity = np.maximum(velocity, max_velocity)
+        average_volume = self.timeline.average_volume(t, self.audio.total_volumes_maxlen)
+        self.key_state.publish_notes(active, velocity, average_volume, hits=hits)
+        self.keys_down = bool(active.any())
+
+    def next_frame(self) -> PatternFrame:
+        """读取最新按键状态，得到本帧的模式输入"""
+        state = self.key_state.read()
+        new_state = state.frame != self.last_state_frame
+        if new_state:
+            self.last_state_frame = state.frame
+            self.pattern_pending = True
+            self.update_count = 1
+        cleared = self.update_count % self.zero_pattern_interval == 0
+        if cleared:
+            self.pattern_pending = False
+            frame = PatternFrame(state, new_state, True, self.zero_pattern, self.one_volumes, None)
+        else:
+            frame = PatternFrame(
+                state, new_state, False,
+                state.pattern if self.pattern_pending else self.zero_pattern,
+                state.volumes,
+                state.hits if self.coalesce and self.pattern_pending else None
+            )
+        self.update_count += 1
+        return frame
+
+    def get_state(self) -> Dict:
+        """按键状态和合并、清零节奏的状态，可由set_state()恢复"""
+        key_state = self.key_state.slots[self.key_state.latest]
+        return {
+            "last_event_count": np.int64(self.last_event_count),
+            "last_clock": np.float64(self.last_clock),
+            "last_state_frame": np.int64(self.last_state_frame),
+            "pattern_pending": np.bool_(self.pattern_pending),
+            "update_count": np.int64(self.update_count),
+            "keys_down": np.bool_(self.keys_down),
+            "key_frame": np.int64(key_state.frame),
+            "key_pattern": key_state.pattern.copy(),
+            "key_volumes": key_state.volumes.copy(),
+            "key_hits": key_state.hits.copy(),
+            "key_real_keys": key_state.real_keys.copy(),
+            "key_real_volumes": key_state.real_volumes.copy(),
+            "key_meta": key_state.meta.copy(),
+        }
+
+    def set_state(self, state: Dict):
+        # 以相同的发布序号重新发布保存的按键状态
+        buffer = self.key_state
+        buffer.published = int(state["key_frame"])
+        slot = buffer.begin_write()
+        slot.pattern[:] = state["key_pattern"]
+        slot.volumes[:] = state["key_volumes"]
+        slot.hits[:] = state["key_hits"]
+        slot.real_keys[:] = state["key_real_keys"]
+        slot.real_volumes[:] = state["key_real_volumes"]
+        slot.meta[0] = state["key_meta"][0]
+        buffer.publish(float(state["key_meta"][1]))
+        self.last_event_count = int(state["last_event_count"])
+        self.last_clock = float(state["last_clock"])
+        self.last_state_frame = int(state["last_state_frame"])
+        self.pattern_pending = bool(state["pattern_pending"])
+        self.update_count = int(state["update_count"])
+        self.keys_down = bool(state["keys_down"])
@@ -0,0 +1,224 @@
+"""
+关键帧快照 - 在一首歌中即时跳转
+
+模拟是顺序的，原来要看第3分钟只能从头模拟3分钟。KeyframeSeeker：
+- 预扫描：无界面地模拟整首歌（不计算粒子数据），每隔interval秒保存一次完整状态
+  （BubbleColumnSimulation.get_state：非零体素、积雪TTL、BubbleGenerator的scaler和
+  final_volume环，加上TimelinePlayer的按键状态和节奏计数）
+- 随机数：numba的随机数状态无法从Python读写，改为在每个关键帧以 seed + 帧序号
+  重设种子（TimelinePlayer.reseed_interval），关键帧之后的模拟因此可以完全复现
+- 快照放在按字节数限制大小的LRU中，超出的写到磁盘（.npz），需要时再读回
+- 跳转：恢复目标之前最近的关键帧，再不渲染地快进剩余的帧（最多interval秒）
+
+使用方法：
+    seeker = KeyframeSeeker.for_song("song.mid")
+    seeker.build()
+    seeker.seek(180.0)
+    for t in seeker.player.frames(start_frame=seeker.frame):
+        batch = seeker.simulation.render_batch()
+
+    python MBC_Keyframes.py City_Of_Stars.mid --seek 120 --seek 30 --seek 125
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from MBC_config import get_config
+
+
+def _state_bytes(state: Dict[str, np.ndarray]) -> int:
+    return sum(np.asarray(value).nbytes for value in state.values())
+
+
+class KeyframeCache:
+    """按帧序号保存快照的LRU，超出内存预算的快照写到磁盘"""
+
+    def __init__(self, max_bytes: int, spill_dir: str = None):
+        """
+        Args:
+            max_bytes: 内存中快照的总字节数上限
+            spill_dir: 磁盘目录，默认在缓存目录下新建临时目录，close()时删除
+        """
+        self.max_bytes = max_bytes
+        self.memory: "OrderedDict[int, Dict[str, np.ndarray]]" = OrderedDict()
+        self.memory_bytes = 0
+        self.spilled: Dict[int, str] = {}
+        self._owns_dir = spill_dir is None
+        if spill_dir is None:
+            cache_dir = get_config().file_paths.cache_dir
+            os.makedirs(cache_dir, exist_ok=True)
+            spill_dir = tempfile.mkdtemp(prefix="keyframes_", dir=cache_dir)
+        os.makedirs(spill_dir, exist_ok=True)
+        self.spill_dir = spill_dir
+
+    def __len__(self) -> int:
+        return len(self.memory) + len(self.spilled)
+
+    def frames(self) -> List[int]:
+        return sorted(set(self.memory) | set(self.spilled))
+
+    def put(self, frame: int, state: Dict[str, np.ndarray]):
+        previous = self.memory.get(frame)
+        if previous is not None:
+            self.memory_bytes -= _state_bytes(previous)
+        self.memory[frame] = state
+        self.memory.move_to_end(frame)
+        self.memory_bytes += _state_bytes(state)
+        self.spilled.pop(frame, None)
+        # 最久未使用的写到磁盘，至少保留刚放入的一个
+        while self.memory_bytes > self.max_bytes and len(self.memory) > 1:
+            old_frame, old_state = self.memory.popitem(last=False)
+            self.memory_bytes -= _state_bytes(old_state)
+            path = os.path.join(self.spill_dir, f"{old_frame:08d}.npz")
+            if not os.path.exists(path):
+                np.savez(path, **old_state)
+            self.spilled[old_frame] = path
+
+    def get(self, frame: int) -> Optional[Dict[str, np.ndarray]]:
+        state = self.memory.get(frame)
+        if state is not None:
+            self.memory.move_to_end(frame)
+            return state
+        path = self.spilled.get(frame)
+        if path is None:
+            return None
+        with np.load(path) as data:
+            state = {name: data[name] for name in data.files}
+        # 读回的快照放回内存（磁盘上的文件保留，再次换出时不必重写）
+        self.put(frame, state)
+        self.spilled[frame] = path
+        return state
+
+    def nearest(self, frame: int) -> Optional[int]:
+        """不晚于frame的最近关键帧"""
+        candidates = [key for key in self.frames() if key <= frame]
+        return candidates[-1] if candidates else None
+
+    def close(self):
+        self.memory.clear()
+        self.spilled.clear()
+        self.memory_bytes = 0
+        if self._owns_dir:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+
+class KeyframeSeeker:
+    """用关键帧快照在模拟中跳转"""
+
+    def __init__(self, simulation, player, interval: float = None, cache: KeyframeCache = None):
+        """
+        Args:
+            simulation: BubbleColumnSimulation
+            player: 驱动simulation的TimelinePlayer
+            interval: 关键帧间隔（秒），默认取配置
+            cache: 快照缓存，默认按配置的内存预算新建
+        """
+        performance = get_config().performance
+        self.simulation = simulation
+        self.player = player
+        interval = interval or performance.keyframe_interval_s
+        self.interval_frames = max(1, int(round(interval * player.fps)))
+        player.reseed_interval = self.interval_frames
+        player.seed = performance.keyframe_seed
+        self.cache = cache or KeyframeCache(int(performance.keyframe_memory_mb * 1024 * 1024))
+        self.end = player.timeline.duration
+
+    @classmethod
+    def for_song(cls, midi_path: str, fps: float = 60.0, interval: float = None,
+                 orientation: str = None, pos_type: str = None) -> 'KeyframeSeeker':
+        from MBC_Cache import get_midi_cache
+        from MBC_Simulation import BubbleColumnSimulation, TimelinePlayer
+        timeline = get_midi_cache().load(midi_path).timeline
+        simulation = BubbleColumnSimulation(orientation=orientation, pos_type=pos_type)
+        simulation.warm_up()
+        return cls(simulation, TimelinePlayer(simulation, timeline, fps=fps), interval)
+
+    @property
+    def frame(self) -> int:
+        """下一帧的序号"""
+        return self.simulation.frame
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        state = self.simulation.get_state()
+        state.update({"player_" + name: value for name, value in self.player.get_state().items()})
+        return state
+
+    def restore(self, state: Dict[str, np.ndarray]):
+        self.simulation.set_state(state)
+        self.player.set_state({name[len("player_"):]: value for name, value in state.items()
+                               if name.startswith("player_")})
+
+    def build(self, duration: float = None) -> int:
+        """
+        从头预扫描（不计算粒子数据），保存每个关键帧之前的状态
+
+        Returns:
+            关键帧数量
+        """
+        self.end = self.player.timeline.duration if duration is None else min(duration, self.player.timeline.duration)
+        last_frame = int(self.end * self.player.fps)
+        self.simulation.reset()
+        self.player.reset()
+        for frame in range(last_frame + 1):
+            if frame % self.interval_frames == 0:
+                self.cache.put(frame, self.snapshot())
+            self.player.step_frame(frame)
+        return len(self.cache)
+
+    def seek(self, t: float) -> int:
+        """
+        跳到时间t（秒）：恢复最近的关键帧，快进到目标帧之前
+
+        Returns:
+            下一帧的序号（之后用player.frames(start_frame=...)或step_frame继续）
+        """
+        fps = self.player.fps
+        target = max(0, int(round(t * fps)))
+        keyframe = self.cache.nearest(target)
+        if keyframe is None:
+            raise ValueError("No keyframes; call build() first")
+        # 目标就在当前位置之后（中间没有更近的关键帧）时直接快进
+        if not keyframe <= self.frame <= target:
+            self.restore(self.cache.get(keyframe))
+        for frame in range(self.frame, target):
+            self.player.step_frame(frame, frame / fps <= self.end)
+        return target
+
+    def close(self):
+        self.cache.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build keyframes for a song and measure seek times.")
+    parser.add_argument("midi", help="MIDI file")
+    parser.add_argument("--fps", type=float, default=60.0)
+    parser.add_argument("--interval", type=float, default=None, help="seconds between keyframes")
+    parser.add_argument("--orientation", choices=["up", "down"], default=None)
+    parser.add_argument("--seek", type=float, action="append", default=[], help="seek to this time (repeatable)")
+    args = parser.parse_args()
+
+    seeker = KeyframeSeeker.for_song(args.midi, args.fps, args.interval, args.orientation)
+    try:
+        began = time.perf_counter()
+        count = seeker.build()
+        cache = seeker.cache
+        print(f"{count} keyframes every {seeker.interval_frames} frames in {time.perf_counter() - began:.2f} s "
+              f"({cache.memory_bytes / 1024:.0f} KiB in memory, {len(cache.spilled)} on disk)")
+        for t in args.seek:
+            began = time.perf_counter()
+            seeker.seek(t)
+            print(f"  seek {t:7.2f} s: {(time.perf_counter() - began) * 1000:7.1f} ms, "
+                  f"{seeker.simulation.get_statistics()['active_bubbles']} bubbles")
+    finally:
+        seeker.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+MIDI曲库索引 - 让文件对话框在几千首MIDI中也能即时打开和筛选
+
+索引保存在缓存目录的library.sqlite中，每个MIDI文件一行：
+路径、修改时间、大小、时长、音符数、音域、音轨数、配套的人声文件。
+- 刷新在后台线程中进行：遍历曲库目录，只有新增或修改时间/大小变化的文件
+  才交给进程池用mido解析（解析是CPU密集的，多进程才能并行），已删除的文件从索引中移除；
+  人声文件只需检查是否存在，每次刷新都在本线程中重新确认
+- 解析结果分批写入数据库，每批之后generation加一，界面据此重新读取
+- 界面线程只执行SQL查询，从不解析MIDI文件
+
+使用方法：
+    index = LibraryIndex()
+    index.refresh_async(["/path/to/midi"])
+    entries = index.entries("city")
+"""
+
+import multiprocessing
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import List, Optional, Iterable, Tuple, Dict
+
+MIDI_EXTENSIONS = (".mid", ".midi")
+INDEX_VERSION = 1
+BATCH_SIZE = 64
+
+COLUMNS = ("path", "mtime_ns", "size", "duration", "note_count", "note_min", "note_max",
+           "tracks", "vocal_path", "error")
+
+
+@dataclass
+class LibraryEntry:
+    """索引中的一首歌"""
+    path: str
+    mtime_ns: int
+    size: int
+    duration: float
+    note_count: int
+    note_min: int
+    note_max: int
+    tracks: int
+    vocal_path: Optional[str]
+    error: Optional[str]
+
+    @property
+    def name(self) -> str:
+        return os.path.splitext(os.path.basename(self.path))[0]
+
+
+def scan_midi_files(roots: Iterable[str]) -> Dict[str, Tuple[int, int]]:
+    """遍历目录，返回 {MIDI文件路径: (修改时间ns, 大小)}"""
+    found = {}
+    for root in roots:
+        for directory, _, names in os.walk(root):
+            for name in names:
+                if name.lower().endswith(MIDI_EXTENSIONS):
+                    path = os.path.abspath(os.path.join(directory, name))
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    found[path] = (stat.st_mtime_ns, stat.st_size)
+    return found
+
+
+def index_file(path: str, mtime_ns: int, size: int) -> tuple:
+    """
+    解析一个MIDI文件得到索引行（在工作进程中运行）
+
+    Returns:
+        与COLUMNS顺序相同的元组（vocal_path由调用方填写）；解析失败时error列为错误信息
+    """
+    from mido import MidiFile
+    try:
+        midi = MidiFile(path)
+        # 一次遍历合并后的消息（时间已换算为秒）同时得到时长和音符统计
+        duration, note_count, note_min, note_max = 0.0, 0, 127, 0
+        for msg in midi:
+            duration += msg.time
+            if msg.type == 'note_on' and msg.velocity > 0:
+                note_count += 1
+                note_min = min(note_min, msg.note)
+                note_max = max(note_max, msg.note)
+        if note_count == 0:
+            note_min = note_max = 0
+        return (path, mtime_ns, size, duration, note_count, note_min, note_max,
+                len(midi.tracks), None, None)
+    except Exception as e:
+        return (path, mtime_ns, size, 0.0, 0, 0, 0, 0, None, str(e) or type(e).__name__)
+
+
+class LibraryIndex:
+    """基于SQLite的增量曲库索引"""
+
+    def __init__(self, db_path: str = None, workers: int = 0):
+        """
+        Args:
+            db_path: 数据库路径，默认为缓存目录下的library.sqlite
+            workers: 解析进程数，0表示CPU核数
+        """
+        if db_path is None:
+            from MBC_config import get_config
+            cache_dir = get_config().file_paths.cache_dir
+            os.makedirs(cache_dir, exist_ok=True)
+            db_path = os.path.join(cache_dir, "library.sqlite")
+        self.db_path = db_path
+        self.workers = workers or os.cpu_count() or 1
+        self.generation = 0         # 每写入一批结果加一
+        self.indexed = 0            # 本次刷新已解析的文件数
+        self.pending = 0            # 本次刷新需要解析的文件数
+        self.refreshing = False
+        self._thread = None
+        self._cancelled = False
+        self._local = threading.local()
+        self._create_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用自己的连接"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def _create_schema(self):
+        connection = self._connect()
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != INDEX_VERSION:
+            connection.execute("DROP TABLE IF EXISTS songs")
+            connection.execute("PRAGMA user_version = %d" % INDEX_VERSION)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS songs ("
+            "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, duration REAL, "
+            "note_count INTEGER, note_min INTEGER, note_max INTEGER, tracks INTEGER, "
+            "vocal_path TEXT, error TEXT)"
+        )
+        connection.commit()
+
+    # ---- 查询（界面线程） ----
+
+    def entries(self, text: str = "", limit: int = None) -> List[LibraryEntry]:
+        """路径中包含text（不区分大小写）的歌曲，按文件名排序"""
+        sql = "SELECT %s FROM songs" % ", ".join(COLUMNS)
+        params = []
+        if text:
+            sql += " WHERE path LIKE ? ESCAPE '\\'"
+            escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.append(f"%{escaped}%")
+        sql += " ORDER BY path COLLATE NOCASE"
+        if limit is not None:
+            sql += " LIMIT %d" % limit
+        return [LibraryEntry(*row) for row in self._connect().execute(sql, params)]
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM songs").fetchone()[0]
+
+    # ---- 刷新（后台线程） ----
+
+    def refresh_async(self, roots: List[str]):
+        """在后台线程中刷新索引；正在刷新时忽略"""
+        if self.refreshing:
+            return
+        self.refreshing = True
+        self._cancelled = False
+        self._thread = threading.Thread(target=self._refresh_guarded, args=(list(roots),),
+                                        name="library-index", daemon=True)
+        self._thread.start()
+
+    def _refresh_guarded(self, roots: List[str]):
+        try:
+            self.refresh(roots)
+        except Exception as e:
+            print(f"Library index refresh failed: {e}")
+        finally:
+            self.refreshing = False
+
+    def refresh(self, roots: List[str]) -> int:
+        """
+        同步刷新索引：解析新增和修改过的文件，删除已不存在的文件
+
+        Returns:
+            重新解析的文件数
+        """
+        from MBC_config import get_config
+        from MBC_Playlist import find_vocal_file
+        config = get_config()
+        connection = self._connect()
+        on_disk = scan_midi_files(roots)
+        known, known_vocals = {}, {}
+        for path, mtime_ns, size, vocal_path in connection.execute("SELECT path, mtime_ns, size, vocal_path FROM songs"):
+            known[path] = (mtime_ns, size)
+            known_vocals[path] = vocal_path
+        vocals = {path: find_vocal_file(path, config)[0] for path in on_disk}
+
+        # 未挂载或暂时不可访问的根目录下的歌曲保留在索引中
+        missing_roots = tuple(os.path.join(os.path.abspath(root), "") for root in roots if not os.path.isdir(root))
+        removed = [(path,) for path in known if path not in on_disk and not path.startswith(missing_roots)]
+        if removed:
+            connection.executemany("DELETE FROM songs WHERE path = ?", removed)
+            connection.commit()
+            self.generation += 1
+
+        vocal_updates = [(vocals[path], path) for path in known
+                         if path in on_disk and known_vocals[path] != vocals[path]]
+        if vocal_updates:
+            connection.executemany("UPDATE songs SET vocal_path = ? WHERE path = ?", vocal_updates)
+            connection.commit()
+            self.generation += 1
+
+        changed = [(path, stat) for path, stat in on_disk.items() if known.get(path) != stat]
+        self.pending, self.indexed = len(changed), 0
+        if not changed:
+            return 0
+
+        insert = "INSERT OR REPLACE INTO songs (%s) VALUES (%s)" % (", ".join(COLUMNS), ", ".join("?" * len(COLUMNS)))
+        batch = []
+        vocal_column = COLUMNS.index("vocal_path")
+        # 与其他子进程一样使用spawn：不复制带着Qt和音频线程的主进程
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(changed)),
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = [executor.submit(index_file, path, mtime_ns, size) for path, (mtime_ns, size) in changed]
+            for future in as_completed(futures):
+                if self._cancelled:
+                    for pending in futures:
+                        pending.cancel()
+                    break
+                row = list(future.result())
+                row[vocal_column] = vocals[row[0]]
+                batch.append(row)
+                self.indexed += 1
+                if len(batch) >= BATCH_SIZE:
+                    self._write_batch(connection, insert, batch)
+        self._write_batch(connection, insert, batch)
+        return self.indexed
+
+    def _write_batch(self, connection: sqlite3.Connection, insert: str, batch: list):
+        if batch:
+            connection.executemany(insert, batch)
+            connection.commit()
+            batch.clear()
+            self.generation += 1
+
+    def cancel(self):
+        """停止后台刷新（已写入的结果保留）"""
+        self._cancelled = True
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+            self._thread = None
@@ -0,0 +1,183 @@
+"""
+实时MIDI输入 - 直接用MIDI键盘演奏驱动气泡柱
+
+LiveMidiInput打开一个pygame.midi输入设备，在专用读取线程中高频轮询，
+每批事件更新128个音符的状态后整帧发布到KeyStateBuffer，
+与MIDI文件播放走同一条按键状态路径（MidiVisualizer.render_key_state）。
+
+每个事件都带有PortMidi时间戳，换算到time.perf_counter后随按键状态一起发布；
+渲染循环画完包含该事件的帧后记录"输入到画面"的延迟，可用于确认
+按键后一帧之内气泡柱就有反应。
+
+使用方法：
+    在配置中设置 audio.live_input_enabled = True，
+    audio.live_input_device_id 为启动时打印的输入设备ID（-1表示系统默认输入设备）
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Optional, Dict
+
+import numpy as np
+import pygame.midi
+
+from MBC_KeyState import KeyStateBuffer
+from MBC_MidiTimeline import MIDI_NOTE_COUNT
+
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+
+
+class LatencyStats:
+    """输入到画面延迟的滑动窗口统计"""
+
+    def __init__(self, window: int = 500):
+        self.samples = deque(maxlen=window)
+        self.total_frames = 0
+
+    def record(self, latency: float):
+        self.samples.append(latency)
+        self.total_frames += 1
+
+    def summary(self) -> Dict[str, float]:
+        """最近窗口内的延迟（毫秒）"""
+        if not self.samples:
+            return {"frames": 0, "mean_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+        values = np.array(self.samples) * 1000
+        return {
+            "frames": self.total_frames,
+            "mean_ms": float(values.mean()),
+            "p95_ms": float(np.percentile(values, 95)),
+            "max_ms": float(values.max()),
+        }
+
+
+def find_input_device(device_id: int = -1) -> Optional[int]:
+    """
+    确认输入设备ID可用；-1表示系统默认输入设备，没有默认设备时取第一个输入设备
+    """
+    if device_id is not None and device_id >= 0:
+        info = pygame.midi.get_device_info(device_id)
+        return device_id if info is not None and info[2] else None
+    default_id = pygame.midi.get_default_input_id()
+    if default_id >= 0:
+        return default_id
+    for i in range(pygame.midi.get_count()):
+        if pygame.midi.get_device_info(i)[2]:
+            return i
+    return None
+
+
+class LiveMidiInput:
+    """
+    MIDI输入设备读取器
+
+    读取线程是唯一访问pygame.midi.Input的线程，也是KeyStateBuffer唯一的生产者。
+    """
+
+    def __init__(self, key_state: KeyStateBuffer, device_id: int = -1,
+                 poll_interval: float = 0.001, buffer_size: int = 256,
+                 average_window: int = 240):
+        """
+        Args:
+            key_state: 发布按键状态的缓冲区
+            device_id: 输入设备ID，-1表示默认输入设备
+            poll_interval: 没有事件时的轮询间隔（秒）
+            buffer_size: 每次读取的最大事件数
+            average_window: 平均音量使用的最近note_on数量
+        """
+        self.key_state = key_state
+        self.device_id = device_id
+        self.poll_interval = poll_interval
+        self.buffer_size = buffer_size
+
+        self.active = np.zeros(MIDI_NOTE_COUNT, dtype=bool)
+        self.velocity = np.zeros(MIDI_NOTE_COUNT, dtype=np.uint8)
+        self.recent_volumes = deque(maxlen=average_window)
+        self.volume_sum = 0
+
+        self.latency = LatencyStats()
+        self.event_count = 0
+        self.device_name = None
+        self._input = None
+        self._thread = None
+        self._running = False
+
+    def start(self) -> bool:
+        """打开设备并启动读取线程"""
+        device_id = find_input_device(self.device_id)
+        if device_id is None:
+            print(f"No MIDI input device available (requested {self.device_id})")
+            return False
+        try:
+            self._input = pygame.midi.Input(device_id, self.buffer_size)
+        except pygame.midi.MidiException as e:
+            print(f"Could not open MIDI input {device_id}: {e}")
+            return False
+        self.device_id = device_id
+        self.device_name = pygame.midi.get_device_info(device_id)[1].decode()
+        self._running = True
+        self._thread = threading.Thread(target=self._read_loop, name="midi-input", daemon=True)
+        self._thread.start()
+        print(f"Listening on MIDI input {device_id}: {self.device_name}")
+        return True
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        if self._input is not None:
+            self._input.close()
+            self._input = None
+        if self.active.any():
+            self.active[:] = False
+            self.velocity[:] = 0
+            self.key_state.release_all()
+
+    def _read_loop(self):
+        while self._running:
+            if not self._input.poll():
+                time.sleep(self.poll_interval)
+                continue
+            events = self._input.read(self.buffer_size)
+            # PortMidi时间戳（毫秒）换算到perf_counter
+            clock_offset = time.perf_counter() - pygame.midi.time() / 1000.0
+            if self._apply_events(events):
+                first_timestamp = min(timestamp for _, timestamp in events)
+                self.key_state.publish_notes(
+                    self.active, self.velocity, self.average_volume(),
+                    timestamp=first_timestamp / 1000.0 + clock_offset
+                )
+
+    def _apply_events(self, events) -> bool:
+        """把一批事件应用到音符状态，返回是否有音符变化"""
+        changed = False
+        for (status, note, velocity, _), _ in events:
+            kind = status & 0xF0
+            if kind == NOTE_ON:
+                if len(self.recent_volumes) == self.recent_volumes.maxlen:
+                    self.volume_sum -= self.recent_volumes[0]
+                self.recent_volumes.append(velocity)
+                self.volume_sum += velocity
+            elif kind != NOTE_OFF:
+                continue
+            on = kind == NOTE_ON and velocity > 0
+            self.active[note] = on
+            self.velocity[note] = velocity if on else 0
+            self.event_count += 1
+            changed = True
+        return changed
+
+    def average_volume(self) -> float:
+        return self.volume_sum / len(self.recent_volumes) if self.recent_volumes else 0
+
+    def record_frame(self, event_timestamp: float):
+        """渲染循环画完包含新事件的一帧后调用"""
+        self.latency.record(time.perf_counter() - event_timestamp)
+
+    def get_stats(self) -> Dict[str, object]:
+        stats = {"device": self.device_name, "events": self.event_count}
+        stats.update(self.latency.summary())
+        return stats
@@ -0,0 +1,398 @@
+"""
+ThreeJSRenderer 负载测试工具 - 模拟多个WebSocket观看端
+
+在本地启动ThreeJSRenderer，用合成的（或录制的）粒子流驱动它，
+同时在进程内连接N个websockets客户端，按可配置的速度读取帧
+（其中一部分故意读得很慢），用于衡量广播路径的性能：
+- 每个客户端的吞吐量（帧/秒、MB/秒）
+- 帧延迟分位数（render_frame调用 -> 客户端收到）
+- 服务端每帧CPU时间（主线程序列化 + 事件循环线程广播）
+- 内存增长
+
+使用方法：
+    python MBC_LoadTest.py --clients 8 --slow-clients 2 --slow-delay 0.05 --frames 600
+    python MBC_LoadTest.py --source song.mbcrec --json report.json
+    python MBC_LoadTest.py --relay 2 --clients 16   # 经由转发进程分发
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+import websockets
+
+from MBC_RenderInterface import RenderableParticle, CameraState, RenderSettings, convert_njit_to_particles
+from MBC_ThreeJSRenderer import ThreeJSRenderer
+from MBC_FrameRelay import FrameRelayPublisher
+
+
+# json.dumps保持字典顺序，帧消息总是以type和frame_id开头，只解析前缀即可
+_FRAME_ID_PATTERN = re.compile(r'^\{"type": "render_frame", "frame_id": (\d+)')
+
+
+class SyntheticParticleStream:
+    """
+    合成粒子流
+
+    预先生成若干帧随机粒子并循环播放，避免生成开销混入测量结果。
+    """
+
+    def __init__(self, particle_count: int = 2000, distinct_frames: int = 32,
+                 data_height: int = 400, radius: float = 36.0, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        base_color = (229/255, 248/255, 1.)
+        self.frames: List[List[RenderableParticle]] = []
+        for _ in range(distinct_frames):
+            angle = rng.uniform(0, 2 * np.pi, particle_count)
+            r = rng.uniform(0, radius, particle_count)
+            all_x = (r * np.cos(angle)).astype(np.float32)
+            all_y = (r * np.sin(angle)).astype(np.float32)
+            all_z = rng.uniform(0, data_height, particle_count).astype(np.float32)
+            all_sizes = rng.uniform(5, 500, particle_count).astype(np.float32)
+            all_opacity = rng.uniform(0.1, 1.0, particle_count).astype(np.float32)
+            all_types = np.zeros(particle_count, dtype=np.int32)
+            all_blend = np.zeros(particle_count, dtype=np.float32)
+            self.frames.append(convert_njit_to_particles(
+                all_x, all_y, all_z, all_sizes, all_opacity, all_types, all_blend, base_color
+            ))
+        self.index = 0
+
+    def next_frame(self) -> List[RenderableParticle]:
+        frame = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        return frame
+
+
+class RecordedParticleStream(SyntheticParticleStream):
+    """
+    录制的粒子流
+
+    读取MBC_FrameRecorder的录制目录（.mbcrec），或旧的.npz文件：
+    frame_offsets (F+1,) 加上按列拼接的 x, y, z, size, opacity, type, blend 数组。
+    """
+
+    def __init__(self, path: str):
+        self.index = 0
+        if os.path.isdir(path):
+            from MBC_FrameRecorder import FrameRecording
+            recording = FrameRecording(path)
+            self.frames = [recording.batch(i).to_particles() for i in range(len(recording))]
+            return
+        data = np.load(path)
+        offsets = data["frame_offsets"]
+        base_color = (229/255, 248/255, 1.)
+        self.frames = []
+        for i in range(len(offsets) - 1):
+            s, e = offsets[i], offsets[i + 1]
+            self.frames.append(convert_njit_to_particles(
+                data["x"][s:e], data["y"][s:e], data["z"][s:e],
+                data["size"][s:e], data["opacity"][s:e],
+                data["type"][s:e].astype(np.int32), data["blend"][s:e], base_color
+            ))
+
+
+class _RenderTimingMixin:
+    """记录每帧发出时间和调用线程CPU开销"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.send_times: Dict[int, float] = {}
+        self.render_cpu_seconds = 0.0
+
+    def render_frame(self, particles, camera) -> bool:
+        self.send_times[self.frame_count] = time.perf_counter()
+        cpu_start = time.thread_time()
+        result = super().render_frame(particles, camera)
+        self.render_cpu_seconds += time.thread_time() - cpu_start
+        return result
+
+
+class InstrumentedThreeJSRenderer(_RenderTimingMixin, ThreeJSRenderer):
+    """带计时的ThreeJSRenderer"""
+
+    def loop_thread_cpu(self) -> float:
+        """获取WebSocket事件循环线程的累计CPU时间"""
+        async def _thread_cpu():
+            return time.thread_time()
+        return asyncio.run_coroutine_threadsafe(_thread_cpu(), self.loop).result(timeout=5.0)
+
+
+class InstrumentedRelayPublisher(_RenderTimingMixin, FrameRelayPublisher):
+    """带计时的Relay发布端（广播在转发进程中进行，不计入本进程）"""
+
+    def loop_thread_cpu(self) -> float:
+        return 0.0
+
+
+@dataclass
+class ViewerStats:
+    """单个模拟观看端的统计"""
+    name: str
+    read_delay: float
+    received: int = 0
+    received_bytes: int = 0
+    first_recv: Optional[float] = None
+    last_recv: Optional[float] = None
+    latencies_ms: List[float] = field(default_factory=list)
+    error: Optional[str] = None
+
+    def summary(self, frames_sent: int) -> Dict:
+        duration = (self.last_recv - self.first_recv) if self.received > 1 else 0.0
+        latencies = np.array(self.latencies_ms) if self.latencies_ms else np.zeros(1)
+        return {
+            "name": self.name,
+            "read_delay_ms": self.read_delay * 1000,
+            "frames_received": self.received,
+            "frames_missed": max(0, frames_sent - self.received),
+            "fps": self.received / duration if duration > 0 else 0.0,
+            "mb_per_s": self.received_bytes / duration / 1e6 if duration > 0 else 0.0,
+            "latency_p50_ms": float(np.percentile(latencies, 50)),
+            "latency_p95_ms": float(np.percentile(latencies, 95)),
+            "latency_p99_ms": float(np.percentile(latencies, 99)),
+            "latency_max_ms": float(latencies.max()),
+            "error": self.error,
+        }
+
+
+class SimulatedViewers:
+    """在独立线程的事件循环中运行N个websockets客户端"""
+
+    def __init__(self, uris: List[str], read_delays: List[float], send_times: Dict[int, float]):
+        self.uris = uris
+        self.send_times = send_times
+        self.stats = [ViewerStats(name=f"viewer-{i}", read_delay=d) for i, d in enumerate(read_delays)]
+        self.loop = None
+        self.thread = None
+        self._stop = None
+
+    def start(self):
+        ready = threading.Event()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            self._stop = asyncio.Event()
+            ready.set()
+            self.loop.run_until_complete(
+                asyncio.gather(*(self._run_viewer(u, s) for u, s in zip(self.uris, self.stats)))
+            )
+            self.loop.close()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        ready.wait()
+
+    def stop(self, timeout: float = 5.0):
+        if self.loop and self._stop:
+            self.loop.call_soon_threadsafe(self._stop.set)
+        if self.thread:
+            self.thread.join(timeout=timeout)
+
+    async def _connect(self, uri: str, retries: int = 50):
+        # max_queue=1：观看端一次只取一帧；websockets默认预读16条消息，
+        # 慢速观看端的延迟会被客户端自己的队列放大，测不出服务端的丢帧
+        for _ in range(retries):
+            try:
+                return await websockets.connect(uri, max_size=None, max_queue=1, close_timeout=0.5)
+            except OSError:
+                await asyncio.sleep(0.1)
+        return await websockets.connect(uri, max_size=None, max_queue=1, close_timeout=0.5)
+
+    async def _run_viewer(self, uri: str, stats: ViewerStats):
+        try:
+            ws = await self._connect(uri)
+        except Exception as e:
+            stats.error = f"connect failed: {e}"
+            return
+        try:
+            while not self._stop.is_set():
+                try:
+                    message = await asyncio.wait_for(ws.recv(), timeout=0.2)
+                except asyncio.TimeoutError:
+                    continue
+                recv_time = time.perf_counter()
+                match = _FRAME_ID_PATTERN.match(message) if isinstance(message, str) else None
+                if match is None:
+                    continue  # 设置等非帧消息
+                stats.received += 1
+                stats.received_bytes += len(message)
+                if stats.first_recv is None:
+                    stats.first_recv = recv_time
+                stats.last_recv = recv_time
+                sent = self.send_times.get(int(match.group(1)))
+                if sent is not None:
+                    stats.latencies_ms.append((recv_time - sent) * 1000)
+                if stats.read_delay > 0:
+                    await asyncio.sleep(stats.read_delay)
+        except websockets.exceptions.ConnectionClosed as e:
+            stats.error = f"connection closed: {e}"
+        finally:
+            await ws.close()
+
+
+def _current_rss_bytes() -> Optional[int]:
+    """读取当前常驻内存（仅Linux），其他平台返回None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def run_load_test(clients: int = 4, slow_clients: int = 1, slow_delay: float = 0.05,
+                  frames: int = 300, fps: float = 60.0, particle_count: int = 2000,
+                  source: Optional[str] = None, port: int = 8765, host: str = "localhost",
+                  drain_seconds: float = 2.0, trace_memory: bool = False,
+                  relay_processes: int = 0) -> Dict:
+    """
+    运行一次负载测试并返回报告字典
+
+    Args:
+        clients: 正常速度的客户端数量
+        slow_clients: 慢速客户端数量
+        slow_delay: 慢速客户端每读一帧后的等待时间（秒）
+        frames: 发送的帧数
+        fps: 目标发送帧率
+        particle_count: 合成粒子流每帧粒子数
+        source: 录制粒子流（.mbcrec目录或.npz）的路径，None表示使用合成流
+        port, host: WebSocket服务器地址
+        drain_seconds: 发送结束后等待客户端读完的时间
+        trace_memory: 是否启用tracemalloc（会增加CPU开销）
+        relay_processes: 大于0时经由该数量的转发进程分发，客户端均匀分配到各转发进程
+    """
+    stream = RecordedParticleStream(source) if source else SyntheticParticleStream(particle_count)
+
+    if trace_memory:
+        tracemalloc.start()
+    rss_start = _current_rss_bytes()
+
+    if relay_processes > 0:
+        renderer = InstrumentedRelayPublisher(relay_count=relay_processes, relay_base_port=port, relay_host=host)
+    else:
+        renderer = InstrumentedThreeJSRenderer(websocket_port=port, host=host)
+    if not renderer.initialize(RenderSettings()):
+        raise RuntimeError("renderer initialization failed")
+
+    read_delays = [0.0] * clients + [slow_delay] * slow_clients
+    uris = [f"ws://{host}:{port + (i % relay_processes if relay_processes > 0 else 0)}"
+            for i in range(len(read_delays))]
+    viewers = SimulatedViewers(uris, read_delays, renderer.send_times)
+    viewers.start()
+
+    # 等待所有客户端（或所有转发进程）连接
+    expected = relay_processes if relay_processes > 0 else len(read_delays)
+    connected = (lambda: len(renderer.relay_connections)) if relay_processes > 0 \
+        else (lambda: len(renderer.connected_clients))
+    deadline = time.perf_counter() + 10.0
+    while connected() < expected and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    time.sleep(0.5 if relay_processes > 0 else 0.0)  # 等待观看端连上转发进程
+
+    camera = CameraState(position=(0, 0, 0), target=(0, 0, 0), up=(0, 0, 1),
+                         elev=37.0, azim=30.0, x_range=(-18, 18), y_range=(-18, 18), z_range=(0, 402))
+    loop_cpu_start = renderer.loop_thread_cpu()
+    traced_start = tracemalloc.get_traced_memory()[0] if trace_memory else None
+
+    frame_interval = 1.0 / fps
+    start = time.perf_counter()
+    next_deadline = start
+    for _ in range(frames):
+        camera.azim = (camera.azim - 1.0) % 360
+        renderer.render_frame(stream.next_frame(), camera)
+        next_deadline += frame_interval
+        sleep_time = next_deadline - time.perf_counter()
+        if sleep_time > 0:
+            time.sleep(sleep_time)
+    send_duration = time.perf_counter() - start
+
+    time.sleep(drain_seconds)
+    loop_cpu = renderer.loop_thread_cpu() - loop_cpu_start
+    rss_end = _current_rss_bytes()
+    if trace_memory:
+        traced_end, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    viewers.stop()
+    renderer.cleanup()
+
+    frames_sent = renderer.frame_count
+    report = {
+        "server": {
+            "frames_sent": frames_sent,
+            "target_fps": fps,
+            "achieved_fps": frames_sent / send_duration if send_duration > 0 else 0.0,
+            "render_frame_cpu_ms": renderer.render_cpu_seconds / max(frames_sent, 1) * 1000,
+            "broadcast_cpu_ms": loop_cpu / max(frames_sent, 1) * 1000,
+            "relay_processes": relay_processes,
+            "rss_start_mb": rss_start / 1e6 if rss_start is not None else None,
+            "rss_growth_mb": (rss_end - rss_start) / 1e6 if rss_start is not None and rss_end is not None else None,
+        },
+        "clients": [s.summary(frames_sent) for s in viewers.stats],
+    }
+    if trace_memory:
+        report["server"]["traced_growth_mb"] = (traced_end - traced_start) / 1e6
+        report["server"]["traced_peak_mb"] = traced_peak / 1e6
+    return report
+
+
+def print_report(report: Dict):
+    server = report["server"]
+    print("\n=== Server ===")
+    print(f"frames sent: {server['frames_sent']}  fps: {server['achieved_fps']:.1f}/{server['target_fps']:.1f}")
+    print(f"CPU per frame: render_frame {server['render_frame_cpu_ms']:.2f} ms, "
+          f"broadcast {server['broadcast_cpu_ms']:.2f} ms")
+    if server["rss_growth_mb"] is not None:
+        print(f"RSS: start {server['rss_start_mb']:.1f} MB, growth {server['rss_growth_mb']:+.1f} MB")
+    if "traced_growth_mb" in server:
+        print(f"traced: growth {server['traced_growth_mb']:+.1f} MB, peak {server['traced_peak_mb']:.1f} MB")
+
+    print("\n=== Clients ===")
+    header = f"{'name':<12}{'delay ms':>9}{'recv':>7}{'missed':>8}{'fps':>8}{'MB/s':>8}" \
+             f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+    print(header)
+    for c in report["clients"]:
+        print(f"{c['name']:<12}{c['read_delay_ms']:>9.1f}{c['frames_received']:>7}{c['frames_missed']:>8}"
+              f"{c['fps']:>8.1f}{c['mb_per_s']:>8.2f}{c['latency_p50_ms']:>9.1f}{c['latency_p95_ms']:>9.1f}"
+              f"{c['latency_p99_ms']:>9.1f}{c['latency_max_ms']:>9.1f}"
+              + (f"  ({c['error']})" if c["error"] else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test ThreeJSRenderer with simulated WebSocket viewers.")
+    parser.add_argument("--clients", type=int, default=4, help="number of full-speed viewers")
+    parser.add_argument("--slow-clients", type=int, default=1, help="number of deliberately slow viewers")
+    parser.add_argument("--slow-delay", type=float, default=0.05, help="seconds a slow viewer waits after each frame")
+    parser.add_argument("--frames", type=int, default=300, help="frames to broadcast")
+    parser.add_argument("--fps", type=float, default=60.0, help="target broadcast frame rate")
+    parser.add_argument("--particles", type=int, default=2000, help="particles per synthetic frame")
+    parser.add_argument("--source", default=None, help="recorded particle stream (.mbcrec or .npz) instead of synthetic frames")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--drain", type=float, default=2.0, help="seconds to wait for viewers after sending")
+    parser.add_argument("--relay", type=int, default=0, help="fan out through this many relay processes")
+    parser.add_argument("--trace-memory", action="store_true", help="track Python allocations with tracemalloc")
+    parser.add_argument("--json", default=None, help="write the report to this JSON file")
+    args = parser.parse_args()
+
+    report = run_load_test(
+        clients=args.clients, slow_clients=args.slow_clients, slow_delay=args.slow_delay,
+        frames=args.frames, fps=args.fps, particle_count=args.particles, source=args.source,
+        port=args.port, host=args.host, drain_seconds=args.drain, trace_memory=args.trace_memory,
+        relay_processes=args.relay,
+    )
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
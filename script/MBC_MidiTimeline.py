@@ -0,0 +1,162 @@
+"""
+预解析的MIDI事件时间轴 - 以音频时钟为准查询每帧的按键状态
+
+原来的做法是在线程中迭代mido的midi.play()：逐条消息sleep，
+时钟与pygame.mixer.music各走各的，时间一长就会漂移。
+MidiTimeline在加载时把文件解析一次，得到按时间排序的NumPy数组
+（时间、音符、力度、通道、按下/松开），每帧只需根据
+pygame.mixer.music.get_pos()做一次向量化的searchsorted：
+- 事件额外按 (音符, 时间) 排序，复合键 note * span + time 使得
+  所有音符在t时刻的最后一个事件可以用一次searchsorted同时找到
+- 平均音量（最近N个note_on的力度均值）用前缀和在O(1)内得到
+- 密集MIDI可以用coalesce()汇总两帧之间的全部按下事件（次数、最大力度）
+
+使用方法：
+    timeline = MidiTimeline.from_midi(MidiFile(path))
+    active, velocity = timeline.key_state(pygame.mixer.music.get_pos() / 1000)
+"""
+
+from typing import Dict, Tuple
+
+import numpy as np
+
+MIDI_NOTE_COUNT = 128
+
+
+class MidiTimeline:
+    """
+    一首MIDI文件的全部音符事件
+
+    note_on力度为0按MIDI惯例视为松开；note_off同样表示松开。
+    """
+
+    def __init__(self, times: np.ndarray, notes: np.ndarray, velocities: np.ndarray,
+                 channels: np.ndarray, is_on: np.ndarray, volume_times: np.ndarray,
+                 volume_values: np.ndarray):
+        """
+        Args:
+            times: 事件时间（秒），按时间排序
+            notes: 音符号 0-127
+            velocities: 力度 0-127
+            channels: MIDI通道 0-15
+            is_on: True表示按下，False表示松开
+            volume_times: 所有note_on消息（包括力度0）的时间，用于平均音量
+            volume_values: 对应的力度
+        """
+        self.times = np.asarray(times, dtype=np.float64)
+        self.notes = np.asarray(notes, dtype=np.int16)
+        self.velocities = np.asarray(velocities, dtype=np.uint8)
+        self.channels = np.asarray(channels, dtype=np.uint8)
+        self.is_on = np.asarray(is_on, dtype=bool)
+        self.volume_times = np.asarray(volume_times, dtype=np.float64)
+        self.volume_values = np.asarray(volume_values, dtype=np.uint8)
+        self.volume_cumsum = np.concatenate(([0], np.cumsum(self.volume_values, dtype=np.int64)))
+
+        # 按 (音符, 时间) 排序的索引，稳定排序保证同一时刻的多个事件保持文件中的顺序
+        self._span = float(self.times[-1]) + 1.0 if len(self.times) else 1.0
+        self._by_note = np.lexsort((self.times, self.notes))
+        self._note_keys = self.notes[self._by_note] * self._span + self.times[self._by_note]
+        self._query_offsets = np.arange(MIDI_NOTE_COUNT, dtype=np.float64) * self._span
+
+    @classmethod
+    def from_midi(cls, midi) -> 'MidiTimeline':
+        """
+        从mido.MidiFile解析（合并所有音轨，按tempo换算为秒）
+        """
+        times, notes, velocities, channels, is_on = [], [], [], [], []
+        volume_times, volume_values = [], []
+        now = 0.0
+        for msg in midi:
+            now += msg.time
+            if msg.type not in ('note_on', 'note_off'):
+                continue
+            times.append(now)
+            notes.append(msg.note)
+            velocities.append(msg.velocity)
+            channels.append(msg.channel)
+            is_on.append(msg.type == 'note_on' and msg.velocity > 0)
+            if msg.type == 'note_on':
+                volume_times.append(now)
+                volume_values.append(msg.velocity)
+        return cls(times, notes, velocities, channels, is_on, volume_times, volume_values)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """构造参数对应的数组，可直接保存后用 MidiTimeline(**arrays) 还原"""
+        return {
+            "times": self.times,
+            "notes": self.notes,
+            "velocities": self.velocities,
+            "channels": self.channels,
+            "is_on": self.is_on,
+            "volume_times": self.volume_times,
+            "volume_values": self.volume_values,
+        }
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    @property
+    def duration(self) -> float:
+        return float(self.times[-1]) if len(self.times) else 0.0
+
+    def note_range(self) -> Tuple[int, int]:
+        """文件中出现的最低、最高音符（没有音符时返回 (127, 0)）"""
+        if not len(self.notes):
+            return 127, 0
+        return int(self.notes.min()), int(self.notes.max())
+
+    def event_count(self, t: float) -> int:
+        """t时刻（含）之前发生的事件数，可用于判断两帧之间是否有新事件"""
+        return int(np.searchsorted(self.times, t, side='right'))
+
+    @property
+    def events_per_second(self) -> float:
+        return len(self.times) / self.duration if self.duration > 0 else 0.0
+
+    def coalesce(self, t0: float, t1: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        汇总 (t0, t1] 之间的所有按下事件，短于一帧的音符也不会丢失
+
+        Returns:
+            (hits, max_velocity): int32[128] 每个音符被按下的次数，uint8[128] 其中的最大力度
+        """
+        start, end = np.searchsorted(self.times, (t0, t1), side='right')
+        window = slice(start, end)
+        pressed = self.is_on[window]
+        notes = self.notes[window][pressed]
+        hits = np.bincount(notes, minlength=MIDI_NOTE_COUNT).astype(np.int32)
+        max_velocity = np.zeros(MIDI_NOTE_COUNT, dtype=np.uint8)
+        np.maximum.at(max_velocity, notes, self.velocities[window][pressed])
+        return hits, max_velocity
+
+    def key_state(self, t: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        t时刻所有128个音符的状态
+
+        Returns:
+            (active, velocity): bool[128]，uint8[128]（未按下的音符力度为0）
+        """
+        active = np.zeros(MIDI_NOTE_COUNT, dtype=bool)
+        velocity = np.zeros(MIDI_NOTE_COUNT, dtype=np.uint8)
+        if not len(self.times):
+            return active, velocity
+
+        # 最后一个事件之后状态不再变化；不截断的话 note*span + t 会落入下一个音符的键范围
+        t = min(t, float(self.times[-1]))
+        last = np.searchsorted(self._note_keys, self._query_offsets + t, side='right') - 1
+        valid = last >= 0
+        events = self._by_note[last[valid]]
+        # 找到的事件可能属于更低的音符（该音符在t之前没有任何事件）
+        same_note = self.notes[events] == np.nonzero(valid)[0]
+        notes = self.notes[events[same_note]]
+        active[notes] = self.is_on[events[same_note]]
+        velocity[notes] = np.where(active[notes], self.velocities[events[same_note]], 0)
+        return active, velocity
+
+    def average_volume(self, t: float, window: int = 240) -> float:
+        """t时刻之前最近window个note_on消息的平均力度"""
+        count = int(np.searchsorted(self.volume_times, t, side='right'))
+        if count == 0:
+            return 0
+        start = max(count - window, 0)
+        return (self.volume_cumsum[count] - self.volume_cumsum[start]) / (count - start)
@@ -0,0 +1,380 @@
+"""
+多柱模式 - 一个进程驱动并排的一排气泡柱
+
+并排显示几首歌（或同一首歌的向上和向下）原来要实例化多个PatternVisualizer3D，
+每个都有自己的画布，每帧每柱各调用一次物理和粒子数据函数。MultiColumnSimulation
+把所有柱的状态叠成第一维为柱的数组，共用一套发射位置布局和编译好的njit函数：
+- 物理：step_columns一次调用完成所有柱的添加气泡和气泡计算，各柱并行（prange）
+- 粒子数据：calculate_pattern_data_3d_columns一次调用生成所有柱的粒子（逐柱串行，
+  单柱的粒子核不并行，拼接结果需要按顺序），按柱平移后拼成一个ParticleBatch，
+  用一个渲染引擎、一个相机显示
+- 缩放器按BubbleGenerator的规则对所有柱向量化更新
+
+MultiColumnPlayer为每柱创建一个TimelinePlayer（按键状态、合并和清零节奏与单柱相同），
+各柱的输入收集后再一起推进。
+
+注意：numba并行线程各有自己的随机数状态，多柱模式下reseed()不能让抖动完全复现。
+
+使用方法：
+    python MBC_MultiColumn.py City_Of_Stars.mid God_Knows.mid --engine threejs
+    python MBC_MultiColumn.py City_Of_Stars.mid --orientation up down      # 同一首歌的两个方向
+    python MBC_MultiColumn.py a.mid b.mid c.mid d.mid --benchmark --duration 30
+"""
+
+import argparse
+import time
+from collections import defaultdict
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+from MBC_Calc import generate_positions, calculate_opacity
+from MBC_config import get_config
+from MBC_PhysicsInterface import NjitPhysicsEngine, physics_params
+from MBC_RenderInterface import CameraState, ParticleBatch
+
+
+class MultiColumnSimulation:
+    """并排的多个气泡柱（没有画布和渲染引擎），所有柱的状态是叠在一起的数组"""
+
+    def __init__(self, orientations: List[str], pos_type: str = None, spacing: float = None):
+        """
+        Args:
+            orientations: 每柱的方向（"up"或"down"），长度即柱数
+            pos_type: 所有柱共用的位置布局
+            spacing: 相邻两柱中心的距离，默认为柱宽的1.2倍
+        """
+        self.config = get_config()
+        visualization = self.config.visualization
+        physics = self.config.physics
+        self.orientations = list(orientations)
+        self.pos_type = pos_type or visualization.default_pos_type
+        self.data_height = visualization.data_height_3d
+        columns = len(self.orientations)
+
+        # 共用的布局（与BubbleColumnSimulation相同）
+        self.position_list, self.offset = generate_positions(
+            visualization.num_positions, 0, 0,
+            visualization.inner_radius, visualization.outer_radius,
+            pos_type=self.pos_type
+        )
+        max_size = max(max(abs(pos[0]) for pos in self.position_list),
+                       max(abs(pos[1]) for pos in self.position_list))
+        self.positions = np.array(self.position_list, dtype=np.int64)
+        self.all_positions_array = np.array(list(set(self.position_list)))
+        self.bubble_positions = np.array(self.position_list)
+        self.bubble_indices = np.arange(len(self.position_list))
+        self.opacity_dict = calculate_opacity()
+        self.physics_engine = NjitPhysicsEngine()
+        self.njit_func = self.physics_engine.njit_func
+        self.data_color = self.config.theme.data_themes_rgb[self.config.theme.default_theme_index]
+
+        # 叠在一起的状态，第一维为柱
+        shape = (columns, self.data_height, max_size + 1, max_size + 1)
+        self.pattern_data = np.zeros(shape, dtype=np.float32)
+        self.pattern_data_thickness = np.zeros(shape, dtype=np.float32)
+        self._bubble_out = (np.zeros(shape, dtype=np.float32), np.zeros(shape, dtype=np.float32))
+        self.snow_ttl = np.zeros((columns, physics.max_snow_stack_height, shape[2], shape[3]), dtype=np.int32)
+        self.max_snow_ttl = physics.max_snow_ttl
+        self.orientation_ints = np.array([0 if o == "up" else 1 for o in self.orientations], dtype=np.int64)
+        self.params = np.tile(physics_params(physics), (columns, 1))
+        self.final_volume = np.zeros((columns, physics.final_volume_history_size))
+        self.final_volume_index = np.zeros(columns, dtype=np.int64)
+        self.scaler = np.ones(columns)
+        self.thickness_list = np.zeros((columns, len(self.position_list)), dtype=np.int64)
+        self.merge_counts = np.zeros((columns, 2), dtype=np.int64)
+        self._variance_sum = np.zeros(columns)
+        self._variance_count = np.zeros(columns, dtype=np.int64)
+
+        # 本帧的输入（set_input写入，step()使用）
+        keys = self.config.audio.pattern_key_count
+        self.bit_arrays = np.zeros((columns, keys), dtype=np.uint8)
+        self.volumes = np.ones((columns, keys), dtype=np.int64)
+        self.hit_counts = np.ones((columns, keys), dtype=np.int32)
+        self.average_volumes = np.zeros(columns)
+
+        spacing = spacing or (max_size + 1) * 1.2
+        self.column_x = ((np.arange(columns) - (columns - 1) / 2) * spacing).astype(np.float32)
+        self.column_ends = np.zeros(columns, dtype=np.int64)
+        limit = max_size // 2
+        self.camera = CameraState(
+            position=(0, 0, 0), target=(0, 0, 0), up=(0, 0, 1),
+            elev=visualization.default_elev, azim=-90.0,
+            x_range=(float(self.column_x[0]) - limit, float(self.column_x[-1]) + limit),
+            y_range=(-limit, limit), z_range=(0, self.data_height + 2)
+        )
+        self.frame = 0
+        self.rendered = True
+        self.timings: Dict[str, float] = defaultdict(float)
+
+    @property
+    def column_count(self) -> int:
+        return len(self.orientations)
+
+    def set_input(self, column: int, bit_array: np.ndarray, volumes: np.ndarray, average_volume: float,
+                  hit_counts: np.ndarray = None):
+        """记录一柱本帧的输入（参数与BubbleColumnSimulation.step相同）"""
+        self.bit_arrays[column] = bit_array
+        self.volumes[column, :len(volumes)] = volumes
+        self.average_volumes[column] = average_volume
+        if hit_counts is None:
+            self.hit_counts[column] = 1
+        else:
+            self.hit_counts[column] = hit_counts
+
+    def warm_up(self):
+        """编译njit函数，之后重置状态"""
+        self.step()
+        self.render_batch()
+        self.reset()
+
+    def reset(self):
+        for array in (self.pattern_data, self.pattern_data_thickness, self.snow_ttl, self.final_volume,
+                      self.final_volume_index, self.thickness_list, self.bit_arrays, self.average_volumes):
+            array.fill(0)
+        self.scaler.fill(1)
+        self.volumes.fill(1)
+        self.hit_counts.fill(1)
+        self.frame = 0
+        self.rendered = True
+        self.timings.clear()
+
+    def reseed(self, seed: int):
+        self.physics_engine.seed(seed)
+
+    def step(self):
+        """所有柱推进一帧（使用set_input记录的输入）"""
+        if not self.rendered:
+            # 上一帧没有渲染：补上向下的柱本应在渲染核中进行的积雪更新
+            for column in np.flatnonzero(self.orientation_ints == 1):
+                self.physics_engine.advance_snow(self.pattern_data[column], self.snow_ttl[column], self.max_snow_ttl)
+        self.rendered = False
+
+        began = time.perf_counter()
+        self.njit_func.step_columns(
+            self.bit_arrays, self.volumes, self.hit_counts, self.average_volumes, self.positions,
+            self.final_volume, self.final_volume_index, self.scaler, self.thickness_list,
+            self.pattern_data, self.pattern_data_thickness, *self._bubble_out,
+            self.data_height, self.orientation_ints, self.merge_counts, self.params,
+            self._variance_sum, self._variance_count
+        )
+        # 与BubbleGenerator.update_scaler_from_variances相同
+        physics = self.config.physics
+        updated = self._variance_count > 0
+        quiet = updated & (self._variance_sum < physics.variance_threshold * np.maximum(self._variance_count, 1))
+        self.scaler[quiet] += physics.scaler_increment
+        loud = updated & ~quiet
+        self.scaler[loud] = np.maximum(0, self.scaler[loud] - physics.scaler_increment)
+        self.timings["physics"] += time.perf_counter() - began
+        self.frame += 1
+
+    def render_batch(self) -> ParticleBatch:
+        """所有柱的粒子，按柱并排；第c柱是批次中 column_ends[c-1]:column_ends[c] 的部分"""
+        began = time.perf_counter()
+        positions = self.all_positions_array
+        data = self.njit_func.calculate_pattern_data_3d_columns(
+            self.pattern_data, self.pattern_data_thickness, self.offset,
+            positions[:, 0], positions[:, 1],
+            self.bubble_positions[:, 0], self.bubble_positions[:, 1],
+            self.bubble_indices, self.opacity_dict, self.data_height,
+            self.orientation_ints, self.snow_ttl, self.max_snow_ttl, self.params,
+            self.column_x, self.column_ends
+        )
+        batch = ParticleBatch.from_njit(*data, np.array(self.data_color))
+        self.rendered = True
+        self.timings["render_data"] += time.perf_counter() - began
+        return batch
+
+    def is_empty(self) -> bool:
+        return not self.pattern_data.any()
+
+    def get_statistics(self) -> Dict:
+        return {
+            "frame": self.frame,
+            "columns": self.column_count,
+            "active_bubbles": [int(count) for count in np.count_nonzero(
+                self.pattern_data.reshape(self.column_count, -1), axis=1)],
+            "snow_active": [int(count) for count in np.count_nonzero(
+                self.snow_ttl.reshape(self.column_count, -1), axis=1)],
+            "scaler": self.scaler.tolist(),
+            "merges": self.merge_counts.tolist(),
+        }
+
+
+class _ColumnInput:
+    """TimelinePlayer看到的模拟：step()只记录这一柱本帧的输入"""
+
+    def __init__(self, simulation: MultiColumnSimulation, column: int):
+        self.simulation = simulation
+        self.column = column
+
+    def step(self, bit_array, volumes, average_volume, hit_counts=None):
+        self.simulation.set_input(self.column, bit_array, volumes, average_volume, hit_counts)
+
+    def reseed(self, seed: int):
+        self.simulation.reseed(seed)
+
+    def set_clock(self, frame: int):
+        self.simulation.frame = frame
+
+    def is_empty(self) -> bool:
+        return not self.simulation.pattern_data[self.column].any()
+
+
+class MultiColumnPlayer:
+    """以虚拟时钟按各柱的MidiTimeline一起驱动MultiColumnSimulation"""
+
+    def __init__(self, simulation: MultiColumnSimulation, timelines: List, fps: float = 60.0):
+        from MBC_Simulation import TimelinePlayer
+        if len(timelines) != simulation.column_count:
+            raise ValueError(f"{len(timelines)} timelines for {simulation.column_count} columns")
+        self.simulation = simulation
+        self.fps = fps
+        self.players = [TimelinePlayer(_ColumnInput(simulation, column), timeline, fps=fps)
+                        for column, timeline in enumerate(timelines)]
+
+    def frames(self, duration: float = None, drain_seconds: float = 10.0) -> Iterator[float]:
+        """逐帧推进所有柱，每帧之后产出虚拟时间；最长的一首结束且气泡消失后停止"""
+        ends = [player.timeline.duration if duration is None else min(duration, player.timeline.duration)
+                for player in self.players]
+        last_end = max(ends)
+        frame = 0
+        while True:
+            t = frame / self.fps
+            if t > last_end and (self.simulation.is_empty() or t > last_end + drain_seconds):
+                return
+            for player, end in zip(self.players, ends):
+                player.step_frame(frame, t <= end)
+            self.simulation.step()
+            yield t
+            frame += 1
+
+
+def benchmark(midi_paths: List[str], orientations: List[str], fps: float, duration: float) -> Dict:
+    """
+    同样的几柱分别用单柱模拟和多柱模拟跑duration秒，比较每帧耗时
+
+    两边的第一帧都不计时：即使warm_up已编译，第一帧的真实输入也不应把编译时间算进任何一边
+    """
+    from MBC_Cache import get_midi_cache
+    from MBC_Simulation import BubbleColumnSimulation, TimelinePlayer
+    timelines = [get_midi_cache().load(path).timeline for path in midi_paths]
+
+    singles = [BubbleColumnSimulation(orientation=orientation) for orientation in orientations]
+    for simulation in singles:
+        simulation.warm_up()
+    players = [TimelinePlayer(simulation, timeline, fps=fps) for simulation, timeline in zip(singles, timelines)]
+    frames = int(duration * fps)
+    began = None
+    for frame in range(frames + 1):
+        for simulation, player in zip(singles, players):
+            player.step_frame(frame, frame / fps <= player.timeline.duration)
+            simulation.render_batch()
+        if began is None:
+            for simulation in singles:
+                simulation.timings.clear()
+            began = time.perf_counter()
+    single_ms = (time.perf_counter() - began) * 1000 / frames
+    single_stages = defaultdict(float)
+    for simulation in singles:
+        for stage, seconds in simulation.timings.items():
+            single_stages[stage] += seconds * 1000 / frames
+
+    wall = MultiColumnSimulation(orientations)
+    wall.warm_up()
+    player = MultiColumnPlayer(wall, timelines, fps)
+    began = None
+    for index, _ in enumerate(player.frames(duration + 1 / fps, drain_seconds=0.0)):
+        wall.render_batch()
+        if began is None:
+            wall.timings.clear()
+            began = time.perf_counter()
+        elif index >= frames:
+            break
+    multi_ms = (time.perf_counter() - began) * 1000 / frames
+    return {
+        "columns": len(orientations),
+        "frames": frames,
+        "separate_ms_per_frame": single_ms,
+        "separate_stage_ms_per_frame": dict(single_stages),
+        "batched_ms_per_frame": multi_ms,
+        "batched_stage_ms_per_frame": {stage: seconds * 1000 / frames for stage, seconds in wall.timings.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate several bubble columns side by side in one process.")
+    parser.add_argument("midi", nargs="+", help="MIDI file per column (cycled if fewer than the orientations)")
+    parser.add_argument("--orientation", nargs="+", choices=["up", "down"], default=None,
+                        help="orientation per column (cycled)")
+    parser.add_argument("--pos-type", choices=["Fibonacci", "circle", "arc"], default=None)
+    parser.add_argument("--fps", type=float, default=60.0)
+    parser.add_argument("--duration", type=float, default=None, help="only simulate the first N seconds")
+    parser.add_argument("--engine", choices=["threejs", "matplotlib_process"], default=None,
+                        help="show the wall in real time through this render engine")
+    parser.add_argument("--out", default=None, help="record the wall to this .mbcrec directory")
+    parser.add_argument("--benchmark", action="store_true", help="compare against separate single-column simulations")
+    args = parser.parse_args()
+
+    orientations = args.orientation or [get_config().visualization.default_orientation]
+    columns = max(len(args.midi), len(orientations))
+    midi_paths = [args.midi[i % len(args.midi)] for i in range(columns)]
+    orientations = [orientations[i % len(orientations)] for i in range(columns)]
+
+    if args.benchmark:
+        result = benchmark(midi_paths, orientations, args.fps, args.duration or 30.0)
+        print(f"{result['columns']} columns, {result['frames']} frames: "
+              f"separate {result['separate_ms_per_frame']:.2f} ms/frame, "
+              f"batched {result['batched_ms_per_frame']:.2f} ms/frame")
+        for label in ("separate", "batched"):
+            print(f"  {label}: " + ", ".join(f"{stage} {ms:.2f} ms"
+                                             for stage, ms in result[f"{label}_stage_ms_per_frame"].items()))
+        return
+
+    from MBC_Cache import get_midi_cache
+    simulation = MultiColumnSimulation(orientations, args.pos_type)
+    simulation.warm_up()
+    player = MultiColumnPlayer(simulation, [get_midi_cache().load(path).timeline for path in midi_paths], args.fps)
+
+    engine = recorder = None
+    if args.engine:
+        from MBC_FrameRecorder import create_player_engine
+        from MBC_RenderInterface import RenderSettings
+        theme = get_config().theme
+        engine = create_player_engine(args.engine)
+        if not engine.initialize(RenderSettings(background_color=theme.fig_themes_rgba[theme.default_theme_index])):
+            return
+    if args.out:
+        from MBC_FrameRecorder import FrameRecorder
+        recorder = FrameRecorder(args.out, fps=args.fps)
+
+    began = time.perf_counter()
+    try:
+        for t in player.frames(args.duration):
+            batch = simulation.render_batch()
+            if recorder is not None:
+                recorder.write(batch, simulation.camera, t)
+            if engine is not None:
+                engine.render_batch(batch, simulation.camera)
+                # 实时显示：按虚拟时钟等待
+                delay = t - (time.perf_counter() - began)
+                if delay > 0:
+                    time.sleep(delay)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if recorder is not None:
+            recorder.close()
+        if engine is not None:
+            engine.cleanup()
+
+    wall_seconds = time.perf_counter() - began
+    frames = max(simulation.frame, 1)
+    print(f"{simulation.column_count} columns, {simulation.frame} frames in {wall_seconds:.2f} s")
+    for stage, seconds in simulation.timings.items():
+        print(f"  {stage:<14}{seconds * 1000 / frames:8.3f} ms/frame")
+    print(f"  final state: {simulation.get_statistics()}")
+
+
+if __name__ == "__main__":
+    main()
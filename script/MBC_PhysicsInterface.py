@@ -9,6 +9,35 @@ from abc import ABC, abstractmethod
 import numpy as np
 from typing import Tuple, List, Dict, Any
 
+from MBC_config import PhysicsConfig, get_config
+
+
+def physics_params(physics: PhysicsConfig) -> np.ndarray:
+    """
+    把PhysicsConfig中由njit函数使用的参数打包成float64数组（顺序见MBC_njit_func的P_*）
+    """
+    import MBC_njit_func as nf
+    params = np.zeros(nf.PHYSICS_PARAM_COUNT, dtype=np.float64)
+    params[nf.P_MAX_VOLUME_UP] = physics.max_volume_up
+    params[nf.P_MAX_VOLUME_DOWN] = physics.max_volume_down
+    params[nf.P_BASE_RISE_SPEED_UP] = physics.base_rise_speed_up
+    params[nf.P_MAX_PROGRESS_BONUS] = physics.max_progress_bonus
+    params[nf.P_THICKNESS_SPEED_FACTOR] = physics.thickness_speed_factor
+    params[nf.P_MAX_THICKNESS_BONUS] = physics.max_thickness_bonus
+    params[nf.P_BASE_RISE_SPEED_DOWN] = physics.base_rise_speed_down
+    params[nf.P_JITTER_RANGE] = physics.jitter_range
+    params[nf.P_MAX_RISE_SPEED] = physics.max_rise_speed
+    params[nf.P_SIZE_INCREASE_FACTOR] = physics.size_increase_factor
+    params[nf.P_MERGE_INTERVAL] = physics.merge_interval
+    params[nf.P_GRID_CELL_SIZE] = physics.grid_cell_size
+    params[nf.P_ADJACENT_GRID_THRESHOLD] = physics.adjacent_grid_threshold
+    params[nf.P_MERGE_DISTANCE_FACTOR] = physics.merge_distance_factor
+    params[nf.P_SNOW_SIZE_MIN] = physics.snow_size_min
+    params[nf.P_SNOW_SIZE_MAX] = physics.snow_size_max
+    params[nf.P_SNOW_OPACITY_MIN] = physics.snow_opacity_min
+    params[nf.P_SNOW_OPACITY_MAX] = physics.snow_opacity_max
+    return params
+
 
 class PhysicsEngineInterface(ABC):
     """
@@ -24,7 +53,7 @@ class PhysicsEngineInterface(ABC):
                    final_volume: np.ndarray, final_volume_index: int, 
                    scaler: float, thickness_list: List[int], 
                    pattern_data: np.ndarray, pattern_data_thickness: np.ndarray, 
-                   orientation: str) -> List[float]:
+                   orientation: str, hit_counts: np.ndarray = None) -> List[float]:
         """
         添加新的气泡模式到物理世界
         
@@ -40,6 +69,7 @@ class PhysicsEngineInterface(ABC):
             pattern_data: 模式数据数组
             pattern_data_thickness: 厚度数据数组
             orientation: 方向 ("up" 或 "down")
+            hit_counts: 每个键位在本帧内被敲击的次数（密集MIDI合并模式），None表示不合并
             
         Returns:
             List[float]: 方差列表
@@ -94,6 +124,31 @@ class PhysicsEngineInterface(ABC):
         """
         pass
 
+    def seed(self, seed: int):
+        """设置物理计算使用的随机数种子（气泡抖动、积雪光粒子）"""
+        np.random.seed(seed)
+
+    def advance_snow(self, pattern_data: np.ndarray, snow_ttl: np.ndarray, max_snow_ttl: int):
+        """
+        不渲染的帧推进积雪TTL
+
+        积雪的消融和堆叠原本在calculate_render_data中完成（向下模式），
+        跳过渲染时调用本函数，状态与渲染时相同。
+        """
+        has_snow = snow_ttl > 0
+        columns = has_snow.any(axis=0)
+        top = np.argmax(has_snow, axis=0)
+        rows, cols = np.nonzero(columns)
+        snow_ttl[top[rows, cols], rows, cols] -= 1
+
+        rows, cols = np.nonzero(pattern_data[-1] > 0)
+        if rows.size:
+            has_snow = snow_ttl[:, rows, cols] > 0
+            highest = np.where(has_snow.any(axis=0), np.argmax(has_snow, axis=0), snow_ttl.shape[0] - 1)
+            new_pos = highest - 1
+            keep = new_pos >= 0
+            snow_ttl[new_pos[keep], rows[keep], cols[keep]] = max_snow_ttl
+
     def get_engine_info(self) -> Dict[str, Any]:
         """
         获取物理引擎信息
@@ -116,31 +171,52 @@ class NjitPhysicsEngine(PhysicsEngineInterface):
     保持原有的高性能特性。
     """
     
-    def __init__(self):
-        """初始化njit物理引擎"""
+    def __init__(self, physics: PhysicsConfig = None):
+        """
+        初始化njit物理引擎
+
+        Args:
+            physics: 物理参数，默认取全局配置
+        """
         # 延迟导入避免循环依赖
         import MBC_njit_func
         self.njit_func = MBC_njit_func
+        self._bubble_out = None     # calculate_bubble的输出缓冲区
+        self._single_hits = None    # 不合并时传给add_pattern的全1敲击次数
+        self.merge_counts = np.zeros(2, dtype=np.int64)  # 累计 [同格合并, 相邻合并]
+        self.set_physics(physics or get_config().physics)
+
+    def set_physics(self, physics: PhysicsConfig):
+        """更换物理参数（下一次调用生效，不需要重新编译）"""
+        self.params = physics_params(physics)
         
     def add_pattern(self, bit_array: np.ndarray, volumes: List[float], 
                    average_volume: float, position_list: List[Tuple[int, int]], 
                    final_volume: np.ndarray, final_volume_index: int, 
                    scaler: float, thickness_list: List[int], 
                    pattern_data: np.ndarray, pattern_data_thickness: np.ndarray, 
-                   orientation: str) -> List[float]:
-        """使用njit函数添加气泡模式"""
+                   orientation: str, hit_counts: np.ndarray = None) -> List[float]:
+        """使用njit函数添加气泡模式（标量统一为float，避免整数参数触发重新编译）"""
+        if hit_counts is None:
+            if self._single_hits is None or len(self._single_hits) != len(bit_array):
+                self._single_hits = np.ones(len(bit_array), dtype=np.int32)
+            hit_counts = self._single_hits
         return self.njit_func.add_pattern(
-            bit_array, volumes, average_volume, position_list, 
-            final_volume, final_volume_index, scaler, thickness_list, 
-            pattern_data, pattern_data_thickness, orientation
+            bit_array, volumes, hit_counts, float(average_volume), position_list,
+            final_volume, final_volume_index, float(scaler), thickness_list,
+            pattern_data, pattern_data_thickness, orientation, self.params
         )
     
     def calculate_bubble(self, pattern_data: np.ndarray, 
                         pattern_data_thickness: np.ndarray, 
                         data_height: int, orientation: str = "up") -> Tuple[np.ndarray, np.ndarray]:
-        """使用njit函数计算气泡物理"""
-        return self.njit_func.calculate_bubble(
-            pattern_data, pattern_data_thickness, data_height, orientation
+        """使用njit函数计算气泡物理（返回的数组由引擎复用，在下一次调用前有效）"""
+        if self._bubble_out is None or self._bubble_out[0].shape != pattern_data.shape:
+            self._bubble_out = (np.zeros(pattern_data.shape, dtype=np.float32),
+                                np.zeros(pattern_data.shape, dtype=np.float32))
+        return self.njit_func.calculate_bubble_into(
+            pattern_data, pattern_data_thickness, data_height, orientation, *self._bubble_out,
+            self.merge_counts, self.params
         )
     
     def calculate_render_data(self, pattern_data: np.ndarray, 
@@ -156,9 +232,14 @@ class NjitPhysicsEngine(PhysicsEngineInterface):
             pattern_data, pattern_data_thickness, offset,
             all_positions_x, all_positions_y,
             position_index_keys_x, position_index_keys_y, position_index_values,
-            opacity_values, data_height, orientation_int, snow_ttl, max_snow_ttl
+            opacity_values, data_height, orientation_int, snow_ttl, max_snow_ttl, self.params
         )
     
+    def seed(self, seed: int):
+        """同时设置numpy和njit函数中的随机数种子"""
+        np.random.seed(seed)
+        self.njit_func.seed_random(seed)
+
     def get_engine_info(self) -> Dict[str, Any]:
         """获取njit引擎信息"""
         return {
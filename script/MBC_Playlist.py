@@ -0,0 +1,165 @@
+"""
+播放列表与后台预取 - 歌曲之间无缝切换
+
+原来每首歌结束后要重新打开对话框、新建MidiVisualizer、重新初始化mixer、
+解析MIDI并加载人声音频，这些都串行发生在两首歌之间。
+播放列表模式下：
+- 当前歌曲播放时，后台线程提前准备下一首（解析/读取缓存的时间轴、
+  定位人声音频并取得其响度包络，非流式播放时预先解码）
+- 切换歌曲只是换一个PreparedSong对象，mixer不重新初始化，
+  气泡柱也不清空，模拟连续进行
+- 列表中也可以有纯音频文件（WAV/MP3），按键由AudioAnalysis从频谱中检测，
+  预取时就开始分析
+
+使用方法：
+    在文件对话框中选择多个MIDI文件，或
+    midi_visualizer.visualize_playlist(Playlist(paths))
+"""
+
+import os
+import os.path as os_path
+from concurrent.futures import ThreadPoolExecutor, Future
+from dataclasses import dataclass
+from typing import List, Optional, Dict, Tuple
+
+import pygame
+
+from MBC_AudioAnalysis import AudioAnalysis, is_audio_file
+from MBC_Cache import get_midi_cache
+from MBC_MidiTimeline import MidiTimeline
+from MBC_VocalEnvelope import VocalEnvelope, load_vocal_envelope
+
+
+@dataclass
+class PreparedSong:
+    """可以立即开始播放的一首歌"""
+    midi_path: str
+    timeline: MidiTimeline              # 纯音频文件为AudioAnalysis（接口相同）
+    piano_midi_path: str                # 交给pygame.mixer.music播放的文件
+    vocal_path: Optional[str] = None
+    vocal_type: Optional[str] = None    # "wav" 或 "mp3"
+    vocal_sound: Optional[pygame.mixer.Sound] = None
+    analysis: Optional[AudioAnalysis] = None
+    vocal_envelope: Optional[VocalEnvelope] = None
+
+    def close(self):
+        """停止仍在进行的音频分析"""
+        if self.analysis is not None:
+            self.analysis.stop()
+
+
+def find_vocal_file(midi_path: str, config) -> Tuple[Optional[str], Optional[str]]:
+    """
+    查找与MIDI配套的人声音频：<名称>_vocal.wav / <名称>_vocal.mp3，默认曲目使用配置中的WAV
+
+    Returns:
+        (路径, 类型)，没有人声时为 (None, None)
+    """
+    base_path = os.path.splitext(midi_path)[0] + '_vocal'
+    wav_path = base_path + '.wav'
+    mp3_path = base_path + '.mp3'
+    if midi_path == config.file_paths.default_midi_path and os_path.exists(config.file_paths.default_wav_path):
+        return config.file_paths.default_wav_path, "wav"
+    if os_path.exists(wav_path):
+        return wav_path, "wav"
+    if os_path.exists(mp3_path):
+        return mp3_path, "mp3"
+    return None, None
+
+
+def prepare_song(midi_path: str, decode_vocal: bool = True) -> PreparedSong:
+    """
+    准备一首歌：读取（或生成）缓存的时间轴和钢琴MIDI，定位人声音频并取得响度包络
+
+    Args:
+        midi_path: MIDI文件路径
+        decode_vocal: 是否预先解码人声（需要mixer已初始化，且之后不再重新初始化）
+    """
+    from MBC_config import get_config
+    config = get_config()
+    if is_audio_file(midi_path):
+        # 纯音频：音频本身由mixer.music播放，分析先领先播放位置一小段
+        analysis = AudioAnalysis.from_config(midi_path, config)
+        analysis.start()
+        analysis.wait_ready(config.audio.analysis_start_ahead_s)
+        return PreparedSong(midi_path, analysis, midi_path, analysis=analysis)
+    entry = get_midi_cache().load(midi_path)
+    vocal_path, vocal_type = find_vocal_file(midi_path, config)
+    song = PreparedSong(midi_path, entry.timeline, entry.piano_midi_path, vocal_path, vocal_type)
+    if vocal_path and config.audio.vocal_envelope_enabled:
+        delay_ms = config.audio.wav_delay_ms if vocal_type == "wav" else config.audio.mp3_delay_ms
+        try:
+            song.vocal_envelope = load_vocal_envelope(vocal_path, vocal_type, delay_ms / 1000.0, config)
+        except Exception as e:
+            print(f"Could not compute the loudness envelope of {vocal_path}: {e}")
+    # 流式播放的人声在起播时才打开，不需要预先解码
+    if decode_vocal and vocal_path and not config.audio.vocal_streaming and pygame.mixer.get_init():
+        song.vocal_sound = pygame.mixer.Sound(vocal_path)
+    return song
+
+
+class Playlist:
+    """按顺序播放的歌曲列表"""
+
+    def __init__(self, paths: List[str], loop: bool = False):
+        self.paths = list(paths)
+        self.index = 0
+        self.loop = loop
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def current(self) -> Optional[str]:
+        return self.paths[self.index] if self.index < len(self.paths) else None
+
+    def peek_next(self) -> Optional[str]:
+        """下一首的路径（不移动位置），没有下一首时返回None"""
+        if self.index + 1 < len(self.paths):
+            return self.paths[self.index + 1]
+        if self.loop and self.paths:
+            return self.paths[0]
+        return None
+
+    def advance(self) -> Optional[str]:
+        if self.index + 1 >= len(self.paths) and self.loop:
+            self.index = 0
+        else:
+            self.index += 1
+        return self.current()
+
+
+def _close_prepared(future: Future):
+    if future.exception() is None:
+        future.result().close()
+
+
+class SongPrefetcher:
+    """在后台线程中准备歌曲"""
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mbc-prefetch")
+        self._futures: Dict[str, Future] = {}
+
+    def prefetch(self, midi_path: str):
+        """开始在后台准备一首歌（已在准备中则忽略）"""
+        if midi_path not in self._futures:
+            self._futures[midi_path] = self.executor.submit(prepare_song, midi_path, True)
+
+    def get(self, midi_path: str) -> PreparedSong:
+        """
+        取得准备好的歌曲；没有预取过的歌曲在调用线程上准备（不预先解码人声）
+        """
+        future = self._futures.pop(midi_path, None)
+        if future is not None:
+            try:
+                return future.result()
+            except Exception as e:
+                print(f"Prefetch of {midi_path} failed, loading directly: {e}")
+        return prepare_song(midi_path, decode_vocal=False)
+
+    def shutdown(self):
+        for future in self._futures.values():
+            if not future.cancel():
+                future.add_done_callback(_close_prepared)
+        self._futures.clear()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,261 @@
+"""
+进程外Matplotlib渲染器 - 把绘图从MIDI/音频/物理所在的进程中移走
+
+MatplotlibRenderer.render_frame中的散点绘制和update_pattern中的plt.pause
+在每帧的大部分时间里持有GIL，会挤占MIDI线程导致音符时序延迟。
+ProcessMatplotlibRenderer在子进程中运行Qt/Matplotlib窗口（BubbleColumnWindow）：
+- 主进程不创建figure，每帧只把粒子批次、相机状态和钢琴按键写入共享内存帧环（一次内存拷贝）
+- 子进程按自己的节奏读取最新帧绘制，落后时直接跳到最新帧
+- 子进程还没消费完上一帧时，主进程也可以跳过发布
+- 窗口中的鼠标键盘交互通过管道发回主进程，由PatternVisualizer3D更新视角和坐标范围
+
+使用方法：
+    在配置中设置 visualization.render_engine = "matplotlib_process"
+"""
+
+import multiprocessing
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from MBC_RenderInterface import (RenderEngineInterface, RenderableParticle, ParticleBatch,
+                                 CameraState, RenderSettings)
+from MBC_SharedFrameRing import SharedFrameRingWriter
+
+
+class ProcessMatplotlibRenderer(RenderEngineInterface):
+    """
+    在子进程中绘制的Matplotlib渲染引擎
+
+    通过共享内存帧环传递粒子、相机和钢琴按键，通过管道传递设置更新等控制消息和窗口交互事件。
+    """
+
+    def __init__(self, window_options: Optional[Dict[str, Any]] = None,
+                 max_particles: int = 50000, max_pending_frames: int = 1,
+                 forward_events: bool = True):
+        """
+        初始化进程外渲染器
+
+        Args:
+            window_options: 子进程中BubbleColumnWindow的参数（除on_event外）
+            max_particles: 每帧最大粒子数
+            max_pending_frames: 子进程落后超过该帧数时主进程跳过发布
+            forward_events: 是否把窗口交互事件发回主进程（需要调用poll_window_events读取）
+        """
+        self.window_options = window_options or {}
+        self.max_particles = max_particles
+        self.max_pending_frames = max_pending_frames
+        self.forward_events = forward_events
+        self.settings = None
+        self.is_initialized = False
+
+        self.ring = None
+        self.process = None
+        self.control = None
+        self.rendered_frame = None
+        self.window_closed = False
+        self.skipped_frames = 0
+        # 最近一次的钢琴按键（清空帧不带按键状态，沿用上一次的显示）
+        self.piano_keys = np.zeros(128, dtype=np.uint8)
+        self.piano_volumes = np.zeros(128, dtype=np.uint8)
+
+    def initialize(self, settings: RenderSettings) -> bool:
+        """创建共享内存帧环并启动渲染子进程"""
+        try:
+            self.settings = settings
+            self.ring = SharedFrameRingWriter(slot_count=4, max_particles=self.max_particles)
+
+            ctx = multiprocessing.get_context("spawn")
+            self.control, child_control = ctx.Pipe()
+            self.rendered_frame = ctx.Value("q", -1, lock=False)
+            self.process = ctx.Process(
+                target=_run_render_process,
+                args=(self.ring.name, settings, child_control, self.rendered_frame,
+                      self.window_options, self.forward_events),
+                daemon=True
+            )
+            self.process.start()
+            self.window_closed = False
+            self.is_initialized = True
+            return True
+
+        except Exception as e:
+            print(f"进程外Matplotlib渲染器初始化失败: {e}")
+            self.process = None
+            self.cleanup()
+            return False
+
+    def render_frame(self, particles: List[RenderableParticle],
+                     camera: CameraState) -> bool:
+        """把粒子列表转换为批次后发布"""
+        batch = ParticleBatch.from_particles(particles)
+        return self.render_batch(batch, camera)
+
+    def render_batch(self, batch: ParticleBatch, camera: CameraState) -> bool:
+        """写入共享内存帧环；子进程明显落后时跳过本帧"""
+        if not self.is_initialized or not self.process.is_alive():
+            return False
+        pending = self.ring.frame_index - 1 - self.rendered_frame.value
+        if self.rendered_frame.value >= 0 and pending > self.max_pending_frames:
+            self.skipped_frames += 1
+            return True
+        self.ring.publish(batch, camera, self.piano_keys, self.piano_volumes)
+        return True
+
+    def set_piano_keys(self, bit_array, volumes):
+        """设置随之后各帧发布的钢琴按键"""
+        count = min(len(bit_array), len(self.piano_keys))
+        self.piano_keys[:count] = bit_array[:count]
+        self.piano_volumes[:count] = volumes[:count]
+
+    def poll_window_events(self) -> List[Tuple[str, Any]]:
+        """读取子进程窗口发回的交互事件 (名称, 值)"""
+        events = []
+        if not self.is_initialized:
+            return events
+        try:
+            while self.control.poll():
+                name, value = self.control.recv()
+                if name == "close":
+                    self.window_closed = True
+                events.append((name, value))
+        except (OSError, EOFError):
+            self.window_closed = True
+        return events
+
+    def is_window_open(self) -> bool:
+        """子进程窗口是否仍然打开"""
+        return (self.is_initialized and not self.window_closed
+                and self.process is not None and self.process.is_alive())
+
+    def reopen(self, window_options: Optional[Dict[str, Any]] = None) -> bool:
+        """窗口被关闭后重新启动渲染子进程"""
+        if window_options is not None:
+            self.window_options = window_options
+        self.cleanup()
+        return self.initialize(self.settings)
+
+    def set_camera(self, camera: CameraState):
+        """相机状态随每帧一起发布，无需单独发送"""
+        pass
+
+    def clear_scene(self):
+        self._send_control("clear", None)
+
+    def update_settings(self, settings: RenderSettings):
+        self.settings = settings
+        self._send_control("settings", settings)
+
+    def _send_control(self, command: str, payload):
+        if self.is_initialized and self.process.is_alive():
+            try:
+                self.control.send((command, payload))
+            except (OSError, EOFError):
+                pass
+
+    def cleanup(self):
+        """关闭子进程窗口并释放共享内存"""
+        if self.process is not None:
+            self._send_control("close", None)
+            self.process.join(timeout=2.0)
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+        self.is_initialized = False
+
+    def get_engine_info(self) -> Dict[str, Any]:
+        return {
+            "name": "Out-of-process Matplotlib Renderer",
+            "version": "1.0.0",
+            "backend": "matplotlib",
+            "capabilities": [
+                "3d_rendering",
+                "scatter_plots",
+                "transparency",
+                "color_blending",
+                "shared_memory_transport",
+                "frame_skipping"
+            ],
+            "performance": "medium",
+            "platform": "desktop",
+            "frame_ring": self.ring.name if self.ring else None,
+            "skipped_frames": self.skipped_frames
+        }
+
+
+def _run_render_process(ring_name: str, settings: RenderSettings, control,
+                        rendered_frame, window_options: Dict[str, Any], forward_events: bool):
+    """子进程入口：创建气泡柱窗口，定时绘制帧环中的最新帧"""
+    import matplotlib
+    matplotlib.use('Qt5Agg')
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5 import QtCore
+    from MBC_RenderInterface import MatplotlibRenderer
+    from MBC_SharedFrameRing import SharedFrameRingReader
+    from MBC_Window import BubbleColumnWindow
+
+    app = QApplication.instance() or QApplication([])
+    reader = SharedFrameRingReader(ring_name)
+
+    last_zoom = [None]
+
+    def on_event(name, value):
+        # 视角、坐标范围等由主进程计算，随之后的帧写回帧环。
+        # 鼠标移动时区域不变的zoom事件不重复发送，避免主进程忙于其他事情时管道被填满
+        if name == "zoom":
+            if value == last_zoom[0]:
+                return
+            last_zoom[0] = value
+        else:
+            last_zoom[0] = None
+        if forward_events:
+            try:
+                control.send((name, value))
+            except (OSError, EOFError):
+                pass
+        if name == "close":
+            app.quit()
+
+    window = BubbleColumnWindow(on_event=on_event, **window_options)
+    renderer = MatplotlibRenderer()
+    renderer.initialize(settings)
+    renderer.set_matplotlib_objects(window.fig, window.ax)
+    renderer.update_settings(settings)
+
+    def on_timer():
+        while control.poll():
+            try:
+                command, payload = control.recv()
+            except (EOFError, OSError):
+                app.quit()
+                return
+            if command == "close":
+                app.quit()
+                return
+            if command == "settings":
+                renderer.update_settings(payload)
+                window.set_background(payload.background_color)
+            elif command == "clear":
+                renderer.clear_scene()
+
+        # 只绘制最新帧：落后时自动跳过中间帧。复制后绘制，避免绘制期间被覆盖
+        ring_frame = reader.read_latest(copy=True)
+        if ring_frame is None or ring_frame.frame == rendered_frame.value:
+            return
+        renderer.render_batch(ring_frame.batch, ring_frame.camera)
+        if window.visualize_piano:
+            window.update_piano(ring_frame.piano_keys, ring_frame.piano_volumes)
+        window.fig.canvas.draw_idle()
+        rendered_frame.value = ring_frame.frame
+
+    timer = QtCore.QTimer()
+    timer.timeout.connect(on_timer)
+    timer.start(max(1, int(1000 / max(settings.frame_rate_limit, 1))))
+    window.fig.show()
+    app.exec_()
+
+    timer.stop()
+    reader.close()
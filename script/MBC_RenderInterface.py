@@ -59,6 +59,24 @@ class CameraState:
     y_range: Tuple[float, float]          # y轴范围  
     z_range: Tuple[float, float]          # z轴范围
 
+    def to_array(self) -> Tuple[float, ...]:
+        """仰角、方位角和三个轴的范围（8个数，共享内存帧环和帧录制使用）"""
+        return (self.elev, self.azim,
+                self.x_range[0], self.x_range[1],
+                self.y_range[0], self.y_range[1],
+                self.z_range[0], self.z_range[1])
+
+    @classmethod
+    def from_array(cls, values) -> 'CameraState':
+        """to_array()的逆变换（位置、目标和向上向量取Matplotlib默认值）"""
+        return cls(
+            position=(0, 0, 0), target=(0, 0, 0), up=(0, 0, 1),
+            elev=float(values[0]), azim=float(values[1]),
+            x_range=(float(values[2]), float(values[3])),
+            y_range=(float(values[4]), float(values[5])),
+            z_range=(float(values[6]), float(values[7]))
+        )
+
 
 @dataclass
 class RenderSettings:
@@ -74,6 +92,76 @@ class RenderSettings:
     frame_rate_limit: int = 60
 
 
+@dataclass
+class ParticleBatch:
+    """
+    列式粒子批次
+
+    与RenderableParticle描述相同的数据，但按列存放在numpy数组中，
+    颜色在构建时只计算一次。适合共享内存、录制、多后端分发等场景。
+    """
+    x: np.ndarray                 # float32 (N,)
+    y: np.ndarray                 # float32 (N,)
+    z: np.ndarray                 # float32 (N,)
+    sizes: np.ndarray             # float32 (N,)
+    colors: np.ndarray            # float32 (N, 4) RGBA
+    opacity: np.ndarray           # float32 (N,)
+    types: np.ndarray             # int32 (N,) 0=bubble, 1=light, 2=lampshade
+    blend_factors: np.ndarray     # float32 (N,)
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    @classmethod
+    def from_njit(cls, all_x: np.ndarray, all_y: np.ndarray, all_z: np.ndarray,
+                  all_sizes: np.ndarray, all_opacity: np.ndarray,
+                  all_types: np.ndarray, all_color_blend_factors: np.ndarray,
+                  base_color: Tuple[float, float, float]) -> 'ParticleBatch':
+        """由calculate_pattern_data_3d的输出构建批次（计算颜色）"""
+        import MBC_njit_func
+        if len(all_x) == 0:
+            colors = np.empty((0, 4), dtype=np.float32)
+        else:
+            colors = MBC_njit_func.calculate_particle_colors_njit(
+                all_types, all_color_blend_factors, all_opacity,
+                base_color[0], base_color[1], base_color[2]
+            )
+        return cls(all_x, all_y, all_z, all_sizes, colors,
+                   all_opacity, all_types, all_color_blend_factors)
+
+    @classmethod
+    def from_particles(cls, particles: List[RenderableParticle]) -> 'ParticleBatch':
+        """由RenderableParticle列表构建批次（逐粒子接口的渲染器转为列式数据时使用）"""
+        n = len(particles)
+        positions = np.array([p.position for p in particles], dtype=np.float32).reshape(n, 3)
+        return cls(
+            x=positions[:, 0], y=positions[:, 1], z=positions[:, 2],
+            sizes=np.array([p.size for p in particles], dtype=np.float32),
+            colors=np.array([p.color for p in particles], dtype=np.float32).reshape(n, 4),
+            opacity=np.array([p.opacity for p in particles], dtype=np.float32),
+            types=np.array([{"light": 1, "lampshade": 2}.get(p.particle_type, 0) for p in particles], dtype=np.int32),
+            blend_factors=np.array([p.blend_factor for p in particles], dtype=np.float32)
+        )
+
+    def to_particles(self) -> List[RenderableParticle]:
+        """转换为RenderableParticle列表（供逐粒子接口的渲染器使用）"""
+        type_names = {0: "bubble", 1: "light", 2: "lampshade"}
+        colors = self.colors
+        return [
+            RenderableParticle(
+                position=(float(self.x[i]), float(self.y[i]), float(self.z[i])),
+                size=float(self.sizes[i]),
+                color=(float(colors[i, 0]), float(colors[i, 1]),
+                       float(colors[i, 2]), float(colors[i, 3])),
+                opacity=float(self.opacity[i]),
+                particle_type=type_names.get(self.types[i], "unknown"),
+                blend_factor=float(self.blend_factors[i]),
+                object_id=i
+            )
+            for i in range(len(self.x))
+        ]
+
+
 class RenderEngineInterface(ABC):
     """
     渲染引擎抽象基类
@@ -109,6 +197,22 @@ class RenderEngineInterface(ABC):
             bool: 渲染是否成功
         """
         pass
+
+    def render_batch(self, batch: ParticleBatch, camera: CameraState) -> bool:
+        """
+        渲染一个列式粒子批次
+        
+        默认转换为粒子列表后调用render_frame，
+        支持列式数据的渲染器可以覆盖此方法以避免逐粒子转换。
+        
+        Args:
+            batch: 粒子批次
+            camera: 相机状态
+            
+        Returns:
+            bool: 渲染是否成功
+        """
+        return self.render_frame(batch.to_particles(), camera)
     
     @abstractmethod
     def set_camera(self, camera: CameraState):
@@ -208,19 +312,29 @@ class MatplotlibRenderer(RenderEngineInterface):
         if not self.is_initialized or self.ax is None:
             return False
             
+        if not particles:
+            self.ax.cla()
+            return True
+        
+        # 转换粒子数据为numpy数组（保持与原有性能）
+        positions = np.array([p.position for p in particles])
+        sizes = np.array([p.size for p in particles])
+        colors = np.array([p.color for p in particles])
+        return self._draw_scatter(positions[:, 0], positions[:, 1], positions[:, 2], sizes, colors, camera)
+
+    def render_batch(self, batch: ParticleBatch, camera: CameraState) -> bool:
+        """直接使用列式数据绘制，避免逐粒子转换"""
+        if not self.is_initialized or self.ax is None:
+            return False
+        return self._draw_scatter(batch.x, batch.y, batch.z, batch.sizes, batch.colors, camera)
+
+    def _draw_scatter(self, x, y, z, sizes, colors, camera: CameraState) -> bool:
+        """绘制散点并应用相机"""
         try:
             # 清空当前绘图
             self.ax.cla()
             
-            if not particles:
-                return True
-            
-            # 转换粒子数据为numpy数组（保持与原有性能）
-            positions = np.array([p.position for p in particles])
-            sizes = np.array([p.size for p in particles])
-            colors = np.array([p.color for p in particles])
-            
-            if len(positions) > 0:
+            if len(x) > 0:
                 # 设置绘图参数
                 scatter_kwargs = {
                     'c': colors,
@@ -232,7 +346,7 @@ class MatplotlibRenderer(RenderEngineInterface):
                 }
                 
                 # 绘制散点图
-                self.ax.scatter(positions[:, 0], positions[:, 1], positions[:, 2], **scatter_kwargs)
+                self.ax.scatter(x, y, z, **scatter_kwargs)
             
             # 设置相机
             self._apply_camera_state(camera)
@@ -328,32 +442,10 @@ def convert_njit_to_particles(all_x: np.ndarray, all_y: np.ndarray, all_z: np.nd
     
     这个函数桥接了现有的njit输出和新的渲染接口
     """
-    particles = []
-    
     if len(all_x) == 0:
-        return particles
-    
-    # 计算颜色（使用现有的njit颜色计算逻辑）
-    import MBC_njit_func
-    colors = MBC_njit_func.calculate_particle_colors_njit(
-        all_types, all_color_blend_factors, all_opacity,
-        base_color[0], base_color[1], base_color[2]
-    )
-    
-    # 类型映射
-    type_names = {0: "bubble", 1: "light", 2: "lampshade"}
-    
-    for i in range(len(all_x)):
-        particle = RenderableParticle(
-            position=(float(all_x[i]), float(all_y[i]), float(all_z[i])),
-            size=float(all_sizes[i]),
-            color=(float(colors[i, 0]), float(colors[i, 1]), 
-                  float(colors[i, 2]), float(colors[i, 3])),
-            opacity=float(all_opacity[i]),
-            particle_type=type_names.get(all_types[i], "unknown"),
-            blend_factor=float(all_color_blend_factors[i]),
-            object_id=i
-        )
-        particles.append(particle)
+        return []
     
-    return particles
+    return ParticleBatch.from_njit(
+        all_x, all_y, all_z, all_sizes, all_opacity,
+        all_types, all_color_blend_factors, base_color
+    ).to_particles()
@@ -0,0 +1,436 @@
+"""
+本地渲染任务服务 - 供网页工具通过HTTP请求离线模拟
+
+HTTP接口接收上传的MIDI和渲染选项，任务排队后由固定数量的工作进程执行
+（MBC_Headless.run_headless）。每个工作进程启动时编译一次njit函数，
+之后每个任务只重置已预热的模拟，不再付出进程启动和编译的代价。
+
+接口（均返回JSON，文件除外）：
+    POST   /jobs?name=song.mid&fps=60&duration=30&orientation=up&record=1
+           请求体为MIDI文件本身，返回202和任务
+    GET    /jobs                      所有任务
+    GET    /jobs/<id>                 状态、进度（0-1）、报告和结果文件列表
+    GET    /jobs/<id>/files/<路径>     下载结果文件（report.json、录制目录中的文件等）
+    DELETE /jobs/<id>                 取消排队中的任务，或删除已结束的任务及其文件
+
+每个任务的文件在 <jobs_dir>/<id>/ 下：input.mid、job.json、report.json，
+以及record=1时的粒子帧录制 recording.mbcrec/（可用MBC_FrameRecorder回放或MBC_Export导出）。
+
+使用方法：
+    python MBC_RenderService.py --port 8780 --workers 2
+    curl --data-binary @City_Of_Stars.mid "http://127.0.0.1:8780/jobs?name=City_Of_Stars.mid&record=1"
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from MBC_Cache import atomic_write
+from MBC_config import get_config
+
+FINISHED_STATES = ("done", "failed", "cancelled")
+PROGRESS_INTERVAL = 0.5  # 工作进程报告进度的间隔（墙钟秒）
+
+
+def parse_options(query: Dict[str, List[str]]) -> Dict:
+    """把查询参数转换为渲染选项，无效时抛出ValueError"""
+    visualization = get_config().visualization
+
+    def value(name, default=None):
+        return query[name][-1] if name in query else default
+
+    options = {
+        "orientation": value("orientation", visualization.default_orientation),
+        "pos_type": value("pos_type", visualization.default_pos_type),
+        "fps": float(value("fps", 60.0)),
+        "duration": float(value("duration")) if value("duration") else None,
+        "drain": float(value("drain", 10.0)),
+        "record": value("record", "0").lower() in ("1", "true", "yes"),
+    }
+    if options["orientation"] not in ("up", "down"):
+        raise ValueError(f"orientation must be up or down, not {options['orientation']!r}")
+    if options["pos_type"] not in ("Fibonacci", "circle", "arc"):
+        raise ValueError(f"pos_type must be Fibonacci, circle or arc, not {options['pos_type']!r}")
+    if not 1.0 <= options["fps"] <= 240.0:
+        raise ValueError("fps must be between 1 and 240")
+    if options["duration"] is not None and options["duration"] <= 0:
+        raise ValueError("duration must be positive")
+    if options["drain"] < 0:
+        raise ValueError("drain must not be negative")
+    return options
+
+
+# ---- 工作进程 ----
+
+_worker = {}
+
+
+def _init_worker(events):
+    """预热njit函数；之后按方向和布局复用模拟"""
+    from MBC_Simulation import BubbleColumnSimulation
+    simulation = BubbleColumnSimulation()
+    simulation.warm_up()
+    _worker["events"] = events
+    _worker["simulations"] = {(simulation.orientation, simulation.pos_type): simulation}
+
+
+def _simulation(orientation: str, pos_type: str):
+    from MBC_Simulation import BubbleColumnSimulation
+    simulations = _worker["simulations"]
+    key = (orientation, pos_type)
+    if key not in simulations:
+        # njit函数已在本进程编译过，新建模拟只需分配数组
+        simulations[key] = BubbleColumnSimulation(orientation=orientation, pos_type=pos_type)
+    return simulations[key]
+
+
+def run_job(job_id: str, job_dir: str, options: Dict) -> Dict:
+    """在工作进程中执行一个任务，返回报告；进度通过事件队列发回主进程"""
+    from MBC_Cache import get_midi_cache
+    from MBC_Headless import run_headless
+    events = _worker["events"]
+    midi_path = os.path.join(job_dir, "input.mid")
+    timeline = get_midi_cache().load(midi_path).timeline
+    end = timeline.duration if options["duration"] is None else min(options["duration"], timeline.duration)
+    events.put((job_id, "running", {"song_seconds": timeline.duration, "end": end}))
+
+    report = run_headless(
+        midi_path, fps=options["fps"], duration=options["duration"],
+        out_path=os.path.join(job_dir, "recording.mbcrec") if options["record"] else None,
+        drain_seconds=options["drain"], report_interval=PROGRESS_INTERVAL,
+        simulation=_simulation(options["orientation"], options["pos_type"]),
+        progress=lambda frame, t: events.put((job_id, "progress", {"frame": frame, "time": t})),
+    )
+    report["midi_path"] = "input.mid"
+    if report["out_path"]:
+        report["out_path"] = "recording.mbcrec"
+    with open(os.path.join(job_dir, "report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+# ---- 主进程 ----
+
+class RenderJobService:
+    """
+    任务表、进程池和进度事件；HTTP处理线程和进程池回调线程都通过锁访问任务表
+
+    排队的任务留在pending中，进程池中最多同时有workers个任务：
+    ProcessPoolExecutor会提前把提交的任务送进调用队列，之后就无法取消。
+    """
+
+    def __init__(self, jobs_dir: str = None, workers: int = None, max_queued: int = None):
+        config = get_config().service
+        self.jobs_dir = jobs_dir or config.jobs_dir
+        self.workers = workers or config.workers or os.cpu_count() or 1
+        self.max_queued = max_queued or config.max_queued
+        self.keep_finished = config.keep_finished
+        self.jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self.pending = deque()
+        self.futures = {}
+        # 任务完成得足够快时add_done_callback会在持锁的线程上直接调用_finish
+        self._lock = threading.RLock()
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self._load_jobs()
+
+        # 与其他子进程一样使用spawn
+        self._context = multiprocessing.get_context("spawn")
+        self.events = self._context.Queue()
+        self.executor = self._create_executor()
+        self._event_thread = threading.Thread(target=self._read_events, daemon=True)
+        self._event_thread.start()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=self._context,
+                                   initializer=_init_worker, initargs=(self.events,))
+
+    def _load_jobs(self):
+        """读取上次运行留下的任务；未结束的任务已随进程池丢失"""
+        entries = []
+        for name in os.listdir(self.jobs_dir):
+            path = os.path.join(self.jobs_dir, name, "job.json")
+            try:
+                with open(path, encoding="utf-8") as f:
+                    entries.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        for job in sorted(entries, key=lambda job: job["submitted"]):
+            if job["status"] not in FINISHED_STATES:
+                job.update(status="failed", error="service restarted before the job finished",
+                           finished=time.time())
+                self._save_job(job)
+            self.jobs[job["id"]] = job
+
+    def job_dir(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, job_id)
+
+    def _save_job(self, job: Dict):
+        def write_job(target):
+            with open(target, "w", encoding="utf-8") as f:
+                json.dump(job, f, indent=2)
+        atomic_write(os.path.join(self.job_dir(job["id"]), "job.json"), write_job)
+
+    def submit(self, midi_data: bytes, name: str, options: Dict) -> Dict:
+        """
+        排队一个任务
+
+        Raises:
+            ValueError: 不是MIDI文件
+            RuntimeError: 排队的任务已满
+        """
+        if not midi_data.startswith(b"MThd"):
+            raise ValueError("request body is not a standard MIDI file")
+        with self._lock:
+            if len(self.pending) >= self.max_queued:
+                raise RuntimeError(f"{len(self.pending)} jobs already queued")
+            job_id = uuid.uuid4().hex[:12]
+            job = {
+                "id": job_id, "name": os.path.basename(name or "input.mid"), "options": options,
+                "status": "queued", "progress": 0.0, "submitted": time.time(),
+                "started": None, "finished": None, "error": None, "report": None, "files": [],
+            }
+            os.makedirs(self.job_dir(job_id))
+            with open(os.path.join(self.job_dir(job_id), "input.mid"), "wb") as f:
+                f.write(midi_data)
+            self._save_job(job)
+            self.jobs[job_id] = job
+            self.pending.append(job_id)
+            self._dispatch()
+            return dict(job)
+
+    def _dispatch(self):
+        """把排队的任务交给空闲的工作进程（调用方持有锁）"""
+        while self.pending and len(self.futures) < self.workers:
+            job_id = self.pending.popleft()
+            executor = self.executor
+            future = executor.submit(run_job, job_id, self.job_dir(job_id), self.jobs[job_id]["options"])
+            self.futures[job_id] = future
+            future.add_done_callback(lambda done, job_id=job_id, executor=executor:
+                                     self._finish(job_id, done, executor))
+
+    def _read_events(self):
+        while True:
+            event = self.events.get()
+            if event is None:
+                return
+            job_id, kind, values = event
+            with self._lock:
+                job = self.jobs.get(job_id)
+                if job is None or job["status"] in FINISHED_STATES:
+                    continue
+                if kind == "running":
+                    job.update(status="running", started=time.time(), end=values["end"],
+                               song_seconds=values["song_seconds"])
+                elif kind == "progress":
+                    # 音乐结束后还有一段等待气泡消失的时间，完成前最多显示0.99
+                    job["frame"] = values["frame"]
+                    job["progress"] = min(0.99, values["time"] / job["end"]) if job.get("end") else 0.0
+
+    def _finish(self, job_id: str, future, executor: ProcessPoolExecutor):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            self.futures.pop(job_id, None)
+            if job is not None and not future.cancelled():
+                try:
+                    job["report"] = future.result()
+                    job.update(status="done", progress=1.0)
+                except BrokenProcessPool:
+                    job.update(status="failed", error="render worker exited unexpectedly")
+                    # 工作进程崩溃后整个进程池不可再用；同一进程池的其他任务也会走到这里，只重建一次
+                    if executor is self.executor:
+                        print("Render worker crashed, restarting the process pool")
+                        executor.shutdown(wait=False)
+                        self.executor = self._create_executor()
+                except Exception as e:
+                    job.update(status="failed", error=str(e) or type(e).__name__)
+                self._close_job(job)
+            self._dispatch()
+
+    def _close_job(self, job: Dict):
+        """记录已结束的任务并清理旧任务（调用方持有锁）"""
+        job["finished"] = time.time()
+        job["files"] = self._list_files(job["id"])
+        self._save_job(job)
+        self._prune()
+
+    def _list_files(self, job_id: str) -> List[str]:
+        root = self.job_dir(job_id)
+        files = []
+        for folder, _, names in os.walk(root):
+            for name in names:
+                if name != "job.json":
+                    files.append(os.path.relpath(os.path.join(folder, name), root).replace(os.sep, "/"))
+        return sorted(files)
+
+    def _prune(self):
+        """只保留最近keep_finished个已结束的任务（调用方持有锁）"""
+        finished = [job_id for job_id, job in self.jobs.items() if job["status"] in FINISHED_STATES]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self.jobs[job_id]
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def list(self) -> List[Dict]:
+        with self._lock:
+            return [{key: job.get(key) for key in ("id", "name", "status", "progress", "submitted", "finished")}
+                    for job in self.jobs.values()]
+
+    def file_path(self, job_id: str, relative: str) -> Optional[str]:
+        """结果文件的绝对路径；不存在或越出任务目录时返回None"""
+        root = os.path.realpath(self.job_dir(job_id))
+        path = os.path.realpath(os.path.join(root, relative))
+        if job_id not in self.jobs or not path.startswith(root + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """
+        取消排队中的任务或删除已结束的任务
+
+        Returns:
+            "cancelled"、"deleted"，正在运行无法取消时为"running"，任务不存在时为None
+        """
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] in FINISHED_STATES:
+                del self.jobs[job_id]
+                shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+                return "deleted"
+            if job_id not in self.pending:
+                return "running"
+            self.pending.remove(job_id)
+            job["status"] = "cancelled"
+            self._close_job(job)
+            return "cancelled"
+
+    def shutdown(self):
+        with self._lock:
+            self.pending.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.events.put(None)
+        self._event_thread.join(timeout=2.0)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "MBCRenderService/1.0"
+
+    @property
+    def service(self) -> RenderJobService:
+        return self.server.service
+
+    def _send_json(self, status: int, data):
+        body = json.dumps(data, indent=2).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, message: str):
+        self._send_json(status, {"error": message})
+
+    def _route(self):
+        return [unquote(part) for part in urlsplit(self.path).path.strip("/").split("/") if part]
+
+    def do_GET(self):
+        parts = self._route()
+        if parts in ([], ["jobs"]):
+            return self._send_json(200, self.service.list())
+        if len(parts) < 2 or parts[0] != "jobs":
+            return self._error(404, "not found")
+        if len(parts) == 2:
+            job = self.service.get(parts[1])
+            return self._send_json(200, job) if job else self._error(404, "no such job")
+        if parts[2] != "files" or len(parts) < 4:
+            return self._error(404, "not found")
+        path = self.service.file_path(parts[1], "/".join(parts[3:]))
+        if path is None:
+            return self._error(404, "no such file")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json" if path.endswith(".json") else "application/octet-stream")
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.end_headers()
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def do_POST(self):
+        if self._route() != ["jobs"]:
+            return self._error(404, "not found")
+        length = self.headers.get("Content-Length")
+        if length is None:
+            return self._error(411, "Content-Length required")
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            return self._error(400, "invalid Content-Length")
+        if length > get_config().service.max_upload_mb * 1024 * 1024:
+            return self._error(413, "MIDI file too large")
+        data = self.rfile.read(length)
+        query = parse_qs(urlsplit(self.path).query)
+        try:
+            job = self.service.submit(data, query.get("name", ["input.mid"])[-1], parse_options(query))
+        except ValueError as e:
+            return self._error(400, str(e))
+        except RuntimeError as e:
+            return self._error(503, str(e))
+        self._send_json(202, job)
+
+    def do_DELETE(self):
+        parts = self._route()
+        if len(parts) != 2 or parts[0] != "jobs":
+            return self._error(404, "not found")
+        result = self.service.cancel(parts[1])
+        if result is None:
+            return self._error(404, "no such job")
+        if result == "running":
+            return self._error(409, "job is already running")
+        self._send_json(200, {"id": parts[1], "result": result})
+
+
+def serve(host: str = None, port: int = None, workers: int = None, jobs_dir: str = None):
+    config = get_config().service
+    service = RenderJobService(jobs_dir, workers)
+    server = ThreadingHTTPServer((host or config.host, port or config.port), _Handler)
+    server.service = service
+    print(f"Render service on http://{server.server_address[0]}:{server.server_address[1]}/jobs "
+          f"({service.workers} workers, jobs in {service.jobs_dir})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve headless render jobs over a local HTTP API.")
+    parser.add_argument("--host", default=None)
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None, help="simulation processes (default: service.workers)")
+    parser.add_argument("--jobs-dir", default=None, help="job files (default: service.jobs_dir)")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.jobs_dir)
+
+
+if __name__ == "__main__":
+    main()
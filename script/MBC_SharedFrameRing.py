@@ -0,0 +1,357 @@
+"""
+共享内存粒子帧环形缓冲区 - 供进程外消费者零拷贝读取
+
+PatternVisualizer3D在calculate_pattern_data_3d之后，把每帧的粒子列
+（位置、大小、颜色、透明度、类型、混合因子）和相机状态写入
+multiprocessing.shared_memory中的环形缓冲区（进程外绘制时还带上钢琴按键）。录制器、渲染器、分析器、
+Three.js转发等读取端可以在其他进程中直接挂载，不受可视化进程GIL影响。
+
+内存布局：
+    [全局头 64B][槽0][槽1]...[槽N-1]
+    槽 = [槽头 384B][x][y][z][size][opacity][blend][type][colors(N,4)]
+
+同步方式（单写多读的seqlock）：
+- 写入前把槽头seq设为奇数，写完后设为 2*frame+2
+- 读取端确认槽头seq与期望帧一致，使用完数据后再次校验即可确认未被覆盖
+
+使用方法：
+    writer = SharedFrameRingWriter("mbc_frames")
+    writer.publish(batch, camera)
+
+    reader = SharedFrameRingReader("mbc_frames")
+    frame = reader.read_latest()
+    ...使用 frame.batch ...
+    if frame.is_valid(): ...数据在使用期间未被覆盖
+"""
+
+import argparse
+import atexit
+import time
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Optional
+
+import numpy as np
+
+from MBC_RenderInterface import ParticleBatch, CameraState
+
+
+RING_MAGIC = 0x5243424D  # "MBCR"
+RING_VERSION = 2
+
+_GLOBAL_HEADER_DTYPE = np.dtype([
+    ("magic", "<u4"),
+    ("version", "<u4"),
+    ("slot_count", "<u4"),
+    ("max_particles", "<u4"),
+    ("published", "<u8"),       # 已发布的帧数（最新帧序号 + 1）
+    ("reserved", "<u1", (40,)),
+])
+
+_SLOT_HEADER_DTYPE = np.dtype([
+    ("seq", "<u8"),             # seqlock序号：奇数=写入中，2*frame+2=帧frame已就绪
+    ("frame", "<u8"),
+    ("count", "<u4"),
+    ("padding", "<u4"),
+    ("camera", "<f8", (8,)),    # elev, azim, x_range, y_range, z_range
+    ("piano_keys", "<u1", (128,)),     # 每个MIDI音符是否按下
+    ("piano_volumes", "<u1", (128,)),  # 每个MIDI音符的力度
+    ("reserved", "<u1", (40,)),
+])
+
+# 每个槽中的粒子列：(名称, dtype, 每粒子分量数)
+_COLUMNS = (
+    ("x", np.float32, 1),
+    ("y", np.float32, 1),
+    ("z", np.float32, 1),
+    ("sizes", np.float32, 1),
+    ("opacity", np.float32, 1),
+    ("blend_factors", np.float32, 1),
+    ("types", np.int32, 1),
+    ("colors", np.float32, 4),
+)
+
+
+def _slot_size(max_particles: int) -> int:
+    return _SLOT_HEADER_DTYPE.itemsize + sum(
+        np.dtype(dtype).itemsize * width * max_particles for _, dtype, width in _COLUMNS
+    )
+
+
+class _RingLayout:
+    """在共享内存上建立全局头、槽头和各粒子列的numpy视图"""
+
+    def __init__(self, shm: shared_memory.SharedMemory, slot_count: int, max_particles: int):
+        self.shm = shm
+        self.slot_count = slot_count
+        self.max_particles = max_particles
+        self.header = np.ndarray((), dtype=_GLOBAL_HEADER_DTYPE, buffer=shm.buf, offset=0)
+
+        slot_size = _slot_size(max_particles)
+        self.slot_headers = []
+        self.slot_columns = []
+        for slot in range(slot_count):
+            offset = _GLOBAL_HEADER_DTYPE.itemsize + slot * slot_size
+            self.slot_headers.append(np.ndarray((), dtype=_SLOT_HEADER_DTYPE, buffer=shm.buf, offset=offset))
+            offset += _SLOT_HEADER_DTYPE.itemsize
+            columns = {}
+            for name, dtype, width in _COLUMNS:
+                shape = (max_particles, width) if width > 1 else (max_particles,)
+                columns[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+                offset += np.dtype(dtype).itemsize * width * max_particles
+            self.slot_columns.append(columns)
+
+    @staticmethod
+    def total_size(slot_count: int, max_particles: int) -> int:
+        return _GLOBAL_HEADER_DTYPE.itemsize + slot_count * _slot_size(max_particles)
+
+    def release(self):
+        # 释放所有指向共享内存的视图，否则无法关闭
+        self.header = None
+        self.slot_headers = []
+        self.slot_columns = []
+
+
+class SharedFrameRingWriter:
+    """
+    环形缓冲区写入端（每个环只允许一个写入端）
+
+    超过max_particles的粒子会被截断。
+    """
+
+    def __init__(self, name: Optional[str] = None, slot_count: int = 4, max_particles: int = 50000):
+        """
+        创建共享内存环
+
+        Args:
+            name: 共享内存名称（None表示自动生成，可通过self.name获取）
+            slot_count: 槽数量，读取端最多可以落后 slot_count-1 帧
+            max_particles: 每帧最大粒子数
+        """
+        size = _RingLayout.total_size(slot_count, max_particles)
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # 同名共享内存可能属于仍在运行的另一个可视化进程，不能直接删除
+            raise FileExistsError(
+                f"shared memory '{name}' already exists; another writer may be running. "
+                f"If it was left behind by a crashed process, remove /dev/shm/{name} and retry"
+            ) from None
+        self.name = self.shm.name
+        self.layout = _RingLayout(self.shm, slot_count, max_particles)
+        self.layout.header["magic"] = RING_MAGIC
+        self.layout.header["version"] = RING_VERSION
+        self.layout.header["slot_count"] = slot_count
+        self.layout.header["max_particles"] = max_particles
+        self.layout.header["published"] = 0
+        self.frame_index = 0
+        self.truncated_frames = 0
+        atexit.register(self.close)
+
+    def publish(self, batch: ParticleBatch, camera: CameraState,
+                piano_keys: Optional[np.ndarray] = None, piano_volumes: Optional[np.ndarray] = None) -> int:
+        """
+        写入一帧
+
+        Args:
+            batch: 粒子批次
+            camera: 相机状态
+            piano_keys: 每个MIDI音符是否按下（None表示全部松开）
+            piano_volumes: 每个MIDI音符的力度
+        Returns:
+            int: 本帧序号
+        """
+        layout = self.layout
+        frame = self.frame_index
+        slot = frame % layout.slot_count
+        header = layout.slot_headers[slot]
+        columns = layout.slot_columns[slot]
+
+        count = len(batch)
+        if count > layout.max_particles:
+            count = layout.max_particles
+            self.truncated_frames += 1
+
+        header["seq"] = 2 * frame + 1
+        for name, _, _ in _COLUMNS:
+            columns[name][:count] = getattr(batch, name)[:count]
+        header["frame"] = frame
+        header["count"] = count
+        header["camera"] = camera.to_array()
+        _write_keys(header["piano_keys"], piano_keys)
+        _write_keys(header["piano_volumes"], piano_volumes)
+        header["seq"] = 2 * frame + 2
+        layout.header["published"] = frame + 1
+
+        self.frame_index += 1
+        return frame
+
+    def close(self):
+        """关闭并删除共享内存"""
+        if self.shm is None:
+            return
+        self.layout.release()
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+        self.shm = None
+
+
+def _write_keys(target: np.ndarray, values: Optional[np.ndarray]):
+    """按音符写入槽头，超过128个的部分截断、不足的部分补零"""
+    target[:] = 0
+    if values is not None:
+        count = min(len(values), len(target))
+        target[:count] = values[:count]
+
+
+@dataclass
+class RingFrame:
+    """读取端拿到的一帧（batch中的数组默认是共享内存的零拷贝视图）"""
+    frame: int
+    batch: ParticleBatch
+    camera: CameraState
+    piano_keys: Optional[np.ndarray] = None
+    piano_volumes: Optional[np.ndarray] = None
+    _header: Optional[np.ndarray] = None
+
+    def is_valid(self) -> bool:
+        """数据在读取后是否仍未被写入端覆盖（复制出的帧总是有效）"""
+        return self._header is None or int(self._header["seq"]) == 2 * self.frame + 2
+
+
+class SharedFrameRingReader:
+    """环形缓冲区读取端，可在任意进程中挂载"""
+
+    def __init__(self, name: str):
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13：挂载端也会被resource_tracker登记，退出时会误删共享内存，
+            # 挂载期间临时跳过登记
+            from multiprocessing import resource_tracker
+            register = resource_tracker.register
+            resource_tracker.register = lambda res_name, rtype: \
+                None if rtype == "shared_memory" else register(res_name, rtype)
+            try:
+                self.shm = shared_memory.SharedMemory(name=name)
+            finally:
+                resource_tracker.register = register
+        header = np.ndarray((), dtype=_GLOBAL_HEADER_DTYPE, buffer=self.shm.buf, offset=0)
+        if int(header["magic"]) != RING_MAGIC or int(header["version"]) != RING_VERSION:
+            self.shm.close()
+            raise ValueError(f"shared memory '{name}' is not a particle frame ring")
+        self.layout = _RingLayout(self.shm, int(header["slot_count"]), int(header["max_particles"]))
+        self.last_frame = -1
+
+    @property
+    def published(self) -> int:
+        return int(self.layout.header["published"])
+
+    def read_frame(self, frame: int, copy: bool = False) -> Optional[RingFrame]:
+        """
+        读取指定序号的帧
+
+        Args:
+            frame: 帧序号
+            copy: True时复制数据并在返回前校验；False时返回零拷贝视图，
+                  调用方使用完后应调用RingFrame.is_valid()确认
+        Returns:
+            Optional[RingFrame]: 帧已被覆盖或尚未发布时返回None
+        """
+        layout = self.layout
+        slot = frame % layout.slot_count
+        header = layout.slot_headers[slot]
+        expected = 2 * frame + 2
+        if int(header["seq"]) != expected:
+            return None
+
+        count = int(header["count"])
+        columns = layout.slot_columns[slot]
+        arrays = {name: columns[name][:count] for name, _, _ in _COLUMNS}
+        camera_values = header["camera"].copy()
+        piano_keys = header["piano_keys"].copy()
+        piano_volumes = header["piano_volumes"].copy()
+        if copy:
+            arrays = {name: array.copy() for name, array in arrays.items()}
+        if int(header["seq"]) != expected:
+            return None
+
+        ring_frame = RingFrame(
+            frame=frame,
+            batch=ParticleBatch(**arrays),
+            camera=CameraState.from_array(camera_values),
+            piano_keys=piano_keys,
+            piano_volumes=piano_volumes,
+            _header=None if copy else header
+        )
+        self.last_frame = frame
+        return ring_frame
+
+    def read_latest(self, copy: bool = False) -> Optional[RingFrame]:
+        """读取最新发布的帧（跳过中间帧）"""
+        for _ in range(3):
+            published = self.published
+            if published == 0:
+                return None
+            ring_frame = self.read_frame(published - 1, copy=copy)
+            if ring_frame is not None:
+                return ring_frame
+        return None
+
+    def read_next(self, copy: bool = False) -> Optional[RingFrame]:
+        """按顺序读取下一帧；落后超过槽数时跳到仍可读取的最早帧"""
+        published = self.published
+        next_frame = self.last_frame + 1
+        if next_frame >= published:
+            return None
+        oldest = max(0, published - self.layout.slot_count + 1)
+        return self.read_frame(max(next_frame, oldest), copy=copy)
+
+    def close(self):
+        self.layout.release()
+        self.shm.close()
+
+
+def main():
+    """简单的读取端示例：统计帧率和粒子数"""
+    from MBC_config import get_config
+    parser = argparse.ArgumentParser(description="Attach to a particle frame ring and report its frame rate.")
+    parser.add_argument("--name", default=get_config().streaming.frame_ring_name)
+    parser.add_argument("--interval", type=float, default=1.0, help="report interval in seconds")
+    args = parser.parse_args()
+
+    reader = SharedFrameRingReader(args.name)
+    print(f"Attached to '{args.name}': {reader.layout.slot_count} slots, "
+          f"{reader.layout.max_particles} particles per slot")
+    try:
+        last_report = time.perf_counter()
+        frames, particles, torn = 0, 0, 0
+        while True:
+            ring_frame = reader.read_next()
+            if ring_frame is None:
+                time.sleep(0.001)
+            else:
+                count = len(ring_frame.batch)
+                if ring_frame.is_valid():
+                    frames += 1
+                    particles += count
+                else:
+                    torn += 1
+            now = time.perf_counter()
+            if now - last_report >= args.interval:
+                fps = frames / (now - last_report)
+                average = particles / frames if frames else 0
+                print(f"frame {reader.last_frame}: {fps:.1f} fps, {average:.0f} particles/frame, {torn} overwritten")
+                frames, particles, torn = 0, 0, 0
+                last_report = now
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+
+
+if __name__ == "__main__":
+    main()
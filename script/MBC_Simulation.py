@@ -0,0 +1,341 @@
+"""
+无界面气泡柱模拟 - 不依赖Qt/Matplotlib窗口和音频
+
+PatternVisualizer3D把模拟状态、matplotlib画布和渲染引擎绑在一起，
+MidiVisualizer又以mixer的播放时钟推进帧，因此离开桌面环境就无法运行。
+BubbleColumnSimulation只组合模拟需要的部分：
+- 位置布局（generate_positions）、BubbleGenerator、PhysicsHandler、物理引擎接口
+- step()与PatternVisualizer3D共用step_bubble_column：添加气泡、计算物理、更新缩放器
+- render_batch()与_draw_pattern相同，得到ParticleBatch（不绘制）
+- get_state()/set_state()保存和恢复完整状态（MBC_Keyframes据此实现跳转）
+
+TimelinePlayer以固定帧率的虚拟时钟按MidiTimeline驱动模拟，
+按键状态到模式帧的处理与MidiVisualizer共用KeyStateDriver（事件之后的帧发送新模式，
+之后每zero_pattern_interval帧清零一次，密集MIDI合并两帧之间的音符）。
+没有等待，CPU能跑多快就跑多快。
+
+使用方法：
+    sim = BubbleColumnSimulation()
+    sim.warm_up()
+    player = TimelinePlayer(sim, get_midi_cache().load("song.mid").timeline, fps=60)
+    for frame in player.frames():
+        batch = sim.render_batch()
+"""
+
+import time
+from collections import defaultdict
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+
+from MBC_BubbleGenerator import BubbleGenerator
+from MBC_Calc import generate_positions, calculate_opacity
+from MBC_config import get_config
+from MBC_KeyState import KeyStateDriver
+from MBC_PhysicsHandler import PhysicsHandler
+from MBC_PhysicsInterface import NjitPhysicsEngine, PhysicsEngineInterface
+from MBC_RenderInterface import CameraState, ParticleBatch
+
+
+def step_bubble_column(physics_engine: PhysicsEngineInterface, generator: BubbleGenerator,
+                       pattern_data: np.ndarray, pattern_data_thickness: np.ndarray,
+                       data_height: int, orientation: str,
+                       bit_array: np.ndarray, volumes: np.ndarray, average_volume: float,
+                       hit_counts: np.ndarray = None, timings: Dict[str, float] = None):
+    """
+    气泡柱推进一帧：清空发射层、添加气泡、计算物理并写回、更新缩放器
+
+    PatternVisualizer3D和BubbleColumnSimulation共用。
+    timings: 传入时累加 "add_pattern" 和 "calculate_bubble" 的耗时（秒）
+    """
+    edge = -1 if orientation == "down" else 0
+    pattern_data[edge] = 0
+    pattern_data_thickness[edge] = 0
+
+    began = time.perf_counter()
+    variances = physics_engine.add_pattern(
+        bit_array, volumes, average_volume,
+        generator.position_list, generator.final_volume, generator.final_volume_index,
+        generator.scaler, generator.thickness_list,
+        pattern_data, pattern_data_thickness, orientation, hit_counts
+    )
+    # add_pattern修改了音量历史但不返回新的索引
+    active_count = int(np.count_nonzero(bit_array))
+    if active_count:
+        generator.final_volume_index = (generator.final_volume_index + active_count) % len(generator.final_volume)
+    added = time.perf_counter()
+
+    pattern_data_temp, pattern_data_thickness_temp = physics_engine.calculate_bubble(
+        pattern_data, pattern_data_thickness, data_height, orientation=orientation
+    )
+    pattern_data[1:data_height] = pattern_data_temp[1:data_height]
+    pattern_data_thickness[1:data_height] = pattern_data_thickness_temp[1:data_height]
+    generator.update_scaler_from_variances(variances)
+
+    if timings is not None:
+        timings["add_pattern"] += added - began
+        timings["calculate_bubble"] += time.perf_counter() - added
+
+
+class BubbleColumnSimulation:
+    """气泡柱的模拟状态（没有画布和渲染引擎）"""
+
+    def __init__(self, orientation: str = None, pos_type: str = None,
+                 physics_engine: PhysicsEngineInterface = None):
+        self.config = get_config()
+        visualization = self.config.visualization
+        self.orientation = orientation or visualization.default_orientation
+        self.pos_type = pos_type or visualization.default_pos_type
+        self.data_height = visualization.data_height_3d
+
+        self.position_list, self.offset = generate_positions(
+            visualization.num_positions, 0, 0,
+            visualization.inner_radius, visualization.outer_radius,
+            pos_type=self.pos_type
+        )
+        max_size = max(max(abs(pos[0]) for pos in self.position_list),
+                       max(abs(pos[1]) for pos in self.position_list))
+        self.all_positions_array = np.array(list(set(self.position_list)))
+        self.bubble_positions = np.array(self.position_list)
+        self.bubble_indices = np.arange(len(self.position_list))
+        self.opacity_dict = calculate_opacity()
+
+        self.bubble_generator = BubbleGenerator(self.position_list, self.orientation)
+        self.physics_handler = PhysicsHandler(
+            data_height=self.data_height,
+            max_x=max_size,
+            max_y=max_size,
+            all_positions=self.all_positions_array,
+            bubble_positions=self.bubble_positions,
+            bubble_indices=self.bubble_indices,
+            opacity_dict=self.opacity_dict,
+            offset=self.offset,
+            orientation=self.orientation
+        )
+        self.physics_engine = physics_engine or NjitPhysicsEngine()
+        self.data_color = self.config.theme.data_themes_rgb[self.config.theme.default_theme_index]
+
+        # 与PatternVisualizer3D默认视图相同的相机（录制的帧需要）
+        limit = max_size // (2 if self.orientation == "up" else 3)
+        self.camera = CameraState(
+            position=(0, 0, 0), target=(0, 0, 0), up=(0, 0, 1),
+            elev=visualization.default_elev, azim=visualization.default_azim_angle,
+            x_range=(-limit, limit), y_range=(-limit, limit), z_range=(0, self.data_height + 2)
+        )
+        self.azim_speed = visualization.default_azim_speed
+        self.frame = 0
+        self.rendered = True        # 当前帧是否已计算粒子数据（向下时积雪在其中更新）
+        self.timings: Dict[str, float] = defaultdict(float)
+
+    @property
+    def pattern_data(self) -> np.ndarray:
+        return self.physics_handler.pattern_data
+
+    @property
+    def pattern_data_thickness(self) -> np.ndarray:
+        return self.physics_handler.pattern_data_thickness
+
+    def warm_up(self):
+        """编译njit函数（类型与运行时一致），之后重置状态"""
+        pattern = np.zeros(120, dtype=np.uint8)
+        volumes = np.ones(120, dtype=np.int64)
+        self.step(pattern, volumes, 0.0)
+        self.render_batch()
+        self.reset()
+
+    def reset(self):
+        self.physics_handler.reset_physics()
+        self.bubble_generator.reset_generator()
+        self.camera.azim = self.config.visualization.default_azim_angle
+        self.frame = 0
+        self.rendered = True
+        self.timings.clear()
+
+    def reseed(self, seed: int):
+        """设置物理随机数种子（气泡抖动等），之后的模拟可以复现"""
+        self.physics_engine.seed(seed)
+
+    def get_state(self) -> Dict[str, np.ndarray]:
+        """
+        完整的模拟状态，可由set_state()恢复
+
+        体素和积雪只保存非零部分（通常只占几百个），各项都是numpy数组或标量，可以直接np.savez。
+        随机数状态不在其中：需要复现时由调用方在同一帧设置相同的种子。
+        """
+        handler, generator = self.physics_handler, self.bubble_generator
+        heights = handler.pattern_data.reshape(-1)
+        thicknesses = handler.pattern_data_thickness.reshape(-1)
+        occupied = np.flatnonzero((heights != 0) | (thicknesses != 0)).astype(np.int32)
+        snow = handler.snow_ttl.reshape(-1)
+        snowed = np.flatnonzero(snow).astype(np.int32)
+        return {
+            "frame": np.int64(self.frame),
+            "azim": np.float64(self.camera.azim),
+            "rendered": np.bool_(self.rendered),
+            "voxel_index": occupied,
+            "voxel_height": heights[occupied],
+            "voxel_thickness": thicknesses[occupied],
+            "snow_index": snowed,
+            "snow_ttl": snow[snowed],
+            "scaler": np.float64(generator.scaler),
+            "final_volume": np.array(generator.final_volume, copy=True),
+            "final_volume_index": np.int64(generator.final_volume_index),
+            "thickness_list": np.array(generator.thickness_list, dtype=np.int64),
+        }
+
+    def set_state(self, state: Dict[str, np.ndarray]):
+        """恢复get_state()保存的状态（原地写入，物理数组的引用不变）"""
+        handler, generator = self.physics_handler, self.bubble_generator
+        for array, values in ((handler.pattern_data, state["voxel_height"]),
+                              (handler.pattern_data_thickness, state["voxel_thickness"])):
+            array.fill(0)
+            array.reshape(-1)[state["voxel_index"]] = values
+        handler.snow_ttl.fill(0)
+        handler.snow_ttl.reshape(-1)[state["snow_index"]] = state["snow_ttl"]
+        generator.scaler = float(state["scaler"])
+        generator.final_volume[:] = state["final_volume"]
+        generator.final_volume_index = int(state["final_volume_index"])
+        generator.thickness_list[:] = [int(value) for value in state["thickness_list"]]
+        self.frame = int(state["frame"])
+        self.camera.azim = float(state["azim"])
+        self.rendered = bool(state["rendered"])
+
+    def set_clock(self, frame: int):
+        """把帧计数和相机方位角设为从第0帧模拟到frame帧时的值（不改变气泡状态）"""
+        self.frame = frame
+        self.camera.azim = (self.config.visualization.default_azim_angle - frame * self.azim_speed) % 360
+
+    def memory_frames(self) -> int:
+        """
+        状态能记住多少帧：最慢的气泡穿过整个柱子的帧数（向下时加上积雪存在的时间）
+
+        从任意时刻提前这么多帧开始模拟，之后的画面与从头模拟在统计上一致
+        （具体位置仍有随机抖动），分段并行导出据此决定预热长度。
+        """
+        physics = self.config.physics
+        if self.orientation == "up":
+            return int(np.ceil(self.data_height / physics.base_rise_speed_up))
+        slowest = max(physics.base_rise_speed_down - physics.jitter_range, 1.0)
+        return int(np.ceil(self.data_height / slowest)) + physics.max_snow_ttl
+
+    def step(self, bit_array: np.ndarray, volumes: np.ndarray, average_volume: float,
+             hit_counts: np.ndarray = None):
+        """推进一帧（与PatternVisualizer3D.update_pattern相同的step_bubble_column）"""
+        if not self.rendered and self.orientation == "down":
+            # 上一帧没有渲染：补上本应在渲染核中进行的积雪更新
+            self.physics_engine.advance_snow(self.pattern_data, self.physics_handler.snow_ttl,
+                                             self.physics_handler.MAX_SNOW_TTL)
+        self.rendered = False
+        step_bubble_column(self.physics_engine, self.bubble_generator,
+                           self.pattern_data, self.pattern_data_thickness, self.data_height, self.orientation,
+                           bit_array, volumes, average_volume, hit_counts, self.timings)
+        # 视角与窗口中一样每帧旋转
+        self.camera.azim = (self.camera.azim - self.azim_speed) % 360
+        self.frame += 1
+
+    def render_batch(self) -> ParticleBatch:
+        """当前状态的粒子批次"""
+        began = time.perf_counter()
+        positions = self.all_positions_array
+        handler = self.physics_handler
+        data = self.physics_engine.calculate_render_data(
+            self.pattern_data, self.pattern_data_thickness, self.offset,
+            positions[:, 0], positions[:, 1],
+            self.bubble_positions[:, 0], self.bubble_positions[:, 1],
+            self.bubble_indices, self.opacity_dict, self.data_height,
+            0 if self.orientation == "up" else 1, handler.snow_ttl, handler.MAX_SNOW_TTL
+        )
+        batch = ParticleBatch.from_njit(*data, np.array(self.data_color))
+        self.rendered = True
+        self.timings["render_data"] += time.perf_counter() - began
+        return batch
+
+    def is_empty(self) -> bool:
+        return not self.pattern_data.any()
+
+    def get_statistics(self) -> Dict:
+        stats = self.physics_handler.get_physics_statistics()
+        stats["scaler"] = self.bubble_generator.scaler
+        stats["frame"] = self.frame
+        return stats
+
+
+class TimelinePlayer:
+    """
+    以虚拟时钟按MIDI时间轴驱动模拟
+
+    按键状态的发布和模式帧的规则与MidiVisualizer共用KeyStateDriver，
+    只是生产者和消费者在同一线程，时钟是frame / fps。
+    """
+
+    def __init__(self, simulation: BubbleColumnSimulation, timeline, fps: float = 60.0,
+                 coalesce: Optional[bool] = None, reseed_interval: int = 0, seed: int = 0):
+        """
+        Args:
+            simulation: 要驱动的模拟
+            timeline: MidiTimeline（或接口相同的对象）
+            fps: 虚拟时钟帧率
+            coalesce: 是否合并两帧之间的音符，None表示按配置和事件密度决定
+            reseed_interval: 每隔多少帧以 seed + 帧序号 重设随机数种子，0表示不重设；
+                从这些帧的状态开始模拟，结果与从头模拟完全相同
+            seed: 种子基数
+        """
+        self.simulation = simulation
+        self.timeline = timeline
+        self.fps = fps
+        self.reseed_interval = reseed_interval
+        self.seed = seed
+        self.driver = KeyStateDriver()
+        self.driver.begin_timeline(timeline, coalesce)
+        self.reset()
+
+    @property
+    def coalesce(self) -> bool:
+        return self.driver.coalesce
+
+    def reset(self):
+        """回到歌曲开头（模拟本身由调用方重置）"""
+        self.driver.reset()
+
+    def _step(self):
+        frame = self.driver.next_frame()
+        self.simulation.step(frame.pattern, frame.volumes, frame.state.average_volume, frame.hit_counts)
+
+    def step_frame(self, frame: int, playing: bool = True):
+        """推进第frame帧（playing为False表示音乐已结束）"""
+        if self.reseed_interval and frame % self.reseed_interval == 0:
+            self.simulation.reseed(self.seed + frame)
+        self.driver.publish(frame / self.fps if playing else None)
+        self._step()
+
+    def get_state(self) -> Dict:
+        """按键状态和合并、清零节奏的状态，可由set_state()恢复"""
+        return self.driver.get_state()
+
+    def set_state(self, state: Dict):
+        self.driver.set_state(state)
+
+    def frames(self, duration: float = None, drain_seconds: float = 10.0,
+               start_frame: int = 0) -> Iterator[float]:
+        """
+        逐帧推进模拟，每帧之后产出该帧的虚拟时间（秒）
+
+        Args:
+            duration: 只模拟前duration秒，默认整首
+            drain_seconds: 音乐结束后继续模拟直到气泡消失的最长时间
+            start_frame: 从第几帧开始（之前的音符不会产生气泡，需要的话由调用方预热）
+        """
+        end = self.timeline.duration if duration is None else min(duration, self.timeline.duration)
+        frame = start_frame
+        if start_frame:
+            # 合并窗口从上一帧开始，而不是从头
+            self.driver.last_clock = (start_frame - 1) / self.fps
+            self.simulation.set_clock(start_frame)
+        while True:
+            t = frame / self.fps
+            playing = t <= end
+            if not playing and (self.simulation.is_empty() or t > end + drain_seconds):
+                return
+            self.step_frame(frame, playing)
+            yield t
+            frame += 1
@@ -0,0 +1,539 @@
+"""
+大柱分段模拟 - 几千个发射点、几千层高的气泡柱按高度切成段，每段由一个工作进程计算
+
+单柱的体素数组随发射点数和高度增长，逐层扫描的物理和粒子数据计算都是串行的，
+一个核心撑不住几千个发射点、几千层的柱子。SlabSimulation把柱子放在共享内存中，
+按层切成连续的段（每段至少max_rise_speed层，一帧内气泡最多移动到相邻的段），
+每个工作进程负责一段：
+- 发射：主进程清空发射层，按键位计算厚度后写到所有发射点（第e个发射点由键位 e % 120 驱动，
+  缩放器规则与单柱相同）
+- 移动：各段并行移动本段的气泡，留在本段的写入本地临时数组，越过段边界的写入交换缓冲区
+  （向下模式落到底部的气泡由最低段送往最高段）
+- 交换和合并：所有段移动完后，各段写入相邻段送来的气泡，做相邻合并并写回本段
+- 粒子数据：各段并行生成本段滚动层的粒子，主进程同时计算发射层（强调气泡、积雪、路灯），
+  再把各段的结果按层的顺序拼成一个ParticleBatch
+
+主进程和工作进程以屏障同步每个命令，交换只发生在相邻段之间，模拟规模随核心数增长。
+
+一个工作进程、120个发射点、高度与单柱相同时，向上模式的结果与BubbleColumnSimulation逐位相同；
+多段时每段有自己的随机数序列，抖动与单柱不同但统计上一致（段数不变时可以复现）。
+
+使用方法：
+    python MBC_SlabSimulation.py song.mid --emitters 2400 --height 4000 --workers 8 --duration 30
+    python MBC_SlabSimulation.py song.mid --scaling          # 比较1、2、4...个工作进程的每帧耗时
+    python MBC_SlabSimulation.py song.mid --out big.mbcrec
+"""
+
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+from collections import defaultdict
+from multiprocessing import shared_memory
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from MBC_Calc import generate_positions, calculate_opacity
+from MBC_config import get_config
+from MBC_PhysicsInterface import NjitPhysicsEngine
+from MBC_RenderInterface import CameraState, ParticleBatch
+
+COMMAND_STOP = 0
+COMMAND_STEP = 1
+COMMAND_RENDER = 2
+COMMAND_RESEED = 3
+
+# 工作进程的计时：[移动, 交换和合并, 粒子数据]
+_TIMING_STAGES = ("move", "settle", "render_data")
+
+
+def slab_bounds(height: int, workers: int, min_thickness: int) -> List[Tuple[int, int]]:
+    """把 [0, height) 切成至多workers段，每段至少min_thickness层，层数尽量平均"""
+    count = max(1, min(workers, height // max(1, min_thickness)))
+    edges = [height * k // count for k in range(count + 1)]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def _layout(shape: Tuple[int, int, int], workers: int, exchange_capacity: int, particle_capacity: int):
+    """共享内存中的数组：(名称, 形状, dtype)"""
+    return (
+        ("pattern_data", shape, np.float32),
+        ("pattern_data_thickness", shape, np.float32),
+        ("layer_counts", (shape[0],), np.int64),
+        ("outbox", (workers, 2, exchange_capacity, 4), np.float32),
+        ("exchange_counts", (workers, 3), np.int64),
+        ("merge_counts", (workers, 2), np.int64),
+        ("particles", (workers, 5, particle_capacity), np.float32),
+        ("particle_counts", (workers, 2), np.int64),
+        ("timings", (workers, len(_TIMING_STAGES)), np.float64),
+        ("control", (2,), np.int64),
+    )
+
+
+class _SharedArrays:
+    """一块共享内存上的一组数组（主进程创建，工作进程按名称挂载）"""
+
+    def __init__(self, layout, name: str = None):
+        offsets, size = [], 0
+        for _, shape, dtype in layout:
+            offsets.append(size)
+            size += -(-int(np.prod(shape)) * np.dtype(dtype).itemsize // 64) * 64
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        else:
+            self.shm = _attach(name)
+        self.arrays = {key: np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+                       for (key, shape, dtype), offset in zip(layout, offsets)}
+        if self.owner:
+            for array in self.arrays.values():
+                array.fill(0)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def close(self):
+        # 先释放视图，否则共享内存无法关闭
+        self.arrays.clear()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13：挂载端也会被resource_tracker登记，退出时会误删共享内存，
+        # 挂载期间临时跳过登记（与SharedFrameRingReader相同）
+        from multiprocessing import resource_tracker
+        register = resource_tracker.register
+        resource_tracker.register = lambda res_name, rtype: \
+            None if rtype == "shared_memory" else register(res_name, rtype)
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+# ---- 工作进程 ----
+
+def _slab_worker(index: int, bounds: List[Tuple[int, int]], shm_name: str, layout, up: bool,
+                 offset: Tuple[float, float], barrier, params: np.ndarray):
+    """
+    负责第index段的工作进程：等待主进程的命令，按命令移动和合并，或生成粒子
+
+    每个命令前后各有一道所有进程（含主进程）的屏障；移动命令中间还有一道，
+    保证所有段都写好交换缓冲区之后才读取相邻段送来的气泡（见SlabSimulation._run）
+    """
+    import MBC_njit_func as nf
+    shared = _SharedArrays(layout, shm_name)
+    arrays = shared.arrays
+    pattern_data, pattern_data_thickness = arrays["pattern_data"], arrays["pattern_data_thickness"]
+    layer_counts = arrays["layer_counts"]
+    outbox, exchange_counts = arrays["outbox"], arrays["exchange_counts"]
+    merge_counts, timings = arrays["merge_counts"][index], arrays["timings"][index]
+    particles, particle_counts = arrays["particles"][index], arrays["particle_counts"][index]
+    control = arrays["control"]
+    data_height = pattern_data.shape[0]
+    z0, z1 = bounds[index]
+    below, above = (index - 1) % len(bounds), (index + 1) % len(bounds)
+    temp = np.zeros((z1 - z0,) + pattern_data.shape[1:], dtype=np.float32)
+    temp_thickness = np.zeros_like(temp)
+    dirty = np.zeros(z1 - z0, dtype=np.bool_)
+    orientation_int = 0 if up else 1
+    try:
+        barrier.wait()      # 挂载完成
+        while True:
+            barrier.wait()
+            command = int(control[0])
+            if command == COMMAND_STOP:
+                break
+            began = time.perf_counter()
+            if command == COMMAND_STEP:
+                nf.move_slab(pattern_data, pattern_data_thickness, layer_counts, z0, z1, data_height, up,
+                             temp, temp_thickness, dirty, outbox[index], exchange_counts[index], merge_counts, params)
+                moved = time.perf_counter()
+                barrier.wait()  # 所有段的交换缓冲区都已写好
+                settled = time.perf_counter()
+                # 下方的段送往上方的(1)，上方的段送往下方的(0)
+                nf.settle_slab(pattern_data, pattern_data_thickness, layer_counts, z0, z1, data_height, up,
+                               temp, temp_thickness, dirty,
+                               outbox[below, 1], exchange_counts[below, 1], outbox[above, 0], exchange_counts[above, 0],
+                               merge_counts, params)
+                timings[0] += moved - began
+                timings[1] += time.perf_counter() - settled
+            elif command == COMMAND_RENDER:
+                count = nf.slab_particles(pattern_data, pattern_data_thickness, layer_counts, z0, z1, data_height,
+                                          orientation_int, offset, particles)
+                written = min(count, particles.shape[1])
+                particle_counts[0] = written
+                particle_counts[1] += count - written
+                timings[2] += time.perf_counter() - began
+            elif command == COMMAND_RESEED:
+                nf.seed_random(int(control[1]) + index)
+            barrier.wait()
+    except Exception as e:
+        print(f"Slab worker {index} failed: {e}")
+        barrier.abort()
+    finally:
+        del pattern_data, pattern_data_thickness, layer_counts, outbox, exchange_counts, merge_counts, timings
+        del particles, particle_counts, control, arrays
+        shared.close()
+
+
+# ---- 主进程 ----
+
+class SlabSimulation:
+    """
+    分段的大气泡柱（没有画布和渲染引擎）
+
+    接口与BubbleColumnSimulation相同（step/render_batch/reseed/set_clock/is_empty），
+    可以直接交给TimelinePlayer驱动。用完必须close()（或用with）结束工作进程并释放共享内存。
+    """
+
+    def __init__(self, orientation: str = None, pos_type: str = None, emitters: int = None,
+                 height: int = None, workers: int = None):
+        self.config = get_config()
+        visualization = self.config.visualization
+        physics = self.config.physics
+        slab = self.config.slab
+        self.orientation = orientation or visualization.default_orientation
+        self.pos_type = pos_type or visualization.default_pos_type
+        self.emitters = emitters or slab.emitters
+        self.data_height = height or slab.height
+        self.timeout = slab.timeout_s
+        up = self.orientation == "up"
+
+        # 发射点数增加时按面积放大布局，密度与单柱相同
+        scale = np.sqrt(self.emitters / visualization.num_positions)
+        self.position_list, self.offset = generate_positions(
+            self.emitters, 0, 0,
+            visualization.inner_radius * scale, visualization.outer_radius * scale,
+            pos_type=self.pos_type
+        )
+        max_size = max(max(abs(pos[0]) for pos in self.position_list),
+                       max(abs(pos[1]) for pos in self.position_list))
+        keys = self.config.audio.pattern_key_count
+        self.positions = np.array(self.position_list, dtype=np.int64)
+        self.emitter_keys = np.arange(self.emitters, dtype=np.int64) % keys
+        self.all_positions_array = np.array(list(set(self.position_list)))
+        self.bubble_positions = np.array(self.position_list)
+        self.bubble_indices = np.arange(self.emitters)
+        self.opacity_dict = calculate_opacity()[self.emitter_keys]
+        self.physics_engine = NjitPhysicsEngine()
+        self.njit_func = self.physics_engine.njit_func
+        self.data_color = self.config.theme.data_themes_rgb[self.config.theme.default_theme_index]
+
+        # 发射和缩放器（主进程）
+        self.final_volume = np.zeros(physics.final_volume_history_size)
+        self.final_volume_index = 0
+        self.scaler = 1.0
+        self.thickness_list = np.zeros(keys, dtype=np.int64)
+        self.snow_ttl = np.zeros((physics.max_snow_stack_height, max_size + 1, max_size + 1), dtype=np.int32)
+        self.max_snow_ttl = physics.max_snow_ttl
+
+        # 共享内存和工作进程
+        workers = workers or slab.workers or os.cpu_count() or 1
+        self.bounds = slab_bounds(self.data_height, workers, int(np.ceil(physics.max_rise_speed)))
+        shape = (self.data_height, max_size + 1, max_size + 1)
+        self._layout = _layout(shape, len(self.bounds), slab.exchange_capacity, slab.max_particles_per_slab)
+        self._shared = _SharedArrays(self._layout)
+        arrays = self._shared.arrays
+        self.pattern_data = arrays["pattern_data"]
+        self.pattern_data_thickness = arrays["pattern_data_thickness"]
+        self.layer_counts = arrays["layer_counts"]     # 每层的气泡数，工作进程据此跳过空层
+        self._control = arrays["control"]
+        edge = 0 if up else self.data_height - 1
+        self._edge_index = edge
+        self._edge = slice(edge, edge + 1)
+        # 与其他子进程一样使用spawn；工作进程是守护进程，主进程意外退出时一起结束
+        context = multiprocessing.get_context("spawn")
+        self._barrier = context.Barrier(len(self.bounds) + 1)
+        self._processes = [
+            context.Process(target=_slab_worker, daemon=True, name=f"mbc-slab-{index}",
+                            args=(index, self.bounds, self._shared.name, self._layout, up,
+                                  tuple(float(v) for v in self.offset), self._barrier, self.physics_engine.params))
+            for index in range(len(self.bounds))
+        ]
+        for process in self._processes:
+            process.start()
+        self._lock = threading.Lock()
+        try:
+            self._wait(None)    # 所有工作进程都已挂载共享内存
+        except RuntimeError:
+            self.close()
+            raise
+
+        limit = max_size // (2 if up else 3)
+        self.camera = CameraState(
+            position=(0, 0, 0), target=(0, 0, 0), up=(0, 0, 1),
+            elev=visualization.default_elev, azim=visualization.default_azim_angle,
+            x_range=(-limit, limit), y_range=(-limit, limit), z_range=(0, self.data_height + 2)
+        )
+        self.azim_speed = visualization.default_azim_speed
+        self.frame = 0
+        self.rendered = True
+        self.timings: Dict[str, float] = defaultdict(float)
+
+    @property
+    def workers(self) -> int:
+        return len(self.bounds)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _wait(self, timeout):
+        try:
+            self._barrier.wait(timeout)
+        except threading.BrokenBarrierError:
+            raise RuntimeError("a slab worker stopped responding") from None
+
+    def _run(self, command: int, argument: int = 0, during=None):
+        """让所有工作进程执行一个命令；during在工作进程计算期间在主进程中运行"""
+        with self._lock:
+            self._control[0] = command
+            self._control[1] = argument
+            self._wait(self.timeout)
+            if command == COMMAND_STOP:
+                return None
+            result = during() if during is not None else None
+            if command == COMMAND_STEP:
+                # 移动和合并之间的屏障（工作进程需要等所有段写好交换缓冲区）
+                self._wait(self.timeout)
+            self._wait(self.timeout)
+            return result
+
+    def close(self):
+        """结束工作进程并释放共享内存"""
+        if self._shared is None:
+            return
+        alive = [process for process in self._processes if process.is_alive()]
+        if alive and not self._barrier.broken:
+            try:
+                self._run(COMMAND_STOP)
+            except RuntimeError:
+                pass
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.pattern_data = self.pattern_data_thickness = self.layer_counts = self._control = None
+        self._shared.close()
+        self._shared = None
+
+    def warm_up(self):
+        """编译njit函数（工作进程在第一个命令时编译），之后重置状态"""
+        pattern = np.zeros(self.config.audio.pattern_key_count, dtype=np.uint8)
+        volumes = np.ones(len(pattern), dtype=np.int64)
+        self.step(pattern, volumes, 0)
+        self.render_batch()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            for array in self._shared.arrays.values():
+                if array is not self._control:
+                    array.fill(0)
+        self.final_volume.fill(0)
+        self.final_volume_index = 0
+        self.scaler = 1.0
+        self.thickness_list.fill(0)
+        self.snow_ttl.fill(0)
+        self.camera.azim = self.config.visualization.default_azim_angle
+        self.frame = 0
+        self.rendered = True
+        self.timings.clear()
+
+    def reseed(self, seed: int):
+        """主进程（积雪、路灯）使用seed，第k段使用seed + k"""
+        self.physics_engine.seed(seed)
+        self._run(COMMAND_RESEED, seed)
+
+    def set_clock(self, frame: int):
+        self.frame = frame
+        self.camera.azim = (self.config.visualization.default_azim_angle - frame * self.azim_speed) % 360
+
+    def step(self, bit_array: np.ndarray, volumes: np.ndarray, average_volume: float,
+             hit_counts: np.ndarray = None):
+        """推进一帧（参数与BubbleColumnSimulation.step相同）"""
+        up = self.orientation == "up"
+        edge_data, edge_thickness = self.pattern_data[self._edge], self.pattern_data_thickness[self._edge]
+        if not self.rendered and not up:
+            # 上一帧没有渲染：补上本应在渲染中进行的积雪更新
+            self.physics_engine.advance_snow(edge_data, self.snow_ttl, self.max_snow_ttl)
+        self.rendered = False
+        edge_data.fill(0)
+        edge_thickness.fill(0)
+
+        began = time.perf_counter()
+        if hit_counts is None:
+            hit_counts = np.ones(len(bit_array), dtype=np.int32)
+        variances, self.final_volume_index = self.njit_func.add_pattern_emitters(
+            np.asarray(bit_array), np.asarray(volumes), np.asarray(hit_counts), float(average_volume),
+            self.positions, self.emitter_keys, self.final_volume, self.final_volume_index, float(self.scaler),
+            self.thickness_list, edge_data[0], edge_thickness[0], up, self.physics_engine.params
+        )
+        self.layer_counts[self._edge_index] = np.count_nonzero(edge_data)
+        # 与BubbleGenerator.update_scaler_from_variances相同
+        if variances:
+            physics = self.config.physics
+            if np.mean(variances) < physics.variance_threshold:
+                self.scaler += physics.scaler_increment
+            else:
+                self.scaler = max(0, self.scaler - physics.scaler_increment)
+        added = time.perf_counter()
+
+        self._run(COMMAND_STEP)
+        self.timings["add_pattern"] += added - began
+        self.timings["calculate_bubble"] += time.perf_counter() - added
+        self.camera.azim = (self.camera.azim - self.azim_speed) % 360
+        self.frame += 1
+
+    def render_batch(self) -> ParticleBatch:
+        """当前状态的粒子批次；各段的滚动层并行生成，主进程同时计算发射层"""
+        began = time.perf_counter()
+        up = self.orientation == "up"
+        positions = self.all_positions_array
+
+        def edge_particles():
+            return self.njit_func.calculate_pattern_data_3d(
+                self.pattern_data[self._edge], self.pattern_data_thickness[self._edge], self.offset,
+                positions[:, 0], positions[:, 1],
+                self.bubble_positions[:, 0], self.bubble_positions[:, 1],
+                self.bubble_indices, self.opacity_dict, self.data_height,
+                0 if up else 1, self.snow_ttl, self.max_snow_ttl, self.physics_engine.params
+            )
+
+        edge = self._run(COMMAND_RENDER, during=edge_particles)
+        arrays = self._shared.arrays
+        counts = arrays["particle_counts"][:, 0]
+        particles = arrays["particles"]
+        # 与calculate_pattern_data_3d的顺序相同：向上时发射层在前，向下时积雪和路灯在滚动层之后
+        order = range(self.workers) if up else range(self.workers - 1, -1, -1)
+        slabs = np.concatenate([particles[k, :, :counts[k]] for k in order], axis=1)
+        count = slabs.shape[1]
+        rolling = (slabs[0], slabs[1], slabs[2], slabs[3], np.ones(count, dtype=np.float32),
+                   np.zeros(count, dtype=np.int32), slabs[4])
+        parts = (edge, rolling) if up else (rolling, edge)
+        data = [np.concatenate((first, second)) for first, second in zip(*parts)]
+        batch = ParticleBatch.from_njit(*data, np.array(self.data_color))
+        self.rendered = True
+        self.timings["render_data"] += time.perf_counter() - began
+        return batch
+
+    def is_empty(self) -> bool:
+        return not self.layer_counts.any()
+
+    def get_statistics(self) -> Dict:
+        arrays = self._shared.arrays
+        timings = arrays["timings"]
+        frames = max(self.frame, 1)
+        return {
+            "frame": self.frame,
+            "emitters": self.emitters,
+            "height": self.data_height,
+            "slabs": [list(bounds) for bounds in self.bounds],
+            "active_bubbles": int(self.layer_counts.sum()),
+            "scaler": self.scaler,
+            "merges": arrays["merge_counts"].sum(axis=0).tolist(),
+            "dropped_exchanges": int(arrays["exchange_counts"][:, 2].sum()),
+            "dropped_particles": int(arrays["particle_counts"][:, 1].sum()),
+            # 每段每帧的耗时，看各段负载是否均衡
+            "slab_ms_per_frame": {stage: (timings[:, column] * 1000 / frames).round(3).tolist()
+                                  for column, stage in enumerate(_TIMING_STAGES)},
+        }
+
+
+def run(midi_path: str, simulation: SlabSimulation, fps: float, duration: float = None, recorder=None) -> float:
+    """用TimelinePlayer驱动模拟并逐帧生成粒子，返回耗时（秒）"""
+    from MBC_Cache import get_midi_cache
+    from MBC_Simulation import TimelinePlayer
+    player = TimelinePlayer(simulation, get_midi_cache().load(midi_path).timeline, fps=fps)
+    began = time.perf_counter()
+    for t in player.frames(duration, drain_seconds=0.0 if duration else 10.0):
+        batch = simulation.render_batch()
+        if recorder is not None:
+            recorder.write(batch, simulation.camera, t)
+    return time.perf_counter() - began
+
+
+def scaling(midi_path: str, orientation: str, emitters: int, height: int, fps: float, duration: float,
+            max_workers: int = None) -> List[Dict]:
+    """同一根柱子分别用1、2、4...个工作进程模拟duration秒，比较每帧耗时"""
+    max_workers = max_workers or os.cpu_count() or 1
+    counts = sorted({1 << i for i in range(max_workers.bit_length()) if 1 << i <= max_workers} | {max_workers})
+    results = []
+    for workers in counts:
+        with SlabSimulation(orientation, emitters=emitters, height=height, workers=workers) as simulation:
+            simulation.warm_up()
+            simulation.reseed(0)
+            seconds = run(midi_path, simulation, fps, duration)
+            frames = max(simulation.frame, 1)
+            results.append({
+                "workers": simulation.workers,
+                "frames": simulation.frame,
+                "ms_per_frame": seconds * 1000 / frames,
+                "stage_ms_per_frame": {stage: total * 1000 / frames for stage, total in simulation.timings.items()},
+            })
+    return results
+
+
+def main():
+    config = get_config()
+    parser = argparse.ArgumentParser(description="Simulate one very large bubble column split into slabs "
+                                                 "across worker processes.")
+    parser.add_argument("midi", nargs="?", default=config.file_paths.default_midi_path)
+    parser.add_argument("--orientation", choices=["up", "down"], default=None)
+    parser.add_argument("--pos-type", choices=["Fibonacci", "circle", "arc"], default=None)
+    parser.add_argument("--emitters", type=int, default=None)
+    parser.add_argument("--height", type=int, default=None, help="layers")
+    parser.add_argument("--workers", type=int, default=None, help="slab processes (default: CPU count)")
+    parser.add_argument("--fps", type=float, default=60.0)
+    parser.add_argument("--duration", type=float, default=None, help="only simulate the first N seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="record to this .mbcrec directory")
+    parser.add_argument("--scaling", action="store_true", help="compare frame times for 1, 2, 4... workers")
+    args = parser.parse_args()
+    orientation = args.orientation or config.visualization.default_orientation
+
+    if args.scaling:
+        results = scaling(args.midi, orientation, args.emitters, args.height, args.fps, args.duration or 10.0,
+                          args.workers)
+        baseline = results[0]["ms_per_frame"]
+        for result in results:
+            print(f"{result['workers']:>3} workers: {result['ms_per_frame']:8.2f} ms/frame "
+                  f"(x{baseline / result['ms_per_frame']:.2f}), "
+                  + ", ".join(f"{stage} {ms:.2f}" for stage, ms in result["stage_ms_per_frame"].items()))
+        return
+
+    recorder = None
+    if args.out:
+        from MBC_FrameRecorder import FrameRecorder
+        recorder = FrameRecorder(args.out, fps=args.fps)
+    with SlabSimulation(orientation, args.pos_type, args.emitters, args.height, args.workers) as simulation:
+        print(f"{simulation.emitters} emitters, {simulation.data_height} layers, {simulation.workers} slabs")
+        simulation.warm_up()
+        simulation.reseed(args.seed)
+        try:
+            seconds = run(args.midi, simulation, args.fps, args.duration, recorder)
+        except KeyboardInterrupt:
+            seconds = 0.0
+        finally:
+            if recorder is not None:
+                recorder.close()
+        frames = max(simulation.frame, 1)
+        print(f"{simulation.frame} frames in {seconds:.2f} s")
+        for stage, total in simulation.timings.items():
+            print(f"  {stage:<18}{total * 1000 / frames:8.3f} ms/frame")
+        print(f"  final state: {simulation.get_statistics()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+物理参数扫描 - 在参数网格上比较粒子数、合并频率和帧时间
+
+PhysicsConfig的参数以数组传入njit函数（MBC_PhysicsInterface.physics_params），
+修改参数不需要重新编译。扫描时每个工作进程只预热一次njit函数，
+之后对每组参数替换本进程的PhysicsConfig、新建模拟，无界面地模拟参考歌曲的前duration秒：
+- 每帧粒子数（平均、峰值）和活动气泡峰值
+- 每秒合并次数（移动到同一格 / 相邻合并）
+- 每帧耗时（平均、p95、最大，含粒子数据计算）和各阶段耗时
+
+p95帧时间超过frame_budget_ms的设置会被标出。每组参数使用相同的随机数种子，抖动可比。
+帧时间在工作进程数不超过CPU核数时才有意义。
+
+使用方法：
+    python MBC_Sweep.py --param base_rise_speed_up=4,5,6 --param merge_interval=3,5,8
+    python MBC_Sweep.py song.mid --orientation down --param max_snow_ttl=200,400 --json sweep.json
+"""
+
+import argparse
+import dataclasses
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List
+
+import numpy as np
+
+from MBC_config import PhysicsConfig, get_config
+
+
+def parse_grid(specs: List[str]) -> Dict[str, List]:
+    """把 name=v1,v2,... 解析为参数网格，按PhysicsConfig字段的类型转换"""
+    fields = {field.name: type(getattr(PhysicsConfig(), field.name)) for field in dataclasses.fields(PhysicsConfig)}
+    grid = {}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        name = name.strip()
+        if name not in fields:
+            raise ValueError(f"unknown physics parameter {name!r} (choose from {', '.join(fields)})")
+        cast = fields[name]
+        grid[name] = [cast(float(value)) if cast is int else cast(value) for value in values.split(",") if value.strip()]
+        if not grid[name]:
+            raise ValueError(f"no values given for {name}")
+    return grid
+
+
+def settings_from_grid(grid: Dict[str, List]) -> List[Dict]:
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+# ---- 工作进程 ----
+
+# 工作进程启动时用参考歌曲模拟的时长（秒）
+WARM_UP_SECONDS = 1.0
+
+
+def _init_worker(midi_path: str, orientation: str, pos_type: str, fps: float):
+    """
+    编译njit函数（参数是运行时数组，之后每组参数都不再编译）
+
+    除了warm_up，还用参考歌曲走一遍与run_setting相同的路径，
+    保证输入类型与实际帧一致，第一组参数的帧时间不包含编译
+    """
+    from MBC_Cache import get_midi_cache
+    from MBC_Simulation import BubbleColumnSimulation, TimelinePlayer
+    simulation = BubbleColumnSimulation(orientation=orientation, pos_type=pos_type)
+    simulation.warm_up()
+    player = TimelinePlayer(simulation, get_midi_cache().load(midi_path).timeline, fps=fps)
+    for _ in player.frames(WARM_UP_SECONDS, drain_seconds=0.0):
+        simulation.render_batch()
+
+
+def run_setting(midi_path: str, setting: Dict, orientation: str, pos_type: str,
+                duration: float, fps: float, seed: int) -> Dict:
+    """用一组参数模拟参考歌曲，返回统计（在工作进程中运行）"""
+    from MBC_Cache import get_midi_cache
+    from MBC_Simulation import BubbleColumnSimulation, TimelinePlayer
+    config = get_config()
+    base = config.physics
+    # 本进程的全局配置：BubbleGenerator、PhysicsHandler和物理引擎都从这里读取参数
+    config.physics = dataclasses.replace(base, **setting)
+    try:
+        timeline = get_midi_cache().load(midi_path).timeline
+        simulation = BubbleColumnSimulation(orientation=orientation, pos_type=pos_type)
+        simulation.reseed(seed)
+        player = TimelinePlayer(simulation, timeline, fps=fps)
+        frame_ms, particles, bubbles = [], [], []
+        last = time.perf_counter()
+        for _ in player.frames(duration, drain_seconds=0.0):
+            batch = simulation.render_batch()
+            now = time.perf_counter()
+            frame_ms.append((now - last) * 1000)
+            particles.append(len(batch))
+            bubbles.append(int(np.count_nonzero(simulation.physics_handler.pattern_data)))
+            # 统计本身不计入下一帧的帧时间
+            last = time.perf_counter()
+    finally:
+        config.physics = base
+
+    frames = max(simulation.frame, 1)
+    seconds = frames / fps
+    merges = simulation.physics_engine.merge_counts
+    frame_ms = np.array(frame_ms) if frame_ms else np.zeros(1)
+    return {
+        "setting": setting,
+        "frames": simulation.frame,
+        "particles_mean": float(np.mean(particles)) if particles else 0.0,
+        "particles_peak": int(max(particles)) if particles else 0,
+        "bubbles_peak": int(max(bubbles)) if bubbles else 0,
+        "collision_merges_per_s": float(merges[0]) / seconds,
+        "neighbour_merges_per_s": float(merges[1]) / seconds,
+        "frame_ms_mean": float(frame_ms.mean()),
+        "frame_ms_p95": float(np.percentile(frame_ms, 95)),
+        "frame_ms_max": float(frame_ms.max()),
+        "stage_ms_per_frame": {stage: total * 1000 / frames for stage, total in simulation.timings.items()},
+    }
+
+
+# ---- 主进程 ----
+
+def run_sweep(midi_path: str, grid: Dict[str, List], orientation: str = None, pos_type: str = None,
+              duration: float = None, fps: float = None, workers: int = None, seed: int = None,
+              progress=print) -> List[Dict]:
+    """
+    在进程池中模拟网格中的每组参数
+
+    Returns:
+        每组参数的统计，按p95帧时间排序
+    """
+    config = get_config()
+    sweep = config.sweep
+    orientation = orientation or config.visualization.default_orientation
+    pos_type = pos_type or config.visualization.default_pos_type
+    duration = duration or sweep.duration_s
+    fps = fps or sweep.fps
+    seed = sweep.seed if seed is None else seed
+    settings = settings_from_grid(grid)
+    workers = min(workers or sweep.workers or os.cpu_count() or 1, len(settings))
+    if workers > (os.cpu_count() or 1):
+        progress(f"Warning: {workers} workers on {os.cpu_count()} CPUs, frame times will be inflated")
+
+    progress(f"Sweeping {len(settings)} settings of {os.path.basename(midi_path)} "
+             f"({duration:g} s, {orientation}) with {workers} workers")
+    began = time.perf_counter()
+    results = []
+    # 与其他子进程一样使用spawn
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(midi_path, orientation, pos_type, fps)) as executor:
+        futures = [executor.submit(run_setting, midi_path, setting, orientation, pos_type, duration, fps, seed)
+                   for setting in settings]
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                result = future.result()
+            except Exception as e:
+                progress(f"  [{done}/{len(settings)}] failed: {e}")
+                continue
+            results.append(result)
+            progress(f"  [{done}/{len(settings)}] {format_setting(result['setting'])}: "
+                     f"p95 {result['frame_ms_p95']:.2f} ms, peak {result['particles_peak']} particles")
+    progress(f"Done in {time.perf_counter() - began:.1f} s")
+    return sorted(results, key=lambda result: result["frame_ms_p95"])
+
+
+def format_setting(setting: Dict) -> str:
+    return " ".join(f"{name}={value:g}" for name, value in setting.items()) or "(defaults)"
+
+
+def print_table(results: List[Dict], budget_ms: float):
+    print(f"{'setting':<44}{'p95 ms':>8}{'mean ms':>9}{'particles':>11}{'peak':>7}"
+          f"{'merge/s':>9}{'adj/s':>8}  budget")
+    for result in results:
+        print(f"{format_setting(result['setting']):<44}{result['frame_ms_p95']:8.2f}{result['frame_ms_mean']:9.2f}"
+              f"{result['particles_mean']:11.0f}{result['particles_peak']:7d}"
+              f"{result['collision_merges_per_s']:9.1f}{result['neighbour_merges_per_s']:8.1f}  "
+              + ("ok" if result["frame_ms_p95"] <= budget_ms else "OVER"))
+
+
+def main():
+    config = get_config()
+    parser = argparse.ArgumentParser(description="Simulate a reference song across a grid of physics parameters.")
+    parser.add_argument("midi", nargs="?", default=config.file_paths.default_midi_path, help="reference MIDI file")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=V1,V2",
+                        help="PhysicsConfig field and values to sweep (repeatable; grid is the cartesian product)")
+    parser.add_argument("--orientation", choices=["up", "down"], default=None)
+    parser.add_argument("--pos-type", choices=["Fibonacci", "circle", "arc"], default=None)
+    parser.add_argument("--duration", type=float, default=None, help="seconds of the song per setting")
+    parser.add_argument("--fps", type=float, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--budget-ms", type=float, default=config.sweep.frame_budget_ms, help="p95 frame time budget")
+    parser.add_argument("--json", default=None, help="write all results to this JSON file")
+    args = parser.parse_args()
+
+    try:
+        grid = parse_grid(args.param)
+    except ValueError as e:
+        parser.error(str(e))
+    results = run_sweep(args.midi, grid, args.orientation, args.pos_type, args.duration, args.fps,
+                        args.workers, args.seed)
+    print_table(results, args.budget_ms)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"midi_path": args.midi, "grid": grid, "budget_ms": args.budget_ms, "results": results},
+                      f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -49,6 +49,7 @@ class ThreeJSRenderer(RenderEngineInterface):
         self.connected_clients: Set[websockets.WebSocketServerProtocol] = set()
         self.server_thread = None
         self.loop = None
+        self._pending_broadcasts = set()    # 尚未完成的广播（慢客户端会让它们一直等待）
         
         # 性能优化
         self.frame_count = 0
@@ -79,20 +80,22 @@ class ThreeJSRenderer(RenderEngineInterface):
             self.loop = asyncio.new_event_loop()
             asyncio.set_event_loop(self.loop)
             
-            start_server = websockets.serve(
-                self._handle_websocket_connection,
-                self.host,
-                self.port
-            )
-            
-            self.loop.run_until_complete(start_server)
+            # 在事件循环内创建服务器，兼容新旧版本的websockets
+            async def start_server():
+                return await websockets.serve(
+                    self._handle_websocket_connection,
+                    self.host,
+                    self.port
+                )
+
+            self.websocket_server = self.loop.run_until_complete(start_server())
             self.loop.run_forever()
         
         self.server_thread = threading.Thread(target=run_server, daemon=True)
         self.server_thread.start()
     
-    async def _handle_websocket_connection(self, websocket, path):
-        """处理WebSocket客户端连接"""
+    async def _handle_websocket_connection(self, websocket, path=None):
+        """处理WebSocket客户端连接（新版websockets不再传入path）"""
         self.connected_clients.add(websocket)
         self.logger.info(f"新的Three.js客户端连接: {websocket.remote_address}")
         
@@ -114,8 +117,12 @@ class ThreeJSRenderer(RenderEngineInterface):
     
     async def _send_settings_to_client(self, websocket):
         """发送渲染设置到客户端"""
-        settings_data = {
-            "type": "settings",
+        await websocket.send(json.dumps(self._build_settings_data("settings")))
+
+    def _build_settings_data(self, msg_type: str) -> Dict:
+        """构建设置消息（连接时为"settings"，更新时为"settings_update"）"""
+        return {
+            "type": msg_type,
             "data": {
                 "background_color": self.settings.background_color,
                 "antialiasing": self.settings.antialiasing,
@@ -123,7 +130,6 @@ class ThreeJSRenderer(RenderEngineInterface):
                 "max_particles": self.settings.max_particles
             }
         }
-        await websocket.send(json.dumps(settings_data))
     
     async def _handle_client_message(self, websocket, message):
         """处理客户端消息"""
@@ -144,30 +150,12 @@ class ThreeJSRenderer(RenderEngineInterface):
     def render_frame(self, particles: List[RenderableParticle], 
                      camera: CameraState) -> bool:
         """渲染一帧并发送到Three.js客户端"""
-        if not self.is_initialized or not self.connected_clients:
+        if not self.is_initialized or not self._has_clients():
             return True  # 没有客户端连接时静默成功
         
         try:
-            # 性能优化：限制粒子数量
-            if len(particles) > self.max_particles_per_frame:
-                particles = particles[:self.max_particles_per_frame]
-            
-            # 准备渲染数据
-            render_data = {
-                "type": "render_frame",
-                "frame_id": self.frame_count,
-                "data": {
-                    "particles": self._serialize_particles(particles),
-                    "camera": self._serialize_camera(camera),
-                    "timestamp": self.frame_count * 16.67  # 假设60fps
-                }
-            }
-            
             # 异步发送到所有连接的客户端
-            asyncio.run_coroutine_threadsafe(
-                self._broadcast_to_clients(render_data),
-                self.loop
-            )
+            self._publish(self._build_render_data(particles, camera))
             
             self.frame_count += 1
             return True
@@ -175,6 +163,36 @@ class ThreeJSRenderer(RenderEngineInterface):
         except Exception as e:
             self.logger.error(f"Three.js渲染失败: {e}")
             return False
+
+    def _build_render_data(self, particles: List[RenderableParticle],
+                           camera: CameraState) -> Dict:
+        """构建一帧的渲染消息"""
+        # 性能优化：限制粒子数量
+        if len(particles) > self.max_particles_per_frame:
+            particles = particles[:self.max_particles_per_frame]
+        
+        return {
+            "type": "render_frame",
+            "frame_id": self.frame_count,
+            "data": {
+                "particles": self._serialize_particles(particles),
+                "camera": self._serialize_camera(camera),
+                "timestamp": self.frame_count * 16.67  # 假设60fps
+            }
+        }
+
+    def _has_clients(self) -> bool:
+        """是否有需要接收数据的客户端"""
+        return bool(self.connected_clients)
+
+    def _publish(self, data: Dict):
+        """将消息交给事件循环线程广播"""
+        future = asyncio.run_coroutine_threadsafe(
+            self._broadcast_to_clients(data),
+            self.loop
+        )
+        self._pending_broadcasts.add(future)
+        future.add_done_callback(self._pending_broadcasts.discard)
     
     def _serialize_particles(self, particles: List[RenderableParticle]) -> List[Dict]:
         """将粒子对象序列化为JSON数据"""
@@ -224,7 +242,7 @@ class ThreeJSRenderer(RenderEngineInterface):
     
     def set_camera(self, camera: CameraState):
         """设置相机状态（发送到客户端）"""
-        if not self.connected_clients:
+        if not self._has_clients():
             return
         
         camera_data = {
@@ -232,14 +250,11 @@ class ThreeJSRenderer(RenderEngineInterface):
             "data": self._serialize_camera(camera)
         }
         
-        asyncio.run_coroutine_threadsafe(
-            self._broadcast_to_clients(camera_data),
-            self.loop
-        )
+        self._publish(camera_data)
     
     def clear_scene(self):
         """清空Three.js场景"""
-        if not self.connected_clients:
+        if not self._has_clients():
             return
         
         clear_data = {
@@ -247,35 +262,34 @@ class ThreeJSRenderer(RenderEngineInterface):
             "data": {}
         }
         
-        asyncio.run_coroutine_threadsafe(
-            self._broadcast_to_clients(clear_data),
-            self.loop
-        )
+        self._publish(clear_data)
     
     def update_settings(self, settings: RenderSettings):
         """更新渲染设置并发送到客户端"""
         self.settings = settings
         
-        if not self.connected_clients:
+        if not self._has_clients():
             return
         
-        settings_data = {
-            "type": "settings_update",
-            "data": {
-                "background_color": settings.background_color,
-                "antialiasing": settings.antialiasing,
-                "particle_quality": settings.particle_quality,
-                "max_particles": settings.max_particles
-            }
-        }
-        
-        asyncio.run_coroutine_threadsafe(
-            self._broadcast_to_clients(settings_data),
-            self.loop
-        )
+        self._publish(self._build_settings_data("settings_update"))
     
     def cleanup(self):
         """清理Three.js渲染器资源"""
+        if self.loop and self.websocket_server is not None:
+            # 先取消等待慢客户端的广播并直接断开所有连接（不等待关闭握手），
+            # 再关闭服务器，避免事件循环停止时遗留挂起的任务
+            async def close_server():
+                for future in list(self._pending_broadcasts):
+                    future.cancel()
+                for client in list(self.connected_clients):
+                    client.transport.abort()
+                self.websocket_server.close()
+                await self.websocket_server.wait_closed()
+            try:
+                asyncio.run_coroutine_threadsafe(close_server(), self.loop).result(timeout=2.0)
+            except Exception as e:
+                self.logger.warning(f"关闭WebSocket服务器失败: {e!r}")
+
         if self.loop:
             self.loop.call_soon_threadsafe(self.loop.stop)
         
@@ -1,10 +1,14 @@
 from PyQt5.QtWidgets import QProgressDialog, QGraphicsDropShadowEffect, QProgressBar, QGraphicsBlurEffect, QApplication, QFileDialog
+from PyQt5.QtWidgets import QDialog, QLineEdit, QTableView, QAbstractItemView, QHeaderView, QLabel, QPushButton, QHBoxLayout, QVBoxLayout
 from PyQt5.QtGui import QColor, QPainter
 from PyQt5 import QtCore
 from PyQt5 import QtGui
 import time
 import MBC_config
 from MBC_config import get_config
+from MBC_LibraryIndex import LibraryIndex
+
+MEDIA_FILE_FILTER = "MIDI/Audio files (*.mid *.midi *.wav *.mp3 *.ogg);;MIDI files (*.mid *.midi);;Audio files (*.wav *.mp3 *.ogg);;All files (*.*)"
 
 
 class RoundedProgressDialog(QProgressDialog):
@@ -156,11 +160,156 @@ class LoadingManager():
             self.set_complete()
 
 
+class LibraryTableModel(QtCore.QAbstractTableModel):
+    """曲库索引条目的表格模型"""
+    HEADERS = ["名称", "时长", "音符数", "音域", "音轨", "人声"]
+
+    def __init__(self):
+        super().__init__()
+        self.entries = []
+
+    def set_entries(self, entries):
+        self.beginResetModel()
+        self.entries = entries
+        self.endResetModel()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return len(self.entries)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        entry = self.entries[index.row()]
+        if role == QtCore.Qt.ToolTipRole:
+            return entry.error or entry.path
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        column = index.column()
+        if column == 0:
+            return entry.name
+        if entry.error:
+            return "无法解析" if column == 1 else ""
+        if column == 1:
+            return "%d:%02d" % divmod(int(entry.duration), 60)
+        if column == 2:
+            return str(entry.note_count)
+        if column == 3:
+            return f"{entry.note_min}-{entry.note_max}" if entry.note_count else ""
+        if column == 4:
+            return str(entry.tracks)
+        return "✓" if entry.vocal_path else ""
+
+
+class LibraryBrowserDialog(QDialog):
+    """
+    曲库浏览对话框：列表来自LibraryIndex（SQLite查询），可按名称/路径筛选，
+    后台索引有新结果时定时刷新；选择多首即为播放列表。
+    与QFileDialog一样提供selectedFiles()和finished信号。
+    """
+
+    def __init__(self, library, parent=None):
+        super().__init__(parent)
+        self.config = get_config()
+        self.library = library
+        self.selected_paths = []
+        self.shown_generation = -1
+        self.setWindowTitle("选择MIDI或音频文件（多选即为播放列表）")
+
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("筛选：名称或路径")
+        self.filter_edit.textChanged.connect(self.reload)
+
+        self.model = LibraryTableModel()
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.doubleClicked.connect(lambda _: self.accept_selection())
+
+        self.status_label = QLabel()
+        browse_button = QPushButton("浏览文件...")
+        browse_button.clicked.connect(self.browse_files)
+        rescan_button = QPushButton("重新扫描")
+        rescan_button.clicked.connect(lambda: self.library.refresh_async(self.config.file_paths.library_dirs))
+        play_button = QPushButton("播放")
+        play_button.setDefault(True)
+        play_button.clicked.connect(self.accept_selection)
+
+        buttons = QHBoxLayout()
+        buttons.addWidget(self.status_label, 1)
+        buttons.addWidget(browse_button)
+        buttons.addWidget(rescan_button)
+        buttons.addWidget(play_button)
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.filter_edit)
+        layout.addWidget(self.table)
+        layout.addLayout(buttons)
+
+        # 后台索引写入新结果后重新查询
+        self.poll_timer = QtCore.QTimer(self)
+        self.poll_timer.timeout.connect(self.poll_library)
+        self.poll_timer.start(self.config.ui.library_poll_interval_ms)
+        self.reload()
+
+    def reload(self):
+        self.shown_generation = self.library.generation
+        self.model.set_entries(self.library.entries(self.filter_edit.text().strip()))
+        self.update_status()
+
+    def poll_library(self):
+        if self.library.generation != self.shown_generation:
+            self.reload()
+        else:
+            self.update_status()
+
+    def update_status(self):
+        status = f"{self.model.rowCount()} 首"
+        if self.library.refreshing:
+            status += f" · 正在索引 {self.library.indexed}/{self.library.pending}"
+        self.status_label.setText(status)
+
+    def accept_selection(self):
+        rows = sorted(index.row() for index in self.table.selectionModel().selectedRows())
+        if rows:
+            self.selected_paths = [self.model.entries[row].path for row in rows]
+            self.accept()
+
+    def browse_files(self):
+        """曲库之外的文件仍可通过普通文件对话框选择"""
+        paths, _ = QFileDialog.getOpenFileNames(self, "选择MIDI或音频文件", "", MEDIA_FILE_FILTER,
+                                                options=QFileDialog.DontUseNativeDialog)
+        if paths:
+            self.selected_paths = paths
+            self.accept()
+
+    def selectedFiles(self):
+        return list(self.selected_paths)
+
+    def done(self, result):
+        self.poll_timer.stop()
+        super().done(result)
+
+
 class FileDialogManager:
     def __init__(self, visualizer):
         self.config = get_config()
         self.current_midi_path = self.config.file_paths.default_midi_path
+        self.playlist_paths = [self.current_midi_path]
         self.file_dialog = None
+        self.library = None
+        if self.config.ui.library_browser_enabled:
+            # 索引在后台增量刷新，对话框打开时只查询已有结果
+            self.library = LibraryIndex(workers=self.config.ui.library_index_workers)
+            self.library.refresh_async(self.config.file_paths.library_dirs)
         self.visualizer = visualizer
         self.should_switch_music = False
         self.user_cancelled = False
@@ -200,13 +349,16 @@ class FileDialogManager:
 
     def create_file_dialog(self):
         from PyQt5.QtWidgets import QFileDialog
-        options = QFileDialog.Options()
-        options |= QFileDialog.DontUseNativeDialog  # 使用非原生对话框
-        options |= QFileDialog.HideNameFilterDetails  # 隐藏文件类型过滤器的详细信息
-        
-        self.file_dialog = QFileDialog(None, "选择MIDI文件", "", "MIDI files (*.mid *.midi);;All files (*.*)", options=options)
-        self.file_dialog.setFileMode(QFileDialog.ExistingFile)
-        self.file_dialog.setViewMode(QFileDialog.List)
+        if self.library is not None:
+            self.file_dialog = LibraryBrowserDialog(self.library)
+        else:
+            options = QFileDialog.Options()
+            options |= QFileDialog.DontUseNativeDialog  # 使用非原生对话框
+            options |= QFileDialog.HideNameFilterDetails  # 隐藏文件类型过滤器的详细信息
+            
+            self.file_dialog = QFileDialog(None, "选择MIDI或音频文件（多选即为播放列表）", "", MEDIA_FILE_FILTER, options=options)
+            self.file_dialog.setFileMode(QFileDialog.ExistingFiles)
+            self.file_dialog.setViewMode(QFileDialog.List)
         self.file_dialog.resize(*self.config.ui.file_dialog_size)  # 调整对话框大小
         self.file_dialog.setWindowFlags(self.file_dialog.windowFlags() | QtCore.Qt.WindowStaysOnTopHint)
         
@@ -218,9 +370,10 @@ class FileDialogManager:
         
         def on_file_selected(result):
             if result == QFileDialog.Accepted and self.file_dialog.selectedFiles():
-                new_path = self.file_dialog.selectedFiles()[0]
-                if new_path:
-                    self.current_midi_path = new_path
+                new_paths = [path for path in self.file_dialog.selectedFiles() if path]
+                if new_paths:
+                    self.playlist_paths = new_paths
+                    self.current_midi_path = new_paths[0]
                     self.should_switch_music = True
                     self.visualizer.working = False
                     self.file_dialog.close()  # 选择文件后自动关闭对话框
@@ -0,0 +1,120 @@
+"""
+人声响度包络 - 让人声音轨也参与气泡大小的计算
+
+原来气泡的音量因子只来自MIDI力度（相对最近note_on的平均力度），
+同时播放的人声完全不起作用。VocalEnvelope在准备歌曲时把人声音轨的
+RMS响度按固定帧率（vocal_envelope_fps）计算一次：
+- 读取与人声流式播放相同（WAV为np.memmap按块读取，MP3经ffmpeg管道解码）
+- 结果以文件内容哈希为键保存到缓存目录的<hash>_env<fps>_v<版本>.npy，
+  之后再打开同一首歌时直接以mmap_mode="r"映射，不再读取音频
+- 播放时每帧按时钟取一个增益（数组下标，O(1)），用平均音量除以该增益，
+  人声响的段落气泡更大，人声停顿时更小
+
+使用方法：
+    envelope = load_vocal_envelope("song_vocal.wav", "wav")
+    gain = envelope.gain(pygame.mixer.music.get_pos() / 1000.0)
+    visualizer.update_pattern(pattern, volumes, average_volume / gain, ...)
+"""
+
+import os
+from typing import Tuple
+
+import numpy as np
+
+from MBC_Cache import atomic_write, get_midi_cache
+from MBC_VocalStream import open_audio_source
+
+ENVELOPE_VERSION = 1
+
+
+def compute_rms_envelope(path: str, file_type: str, fps: float, rate: int = 22050,
+                         chunk_seconds: float = 10.0) -> np.ndarray:
+    """
+    按帧计算音频的RMS（单声道，float32，每秒fps帧）
+    """
+    source = open_audio_source(path, file_type, rate, 1)
+    try:
+        hop = max(1, int(round(source.mixer_rate / fps)))
+        pieces = []
+        leftover = np.zeros(0, dtype=np.float32)
+        while True:
+            block = source.read(int(chunk_seconds * source.mixer_rate))
+            if block is None:
+                break
+            if np.issubdtype(block.dtype, np.integer):
+                block = block.astype(np.float32) / float(np.iinfo(block.dtype).max + 1)
+            samples = np.concatenate([leftover, block.mean(axis=1, dtype=np.float32)])
+            count = samples.size // hop
+            frames = samples[:count * hop].reshape(count, hop)
+            pieces.append(np.sqrt(np.mean(frames * frames, axis=1)))
+            leftover = samples[count * hop:]
+        if leftover.size:
+            pieces.append(np.sqrt(np.mean(leftover * leftover, keepdims=True)))
+    finally:
+        if hasattr(source, "close"):
+            source.close()
+    return np.concatenate(pieces).astype(np.float32) if pieces else np.zeros(0, dtype=np.float32)
+
+
+class VocalEnvelope:
+    """按播放时钟查询的人声增益"""
+
+    def __init__(self, rms: np.ndarray, fps: float, offset: float = 0.0, weight: float = 0.5,
+                 gain_range: Tuple[float, float] = (0.5, 2.0)):
+        """
+        Args:
+            rms: 每帧RMS（可以是内存映射数组）
+            fps: rms的帧率
+            offset: 人声相对MIDI时钟的起播延迟（秒）
+            weight: 响度对增益的影响程度，0表示增益恒为1
+            gain_range: 增益的上下限
+        """
+        self.rms = rms
+        self.fps = fps
+        self.offset = offset
+        # 以有声部分的RMS中位数为参考：中位响度的增益为1
+        audible = rms[rms > rms.max() * 1e-3] if rms.size else rms
+        self.reference = float(np.median(audible)) if audible.size else 0.0
+        if self.reference > 0:
+            self.gains = np.clip(1 + weight * (rms / self.reference - 1), *gain_range).astype(np.float32)
+        else:
+            self.gains = np.ones(rms.size, dtype=np.float32)
+
+    @property
+    def duration(self) -> float:
+        return self.rms.size / self.fps
+
+    def gain(self, t: float) -> float:
+        """MIDI时钟t（秒）时的增益；人声范围之外为1"""
+        index = int((t - self.offset) * self.fps)
+        if 0 <= index < self.gains.size:
+            return float(self.gains[index])
+        return 1.0
+
+
+def load_vocal_envelope(path: str, file_type: str, offset: float = 0.0, config=None) -> VocalEnvelope:
+    """
+    取得人声文件的响度包络：缓存中有则内存映射，否则计算后写入缓存
+    """
+    if config is None:
+        from MBC_config import get_config
+        config = get_config()
+    audio = config.audio
+    cache = get_midi_cache()
+    fps = audio.vocal_envelope_fps
+    cache_path = os.path.join(cache.cache_dir, f"{cache.key_for(path)}_env{fps:g}_v{ENVELOPE_VERSION}.npy")
+
+    rms = None
+    if os.path.exists(cache_path):
+        try:
+            rms = np.load(cache_path, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable envelope cache for {path}: {e}")
+    if rms is None:
+        values = compute_rms_envelope(path, file_type, fps, rate=audio.analysis_rate)
+        def write_envelope(target):
+            with open(target, "wb") as f:
+                np.save(f, values)
+        atomic_write(cache_path, write_envelope)
+        rms = np.load(cache_path, mmap_mode="r")
+    return VocalEnvelope(rms, fps, offset, audio.vocal_envelope_weight, audio.vocal_envelope_gain_range)
@@ -0,0 +1,317 @@
+"""
+人声音轨流式播放 - 不再把整首人声解码进内存
+
+原来setup_audio用pygame.mixer.Sound加载_vocal.wav/.mp3，会先把整首歌解码到内存，
+再用固定的wav_delay_ms/mp3_delay_ms延时掩盖加载时间，期间主线程被阻塞。
+VocalStream在后台线程中分块送入mixer.Channel的播放队列：
+- WAV：np.memmap映射数据块，每次只转换一小块（约chunk_seconds秒）到mixer格式
+- MP3：有ffmpeg时通过管道增量解码；没有时在后台线程中整首解码后再分块
+  （不阻塞主线程，但内存占用与原来相同）
+- 起播时间以MIDI播放时钟为准：人声在pygame.mixer.music.get_pos()到达
+  start_delay_ms时开始；如果已经晚了，直接从对应位置开始播放
+
+使用方法：
+    stream = VocalStream(path, "wav", pygame.mixer.Channel(1), start_delay_ms=300)
+    stream.start()
+    ...
+    stream.stop()
+"""
+
+import shutil
+import struct
+import subprocess
+import threading
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+import pygame
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def read_wav_layout(path: str) -> Tuple[int, int, int, int, int, int]:
+    """
+    解析RIFF/WAVE头
+
+    Returns:
+        (数据偏移, 数据字节数, 声道数, 每样本字节数, 采样率, 格式) 格式为PCM或IEEE_FLOAT
+    """
+    with open(path, "rb") as f:
+        riff, _, wave_id = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave_id != b"WAVE":
+            raise ValueError(f"{path} is not a RIFF/WAVE file")
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            chunk_id, chunk_size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                body = f.read(chunk_size)
+                format_tag, channels, rate, _, _, bits = struct.unpack("<HHIIHH", body[:16])
+                if format_tag == WAVE_FORMAT_EXTENSIBLE:
+                    format_tag = struct.unpack("<H", body[24:26])[0]
+                fmt = (channels, bits // 8, rate, format_tag)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError(f"{path} has data before fmt chunk")
+                channels, sample_bytes, rate, format_tag = fmt
+                return f.tell(), chunk_size, channels, sample_bytes, rate, format_tag
+            else:
+                f.seek(chunk_size + (chunk_size & 1), 1)
+
+
+def _to_float(samples: np.ndarray, sample_bytes: int, format_tag: int) -> np.ndarray:
+    """原始样本转换为[-1, 1]的float32"""
+    if format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        return samples.astype(np.float32)
+    if sample_bytes == 1:
+        return (samples.astype(np.float32) - 128) / 128
+    if sample_bytes == 3:
+        # 24位：三个字节拼成int32
+        raw = samples.astype(np.int32)
+        values = raw[..., 0] | (raw[..., 1] << 8) | (raw[..., 2] << 16)
+        values = np.where(values & 0x800000, values - 0x1000000, values)
+        return values.astype(np.float32) / (1 << 23)
+    return samples.astype(np.float32) / float(1 << (8 * sample_bytes - 1))
+
+
+class _WavSource:
+    """内存映射的WAV数据，按块读取并转换到mixer格式"""
+
+    def __init__(self, path: str, mixer_rate: int, mixer_channels: int):
+        offset, size, channels, sample_bytes, rate, format_tag = read_wav_layout(path)
+        if sample_bytes == 3:
+            dtype, shape_tail = np.uint8, (channels, 3)
+        elif format_tag == WAVE_FORMAT_IEEE_FLOAT:
+            dtype, shape_tail = {4: np.float32, 8: np.float64}[sample_bytes], (channels,)
+        else:
+            dtype, shape_tail = {1: np.uint8, 2: np.int16, 4: np.int32}[sample_bytes], (channels,)
+        frame_bytes = channels * sample_bytes
+        self.frames = size // frame_bytes
+        self.data = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(self.frames,) + shape_tail)
+        self.channels = channels
+        self.sample_bytes = sample_bytes
+        self.format_tag = format_tag
+        self.rate = rate
+        self.mixer_rate = mixer_rate
+        self.mixer_channels = mixer_channels
+        self.position = 0   # 以mixer采样率计的输出位置
+
+    def seek(self, seconds: float):
+        self.position = int(seconds * self.mixer_rate)
+
+    def read(self, frames: int) -> Optional[np.ndarray]:
+        """读取frames个mixer帧，返回float32 (n, mixer_channels)，结束时返回None"""
+        ratio = self.rate / self.mixer_rate
+        src_positions = (self.position + np.arange(frames)) * ratio
+        src_positions = src_positions[src_positions < self.frames - 1]
+        if src_positions.size == 0:
+            return None
+        first = int(src_positions[0])
+        last = min(int(src_positions[-1]) + 2, self.frames)
+        block = _to_float(np.asarray(self.data[first:last]), self.sample_bytes, self.format_tag)
+        if ratio != 1.0:
+            local = src_positions - first
+            block = np.stack([np.interp(local, np.arange(block.shape[0]), block[:, c])
+                              for c in range(block.shape[1])], axis=1)
+        else:
+            block = block[:src_positions.size]
+        self.position += block.shape[0]
+        return _match_channels(block, self.mixer_channels)
+
+
+class _FfmpegSource:
+    """ffmpeg管道增量解码（已经是mixer的采样率和声道数）"""
+
+    def __init__(self, path: str, mixer_rate: int, mixer_channels: int):
+        self.path = path
+        self.mixer_rate = mixer_rate
+        self.mixer_channels = mixer_channels
+        self.process = None
+        self.start_seconds = 0.0
+
+    def seek(self, seconds: float):
+        self.start_seconds = seconds
+
+    def read(self, frames: int) -> Optional[np.ndarray]:
+        if self.process is None:
+            self.process = subprocess.Popen(
+                ["ffmpeg", "-v", "quiet", "-ss", f"{self.start_seconds:.3f}", "-i", self.path,
+                 "-f", "f32le", "-ac", str(self.mixer_channels), "-ar", str(self.mixer_rate), "-"],
+                stdout=subprocess.PIPE, stdin=subprocess.DEVNULL
+            )
+        data = self.process.stdout.read(frames * self.mixer_channels * 4)
+        if not data:
+            return None
+        usable = len(data) // (self.mixer_channels * 4) * self.mixer_channels * 4
+        return np.frombuffer(data[:usable], dtype=np.float32).reshape(-1, self.mixer_channels)
+
+    def close(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+
+
+class _DecodedSource:
+    """没有ffmpeg时的MP3后备：后台整首解码，再按块读取"""
+
+    def __init__(self, path: str, mixer_rate: int, mixer_channels: int):
+        import pygame.sndarray
+        samples = pygame.sndarray.array(pygame.mixer.Sound(path))
+        if samples.ndim == 1:
+            samples = samples[:, None]
+        self.samples = samples
+        self.mixer_rate = pygame.mixer.get_init()[0]
+        self.position = 0
+
+    def seek(self, seconds: float):
+        self.position = int(seconds * self.mixer_rate)
+
+    def read(self, frames: int) -> Optional[np.ndarray]:
+        block = self.samples[self.position:self.position + frames]
+        if block.shape[0] == 0:
+            return None
+        self.position += block.shape[0]
+        return block     # 已经是mixer格式，无需转换
+
+
+def open_audio_source(path: str, file_type: str, rate: int, channels: int):
+    """
+    打开一个按块读取的音源，read(frames)返回 (n, channels) 的样本，结束时返回None
+
+    WAV和ffmpeg解码的MP3输出float32，采样率为rate；没有ffmpeg时的后备方案
+    输出mixer格式的整数样本，采样率和声道数与mixer相同（见source.mixer_rate）。
+    """
+    if file_type == "wav":
+        try:
+            return _WavSource(path, rate, channels)
+        except (ValueError, KeyError) as e:
+            # 不支持的WAV编码（如ADPCM）交给pygame解码
+            print(f"Streaming {path} not supported ({e}), decoding in background")
+            return _DecodedSource(path, rate, channels)
+    if shutil.which("ffmpeg"):
+        return _FfmpegSource(path, rate, channels)
+    return _DecodedSource(path, rate, channels)
+
+
+def _match_channels(block: np.ndarray, channels: int) -> np.ndarray:
+    if block.shape[1] == channels:
+        return block
+    if block.shape[1] == 1:
+        return np.repeat(block, channels, axis=1)
+    if channels == 1:
+        return block.mean(axis=1, keepdims=True)
+    return block[:, :channels]
+
+
+def _to_mixer_samples(block: np.ndarray, mixer_size: int) -> np.ndarray:
+    """float32 [-1, 1] 转换为mixer的样本格式"""
+    if block.dtype != np.float32 and block.dtype != np.float64:
+        return np.ascontiguousarray(block)     # _DecodedSource已经是mixer格式
+    block = np.clip(block, -1.0, 1.0)
+    if mixer_size == 32:
+        return np.ascontiguousarray(block, dtype=np.float32)
+    if abs(mixer_size) == 8:
+        if mixer_size < 0:
+            return np.ascontiguousarray(block * 127, dtype=np.int8)
+        return np.ascontiguousarray(block * 127 + 128, dtype=np.uint8)
+    if mixer_size < 0:
+        return np.ascontiguousarray(block * 32767, dtype=np.int16)
+    return np.ascontiguousarray(block * 32767 + 32768, dtype=np.uint16)
+
+
+class VocalStream:
+    """
+    把人声音轨分块送入一个mixer通道
+
+    只在自己的线程中访问源文件；主线程只调用start/stop。
+    """
+
+    def __init__(self, path: str, file_type: str, channel: pygame.mixer.Channel,
+                 start_delay_ms: int = 0, chunk_seconds: float = 0.5):
+        """
+        Args:
+            path: 人声音频路径
+            file_type: "wav" 或 "mp3"
+            channel: 播放用的mixer通道
+            start_delay_ms: 人声相对MIDI播放开始的延迟（与原来的wav_delay_ms/mp3_delay_ms含义相同）
+            chunk_seconds: 每块的时长
+        """
+        self.path = path
+        self.file_type = file_type
+        self.channel = channel
+        self.start_delay_ms = start_delay_ms
+        self.chunk_seconds = chunk_seconds
+        self.source = None
+        self.chunks_played = 0
+        self.underruns = 0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """在后台线程中打开音源，等MIDI时钟到达起播时间后开始播放"""
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="vocal-stream", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        if self.channel is not None:
+            self.channel.stop()
+        if hasattr(self.source, "close"):
+            self.source.close()
+
+    @property
+    def playing(self) -> bool:
+        return self._running
+
+    def _run(self):
+        try:
+            mixer_rate, mixer_size, mixer_channels = pygame.mixer.get_init()
+            self.source = open_audio_source(self.path, self.file_type, mixer_rate, mixer_channels)
+            chunk_frames = int(self.chunk_seconds * mixer_rate)
+
+            # 等待MIDI时钟到达起播时间；已经晚了就从对应位置开始
+            while self._running:
+                position_ms = pygame.mixer.music.get_pos()
+                if position_ms >= self.start_delay_ms or not pygame.mixer.music.get_busy():
+                    break
+                time.sleep(0.002)
+            self.source.seek(max(0, pygame.mixer.music.get_pos() - self.start_delay_ms) / 1000.0)
+
+            def next_sound():
+                block = self.source.read(chunk_frames)
+                if block is None:
+                    return None
+                return pygame.mixer.Sound(buffer=_to_mixer_samples(block, mixer_size).tobytes())
+
+            sound = next_sound()
+            if sound is None or not self._running:
+                return
+            self.channel.play(sound)
+            self.chunks_played += 1
+            while self._running:
+                if self.channel.get_queue() is None:
+                    if not self.channel.get_busy():
+                        self.underruns += 1
+                    sound = next_sound()
+                    if sound is None:
+                        break
+                    if self.channel.get_busy():
+                        self.channel.queue(sound)
+                    else:
+                        self.channel.play(sound)
+                    self.chunks_played += 1
+                time.sleep(self.chunk_seconds / 8)
+        except Exception as e:
+            print(f"Error streaming vocal track {self.path}: {e}")
+        finally:
+            self._running = False
@@ -0,0 +1,267 @@
+"""
+气泡柱窗口 - Qt/Matplotlib窗口、视角滑块、钢琴和鼠标键盘交互
+
+在本进程绘制时由PatternVisualizer3D直接创建；进程外绘制（matplotlib_process）时
+由渲染子进程创建，主进程不再持有任何figure。窗口本身不保存视角和模拟状态：
+影响画面的交互都通过 on_event(名称, 值) 交给PatternVisualizer3D处理，
+视角、坐标范围和钢琴按键随之后的每帧传回窗口。
+
+事件：
+    "zoom"                鼠标所在区域："slider"、"body" 或 "default"
+    "slider_drag"         开始/结束拖动滑块（True/False）
+    "elev"                仰角滑块的值
+    "azim_speed"          旋转速度滑块的值
+    "opacity"             滚轮调整后的窗口透明度
+    "theme"               双击切换主题
+    "toggle_orientation"  R键切换方向
+    "close"               窗口已关闭
+"""
+
+import matplotlib.pyplot as plt
+from matplotlib.gridspec import GridSpec
+from PyQt5.QtCore import QEvent, QObject, Qt
+from PyQt5 import QtGui
+
+from MBC_config import get_config
+
+
+class BubbleColumnWindow(QObject):
+    def __init__(self, background_color, window_opacity, visualize_piano, elev, azim, azim_speed, on_event):
+        super().__init__()  # 初始化 QObject
+        self.config = get_config()
+        self.visualize_piano = visualize_piano
+        self.window_opacity = window_opacity
+        self.on_event = on_event
+        self.mouse_pressing = False
+        self.mouse_controling_slider = False
+
+        # 界面外观设定
+        self.fig = plt.figure(
+            facecolor=background_color,
+            figsize=self.config.ui.default_figure_size
+        )
+        window = self.fig.canvas.manager.window
+        window.setWindowTitle(self.config.ui.window_title)
+        window.setWindowFlags(window.windowFlags() | Qt.WindowStaysOnTopHint)
+        self.toolbar = self.fig.canvas.manager.toolbar
+        self.toolbar.hide()
+        window.setWindowIcon(QtGui.QIcon(self.config.file_paths.icon_path))
+        window.setStyleSheet("""
+            QMainWindow {
+                background-color: transparent;
+                border-radius: 30px;
+            }
+        """)
+        window.setWindowOpacity(self.window_opacity)
+        # 界面交互属性设定
+        window.installEventFilter(self)  # 安装事件过滤器
+        self.fig.canvas.mpl_connect('motion_notify_event', self.on_mouse_move)  # 连接鼠标移动事件
+        self.fig.canvas.mpl_connect('button_press_event', self.on_mouse_press)  # 连接鼠标按下事件
+        self.fig.canvas.mpl_connect('button_release_event', self.on_mouse_release)  # 连接鼠标松开事件
+        self.fig.canvas.mpl_connect('scroll_event', self.on_scroll)  # 连接滚轮事件
+        self.fig.canvas.mpl_connect('key_press_event', self.on_key_press) # 连接键盘按下事件
+        self.fig.canvas.mpl_connect('close_event', self.handle_close)
+        self.fig.canvas.mpl_connect('resize_event', self.on_resize)
+        # 界面图表设定
+        if self.visualize_piano:
+            # 调整比例为40:1使钢琴视图更紧凑
+            gs = GridSpec(2, 1, height_ratios=[40, 1], hspace=0)
+            self.ax = self.fig.add_subplot(gs[0], projection='3d')
+            self.piano_ax = self.fig.add_subplot(gs[1])
+        else:
+            gs = GridSpec(1, 1)
+            self.ax = self.fig.add_subplot(gs[0], projection='3d')
+        self.ax.view_init(elev=elev, azim=azim)
+        plt.subplots_adjust(left=0, right=1, top=1, bottom=0, hspace=0)  # 移除所有边距
+        self._hide_axes()
+        self.ax.margins(0)
+        self.on_resize()
+        # 界面组件设定
+        self.elev_slider = self._create_slider(self.config.ui.elev_slider_pos, (0, 90), elev, 'vertical', self.update_elev)
+        azim_pos = self.config.ui.azim_slider_pos if self.visualize_piano else self.config.ui.azim_slider_pos_no_piano
+        self.azim_slider = self._create_slider(azim_pos, (-5, 5), azim_speed, 'horizontal', self.update_azim)
+        if self.visualize_piano:
+            self._create_piano()
+        self.ax.set_facecolor(background_color)
+
+    def _create_slider(self, pos, val_range, init_val, orientation, callback):
+        ax = plt.axes(pos, facecolor='none')
+        slider = plt.Slider(ax, '', *val_range, orientation=orientation,
+                            valinit=init_val, color=(1,1,1,0.0), initcolor="none",
+                            track_color=(1,1,1,0.1),
+                            handle_style={'facecolor': 'none', 'edgecolor': '0.6', 'size': 10})
+        slider.on_changed(callback)
+        return slider
+
+    def _create_piano(self):
+        self.piano_ax.set_xlim(*self.config.ui.piano_xlim)
+        self.piano_ax.set_ylim(*self.config.ui.piano_ylim)
+        self.piano_ax.axis('off')
+
+        white_key_width = self.config.ui.white_key_width
+        black_key_width = self.config.ui.black_key_width
+        black_key_height = self.config.ui.black_key_height
+
+        self.white_key_map = {}  # midi_note -> white_key_index
+        self.white_keys = []
+        self.black_keys = []
+
+        white_index = 0
+        for note in range(21, 109):
+            if not self.is_black_key(note):
+                # 绘制白键
+                rect = plt.Rectangle((white_index, 0), white_key_width, 1,
+                                    facecolor='white', edgecolor='black')
+                self.piano_ax.add_patch(rect)
+                self.white_keys.append(rect)
+                self.white_key_map[note] = white_index
+                white_index += 1
+
+        # 再绘制黑键，嵌入白键之间
+        self.black_key_map = {}
+        for note in range(21, 109):
+            if self.is_black_key(note):
+                left_white = note - 1
+                while self.is_black_key(left_white):
+                    left_white -= 1
+                if left_white in self.white_key_map:
+                    x = self.white_key_map[left_white] + 1 - self.config.ui.black_key_x_offset
+                    rect = plt.Rectangle((x, self.config.ui.black_key_y_offset), black_key_width, black_key_height,
+                                        facecolor='black', edgecolor='black')
+                    self.piano_ax.add_patch(rect)
+                    self.black_keys.append(rect)
+                    self.black_key_map[note] = rect  # 构建映射
+
+        self.piano_keys = self.white_keys + self.black_keys  # 使用实例属性
+
+    @staticmethod
+    def is_black_key(note):
+        """判断MIDI音符是否为黑键（21~108）"""
+        # 黑键的MIDI音符号（模12）
+        black_keys_mod = [1, 3, 6, 8, 10]  # C#, D#, F#, G#, A#
+        return (note % 12) in black_keys_mod
+
+    def is_open(self):
+        return plt.fignum_exists(self.fig.number)
+
+    def set_background(self, color):
+        self.fig.set_facecolor(color)  # 设置新的 facecolor
+        self.ax.set_facecolor(color)
+
+    def set_view(self, elev, azim):
+        self.ax.view_init(elev=elev, azim=azim)
+
+    def prepare_axes(self, xlim, ylim, zlim):
+        """清空3D坐标轴并设置本帧的显示范围"""
+        self.ax.cla()
+        self.ax.set_xlim(xlim)
+        self.ax.set_ylim(ylim)
+        self.ax.set_zlim(zlim)
+        self._hide_axes()
+        self.ax.margins(0)
+
+    def update_piano(self, bit_array, volumes):
+        # 更新白键
+        for midi_note, white_idx in self.white_key_map.items():
+            key = self.white_keys[white_idx]
+            if midi_note < len(bit_array) and bit_array[midi_note]:
+                vol = volumes[midi_note] / 127.0
+                alpha = min(0.3 + vol * 0.7, 1.0)
+                new_color = (0.9 - vol * 0.5, 0.9 - vol * 0.5, 0.9 - vol * 0.5, alpha)  # 向灰色/黑色偏移
+            else:
+                new_color = (1, 1, 1, 1.0)  # 初始更白
+
+            key.set_facecolor(new_color)
+
+        # 更新黑键
+        for midi_note, key in self.black_key_map.items():
+            if midi_note < len(bit_array) and bit_array[midi_note]:
+                vol = volumes[midi_note] / 127.0
+                alpha = min(0.7 + vol * 0.3, 1.0)
+                new_color = (0.7 + vol * 0.3, 0.7 + vol * 0.3, 0.7 + vol * 0.3, alpha)  # 向灰白色偏移
+            else:
+                new_color = (0.1, 0.1, 0.1, 1.0)  # 初始更黑
+
+            key.set_facecolor(new_color)
+
+    def _hide_axes(self):
+        for axis in [self.ax.xaxis, self.ax.yaxis, self.ax.zaxis]:
+            axis.pane.fill = False
+            axis.set_pane_color((0, 0, 0, 0))
+            axis.set_major_formatter(plt.NullFormatter())
+            axis.set_visible(False)
+            axis.line.set_visible(False)  # 隐藏坐标轴
+            axis.set_ticks([])  # 隐藏刻度线
+
+    def handle_close(self, event):
+        plt.close(self.fig)
+        self.on_event("close", None)
+
+    def on_key_press(self, event):
+        if event.key == 'r' or event.key == 'R':
+            self.on_event("toggle_orientation", None)
+
+    def eventFilter(self, source, event):
+        if event.type() == QEvent.Leave:  # 检测鼠标离开窗口
+            self.on_event("zoom", "default")
+        return super().eventFilter(source, event)
+
+    def on_mouse_move(self, event):
+        # 检查鼠标是否在绘图区域内
+        if event.inaxes:
+            # 检查鼠标是否在 elev_slider 上
+            if self.elev_slider.ax.contains(event)[0] or self.azim_slider.ax.contains(event)[0]:
+                self.on_event("zoom", "slider")
+                if self.mouse_pressing:
+                    self.mouse_controling_slider = True
+                    self.on_event("slider_drag", True)
+            # 检查鼠标是否在主体范围内
+            elif (abs(event.xdata)<0.06) and (abs(event.ydata)<0.08):
+                self.on_event("zoom", "body")
+            else:
+                self.on_event("zoom", "default")
+        else:
+            self.on_event("zoom", "default")
+
+    def on_mouse_press(self, event):
+        self.mouse_pressing = True
+        if event.dblclick:
+            self.on_event("theme", None)
+        elif event.button == 2:  # 中键点击
+            self.toggle_always_on_top(event)
+
+    def on_mouse_release(self, event):
+        self.mouse_pressing = False
+        if self.mouse_controling_slider:
+            self.mouse_controling_slider = False
+            self.on_event("slider_drag", False)
+
+    def on_resize(self, event=None):
+        width, height = self.fig.canvas.get_width_height()
+
+        z_scale = 3 * (height / width)
+        self.ax.set_box_aspect([1, 1, z_scale])
+        self.ax.set_position([0, 0, 1, 1])
+
+    def update_elev(self, val):
+        self.on_event("elev", val)
+
+    def update_azim(self, val):
+        self.on_event("azim_speed", val)
+
+    def on_scroll(self, event):
+        """处理鼠标滚轮事件来调整窗口透明度"""
+        if event.inaxes:
+            # 根据滚轮方向调整透明度
+            delta = 0.05 if event.button == 'up' else -0.05
+            self.window_opacity = max(0.3, min(1.0, self.window_opacity + delta))
+            # 设置窗口透明度
+            self.fig.canvas.manager.window.setWindowOpacity(self.window_opacity)
+            self.on_event("opacity", self.window_opacity)
+
+    def toggle_always_on_top(self, event):
+        flags = self.fig.canvas.manager.window.windowFlags()
+        new_flags = flags ^ Qt.WindowStaysOnTopHint  # 切换置顶状态
+        if new_flags != flags:
+            self.fig.canvas.manager.window.setWindowFlags(new_flags)
+            self.fig.canvas.manager.window.show()  # 需要重新显示窗口使设置生效
@@ -1,12 +1,13 @@
 import MBC_config
 from MBC_config import get_config
-import threading
-from collections import deque
 import numpy as np
-from mido import MidiFile
+from MBC_MidiTimeline import MidiTimeline
+from MBC_Cache import get_midi_cache
+from MBC_KeyState import KeyStateDriver
+from MBC_Playlist import Playlist, SongPrefetcher, find_vocal_file
+from MBC_VocalStream import VocalStream
 import pygame
-import os.path as os_path
-import os
+import time
 
 
 class MidiVisualizer:
@@ -14,24 +15,16 @@ class MidiVisualizer:
         self.config = get_config()
         self.visualizer = visualizer
         self.wav_channel = None
-        self.process_midi_thread_bool = True
-        self.midi_thread = None
+        self.vocal_stream = None
+        self.timeline = None
+        self.vocal_envelope = None
+        self.volume_gain = 1.0
         
-        # Initialize arrays with config values
-        pattern_key_count = self.config.audio.pattern_key_count
-        midi_key_count = self.config.audio.midi_note_max - self.config.audio.midi_note_min + 1
-        
-        self.volumes = [0] * pattern_key_count
-        self.total_volumes = deque(maxlen=self.config.audio.total_volumes_maxlen)
-        self.key_activation = np.zeros(pattern_key_count, dtype=int)
-        self.new_pattern = bytes(15)  # Keep as is for now
-        self.key_activation_bytes = bytes(15)  # Keep as is for now
-        self.update_count = 0
-        self.zero_pattern_interval = self.config.audio.zero_pattern_interval
+        # Key state handed from the producer (file clock or live input) to the render loop,
+        # with the same pattern rules as the headless TimelinePlayer
+        self.driver = KeyStateDriver()
+        self.key_state = self.driver.key_state
         self.default_wav_playing = False
-        self.key_activation_real = np.zeros(midi_key_count + 8, dtype=np.uint8)  # 真实钢琴键位
-        self.key_activation_real_bytes = bytes(16)  # 16 bytes for 128 bits (1 bit per key)
-        self.volumes_real = np.zeros(midi_key_count + 8, dtype=np.uint8)
         
         # Initialize pygame mixer with config
         pygame.mixer.init(
@@ -42,18 +35,17 @@ class MidiVisualizer:
         pygame.mixer.set_num_channels(self.config.audio.mixer_channels)
     
     def prepare_midi_file(self, midi_path):
-        temp_midi_path = "temp_midi_file.mid"
-        midi = MidiFile(midi_path)
-        for track in midi.tracks:
-            for msg in track:
-                if msg.type == 'program_change':
-                    msg.program = 0  # Piano sound
-        midi.save(temp_midi_path)
-        return midi, temp_midi_path
+        # Parsed timeline and piano-only MIDI come from the content-hash cache
+        entry = get_midi_cache().load(midi_path)
+        return entry.timeline, entry.piano_midi_path
         
     def stop_all_audio(self):
         """Stop all playing audio including MIDI and WAV"""
         try:
+            if self.vocal_stream is not None:
+                self.vocal_stream.stop()
+                self.vocal_stream = None
+            
             pygame.mixer.music.stop()
             pygame.mixer.music.unload()  # Add this line to unload the MIDI file
             
@@ -69,43 +61,45 @@ class MidiVisualizer:
             print(f"Error stopping audio: {e}")
     
     def setup_audio(self, midi_path, temp_midi_path):
-        # Stop any existing audio first
-        self.stop_all_audio()
-        
-        # Reinitialize mixer to ensure clean state
-        pygame.mixer.quit()
-        pygame.mixer.init(
-            frequency=self.config.audio.frequency,
-            size=self.config.audio.size,
-            channels=self.config.audio.channels
-        )
-        pygame.mixer.set_num_channels(self.config.audio.mixer_channels)
+        # Play audio if it exists (either default or matching vocal file)
+        vocal_to_play, vocal_file_type = find_vocal_file(midi_path, self.config)
+        self.start_audio(temp_midi_path, vocal_to_play, vocal_file_type)
+    
+    def start_audio(self, piano_midi_path, vocal_to_play=None, vocal_file_type=None,
+                    vocal_sound=None, reinit_mixer=True):
+        if reinit_mixer:
+            # Stop any existing audio first
+            self.stop_all_audio()
+            
+            # Reinitialize mixer to ensure clean state
+            pygame.mixer.quit()
+            pygame.mixer.init(
+                frequency=self.config.audio.frequency,
+                size=self.config.audio.size,
+                channels=self.config.audio.channels
+            )
+            pygame.mixer.set_num_channels(self.config.audio.mixer_channels)
+        elif self.vocal_stream is not None:
+            self.vocal_stream.stop()
+            self.vocal_stream = None
 
         try:
-            pygame.mixer.music.load(temp_midi_path)
+            pygame.mixer.music.load(piano_midi_path)
             pygame.mixer.music.play()
             
-            # Check for vocal audio file (WAV or MP3)
-            base_path = os.path.splitext(midi_path)[0] + '_vocal'
-            wav_path = base_path + '.wav'
-            mp3_path = base_path + '.mp3'
-            
-            # Play audio if it exists (either default or matching vocal file)
-            if midi_path == self.config.file_paths.default_midi_path and os_path.exists(self.config.file_paths.default_wav_path):
-                vocal_to_play = self.config.file_paths.default_wav_path
-                vocal_file_type = "wav"
-            elif os_path.exists(wav_path):
-                vocal_to_play = wav_path
-                vocal_file_type = "wav"
-            elif os_path.exists(mp3_path):
-                vocal_to_play = mp3_path
-                vocal_file_type = "mp3"
-            else:
-                vocal_to_play = None
-            
-            if vocal_to_play:
+            if vocal_to_play and vocal_sound is None and self.config.audio.vocal_streaming:
+                # Stream the vocal in chunks; it starts on the MIDI clock without blocking here
+                self.wav_channel = pygame.mixer.Channel(1)
+                delay_ms = self.config.audio.wav_delay_ms if vocal_file_type == "wav" else self.config.audio.mp3_delay_ms
+                self.vocal_stream = VocalStream(vocal_to_play, vocal_file_type, self.wav_channel,
+                                                start_delay_ms=delay_ms,
+                                                chunk_seconds=self.config.audio.vocal_chunk_seconds)
+                self.vocal_stream.start()
+                self.default_wav_playing = True
+            elif vocal_to_play:
                 self.wav_channel = pygame.mixer.Channel(1)
-                vocal_sound = pygame.mixer.Sound(vocal_to_play)
+                if vocal_sound is None:
+                    vocal_sound = pygame.mixer.Sound(vocal_to_play)
                 if vocal_file_type == "wav":
                     pygame.time.delay(self.config.audio.wav_delay_ms)
                 if vocal_file_type == "mp3":
@@ -116,97 +110,137 @@ class MidiVisualizer:
             print(f"Error setting up audio: {e}")
     
     def get_note_range(self, midi):
-        min_note, max_note = 127, 0
-        for track in midi.tracks:
-            for msg in track:
-                if msg.type in ['note_on', 'note_off']:
-                    min_note = min(min_note, msg.note)
-                    max_note = max(max_note, msg.note)
-        return min_note, max_note
+        return MidiTimeline.from_midi(midi).note_range()
     
     def map_note_to_range(self, note, min_note, max_note):
-        # Map MIDI note to piano key index using config values
-        piano_key = note - self.config.audio.midi_note_min
+        # Map MIDI note (scalar or array) to piano key index using config values
+        piano_key = np.asarray(note) - self.config.audio.midi_note_min
         # Ensure the note is within the piano's range
-        piano_key = max(0, min(self.config.audio.piano_key_count - 1, piano_key))
-        return piano_key
+        return np.clip(piano_key, 0, self.config.audio.piano_key_count - 1)
     
-    def process_midi(self, midi_iterator, min_note, max_note):
-        for msg in midi_iterator:
-            if msg.type == 'note_on':
-                note = msg.note  # 真实MIDI键位
-
-                # 1. 计算new_pattern（120键映射，用于模式）
-                mapped_note = self.map_note_to_range(note, min_note, max_note)
-                if 0 <= mapped_note < self.config.audio.pattern_key_count:
-                    self.key_activation[mapped_note] = 1 if (msg.type == 'note_on' and msg.velocity > 0) else 0
-                    self.volumes[mapped_note] = msg.velocity if msg.type == 'note_on' else 0
-                    self.total_volumes.append(msg.velocity)
-
-                self.new_pattern = np.packbits(self.key_activation).tobytes()
-
-                # 2. 记录真实键位激活（用于钢琴可视化）
-                if self.config.audio.midi_note_min <= note <= self.config.audio.midi_note_max:
-                    self.key_activation_real[note] = 1 if msg.velocity > 0 else 0
-                    self.volumes_real[note] = msg.velocity  # 用真实键位存音量
-
-                self.key_activation_real_bytes = np.packbits(self.key_activation_real).tobytes()
-                self.update_count = 0
-
-            if not pygame.mixer.music.get_busy() or not self.process_midi_thread_bool:
-                break
+    def render_key_state(self):
+        """读取最新按键状态并绘制一帧；本帧包含新的按键事件时返回该状态"""
+        frame = self.driver.next_frame()
+        state = frame.state
+        
+        # 人声响度增益：平均音量越小，同样的力度得到的气泡越大
+        average_volume = state.average_volume / self.volume_gain
+        if frame.cleared:
+            self.visualizer.update_pattern(frame.pattern, frame.volumes, average_volume, None, None)
+        else:
+            self.visualizer.update_pattern(
+                new_pattern=frame.pattern,
+                volumes=frame.volumes,         # 长度固定 120
+                average_volume=average_volume,
+                key_activation_bytes=state.real_keys,
+                volumes_real=state.real_volumes,
+                hit_counts=frame.hit_counts,
+            )
+        return state if frame.new_state else None
     
-    def visualize(self, midi_path):
-        # Stop any existing audio before starting new visualization
+    def visualize_live(self, live_input):
+        """用实时MIDI输入驱动可视化，直到窗口关闭"""
         self.stop_all_audio()
-        
         self.visualizer.working = True
-        self.process_midi_thread_bool = True
+        self.vocal_envelope = None
+        self.volume_gain = 1.0
+        self.driver.release_all(0.0)
+        if not live_input.start():
+            return False
         
-        # Prepare and play MIDI
-        midi, temp_midi_path = self.prepare_midi_file(midi_path)
-        self.setup_audio(midi_path, temp_midi_path)
-        
-        # Setup MIDI processing
-        min_note, max_note = self.get_note_range(midi)
-        midi_iterator = iter(midi.play())
+        report_interval = self.config.audio.live_input_report_interval_s
+        last_report = time.perf_counter()
+        while self.visualizer.working:
+            state = self.render_key_state()
+            if state is not None:
+                live_input.record_frame(state.timestamp)
+            self.visualizer.update_view_angle()
+            
+            if report_interval and time.perf_counter() - last_report >= report_interval:
+                stats = live_input.get_stats()
+                print(f"Live input: {stats['events']} events, input-to-frame latency "
+                      f"mean {stats['mean_ms']:.1f} ms, p95 {stats['p95_ms']:.1f} ms, max {stats['max_ms']:.1f} ms")
+                last_report = time.perf_counter()
         
-        # Start MIDI processing thread
-        self.midi_thread = threading.Thread(
-            target=self.process_midi, 
-            args=(midi_iterator, min_note, max_note)
-        )
-        self.midi_thread.start()
+        live_input.stop()
+        return True
+    
+    def begin_song(self, song):
+        """切换到一首已准备好的歌曲的时间轴（不清空气泡柱）"""
+        self.timeline = song.timeline
+        self.vocal_envelope = song.vocal_envelope
+        self.volume_gain = 1.0
+        self.driver.begin_timeline(self.timeline)
+        if self.driver.coalesce:
+            print(f"Dense MIDI ({self.timeline.events_per_second:.0f} events/s): coalescing events between frames")
+        if song.analysis is not None:
+            print(f"Audio-only input: detecting keys from the spectrum of {song.midi_path}")
+    
+    def play_song_frames(self, drain):
+        """
+        逐帧绘制当前歌曲直到MIDI播放结束；drain为True时还要等气泡全部消失
         
-        # Main visualization loop
+        Returns:
+            bool: 歌曲正常结束返回True，用户关闭窗口返回False
+        """
+        # Main visualization loop: key state follows the mixer's playback clock
         while True:
-            average_volume = sum(self.total_volumes) / len(self.total_volumes) if self.total_volumes else 0
+            busy = pygame.mixer.music.get_busy()
+            t = pygame.mixer.music.get_pos() / 1000.0 if busy else None
+            self.driver.publish(t)
+            if self.vocal_envelope is not None:
+                self.volume_gain = self.vocal_envelope.gain(t) if busy else 1.0
+            self.render_key_state()
             
-            if self.update_count % self.zero_pattern_interval == 0:
-                self.new_pattern = bytes(15)
-                one_volumes = [1] * self.config.audio.pattern_key_count
-                self.visualizer.update_pattern(self.new_pattern, one_volumes, average_volume, None, None)
-            else:
-                self.visualizer.update_pattern(
-                    new_pattern=self.new_pattern,
-                    volumes=self.volumes,         # 长度固定 120
-                    average_volume=average_volume,
-                    key_activation_bytes=self.key_activation_real_bytes,
-                    volumes_real=self.volumes_real,
-                )
-            self.update_count += 1
-            
-            if not pygame.mixer.music.get_busy() and np.sum(self.visualizer.pattern_data) == 0:
-                self.visualizer.working = False
-                break
+            if not busy and (not drain or np.sum(self.visualizer.pattern_data) == 0):
+                if drain:
+                    self.visualizer.working = False
+                return True
                 
             self.visualizer.update_view_angle()
             if not self.visualizer.working:
-                self.process_midi_thread_bool = False
                 # 如果默认WAV在播放，停止它
                 if self.default_wav_playing:
                     self.stop_all_audio()
+                return False
+    
+    def visualize(self, midi_path):
+        self.visualize_playlist(Playlist([midi_path]))
+    
+    def visualize_playlist(self, playlist, prefetcher=None):
+        """
+        按顺序播放列表中的歌曲；当前歌曲播放时在后台准备下一首，
+        切换时不重新初始化mixer，也不清空气泡柱
+        """
+        own_prefetcher = prefetcher is None
+        if own_prefetcher:
+            prefetcher = SongPrefetcher()
+        
+        # Stop any existing audio before starting new visualization
+        self.stop_all_audio()
+        self.visualizer.working = True
+        self.driver.release_all(0.0)
+        
+        first_song = True
+        song = prefetcher.get(playlist.current())
+        while True:
+            self.begin_song(song)
+            self.start_audio(song.piano_midi_path, song.vocal_path, song.vocal_type,
+                             song.vocal_sound, reinit_mixer=first_song)
+            first_song = False
+            
+            # Prepare the next song while this one plays (after the mixer is set up,
+            # so its pre-decoded vocal belongs to the current mixer)
+            next_path = playlist.peek_next()
+            if next_path is not None:
+                prefetcher.prefetch(next_path)
+            
+            finished = self.play_song_frames(drain=next_path is None)
+            song.close()
+            if not finished or next_path is None:
                 break
+            song = prefetcher.get(playlist.advance())
         
-        self.midi_thread.join()
+        if own_prefetcher:
+            prefetcher.shutdown()
         pygame.mixer.music.stop()
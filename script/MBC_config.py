@@ -2,7 +2,7 @@
 
 import os.path as os_path
 from dataclasses import dataclass, field
-from typing import Tuple, List
+from typing import Tuple, List, Dict
 import json
 
 # Base paths
@@ -16,6 +16,9 @@ class FilePathsConfig:
     default_midi_path: str = field(default_factory=lambda: os_path.join(base_path, "City_Of_Stars.mid"))
     default_wav_path: str = field(default_factory=lambda: os_path.join(base_path, "City_Of_Stars_vocal.wav"))
     config_file: str = field(default_factory=lambda: os_path.join(base_path, "mbc_settings.json"))
+    cache_dir: str = field(default_factory=lambda: os_path.join(base_path, "mbc_cache"))
+    library_dirs: List[str] = field(default_factory=lambda: [base_path])  # scanned by the library browser
+    recordings_dir: str = field(default_factory=lambda: os_path.join(base_path, "mbc_recordings"))  # "recorder" engine output
 
 
 @dataclass
@@ -45,6 +48,12 @@ class VisualizationConfig:
     default_orientation: str = "up"  # "up" or "down"
     default_pos_type: str = "Fibonacci"  # "Fibonacci", "circle", "arc"
     visualize_piano: bool = True
+    render_engine: str = "threejs"  # "threejs", "matplotlib", "matplotlib_process", "recorder", "composite"
+    
+    # Composite renderer: backends fed from the same particle batch, and optional
+    # per-backend frame rate caps (0 or missing = render every frame)
+    composite_backends: List[str] = field(default_factory=lambda: ["matplotlib", "threejs"])
+    composite_max_fps: Dict[str, float] = field(default_factory=lambda: {"threejs": 30.0})
     
     # View settings
     default_elev: float = 37.0
@@ -78,7 +87,7 @@ class PhysicsConfig:
     thickness_speed_factor: float = 0.1
     max_thickness_bonus: float = 8.0
     base_rise_speed_down: float = 6.0
-    jitter_range: int = 3  # -3 to +4 for down mode
+    jitter_range: int = 3  # down mode speed jitter, -3 to +3
     max_rise_speed: float = 18.0
     
     # Size adjustments
@@ -94,9 +103,9 @@ class PhysicsConfig:
     max_snow_stack_height: int = 5
     max_snow_ttl: int = 400
     snow_size_min: float = 10.0
-    snow_size_max: float = 40.0
+    snow_size_max: float = 50.0  # size at full TTL: size = min + ttl / max_snow_ttl * (max - min)
     snow_opacity_min: float = 0.2
-    snow_opacity_max: float = 0.8
+    snow_opacity_max: float = 1.0  # opacity at full TTL, interpolated the same way
     
 
 @dataclass
@@ -112,6 +121,16 @@ class AudioConfig:
     wav_delay_ms: int = 300
     mp3_delay_ms: int = 100
     
+    # Vocal track streaming (chunks fed to a mixer channel instead of decoding the whole file)
+    vocal_streaming: bool = True
+    vocal_chunk_seconds: float = 0.5
+    
+    # Vocal loudness envelope (precomputed RMS, cached per file) scales bubble volume while the vocal sings
+    vocal_envelope_enabled: bool = True
+    vocal_envelope_fps: float = 100.0
+    vocal_envelope_weight: float = 0.5  # 0 = ignore the vocal, 1 = bubble volume follows the vocal RMS
+    vocal_envelope_gain_range: Tuple[float, float] = (0.5, 2.0)
+    
     # MIDI processing
     piano_key_count: int = 88  # Standard piano keys
     midi_note_min: int = 21   # A0
@@ -122,6 +141,29 @@ class AudioConfig:
     total_volumes_maxlen: int = 240
     zero_pattern_interval: int = 2
     
+    # Live MIDI input (play a keyboard instead of a file)
+    live_input_enabled: bool = False
+    live_input_device_id: int = -1  # -1 = system default input device
+    live_input_poll_interval_ms: float = 1.0
+    live_input_report_interval_s: float = 5.0  # input-to-frame latency report, 0 = off
+    
+    # Dense MIDI: aggregate every note between frames instead of sampling the key state
+    coalesce_mode: str = "auto"  # "auto", "on", "off"
+    coalesce_auto_events_per_second: float = 200.0  # "auto" enables coalescing above this density
+    
+    # Audio-only input (plain WAV/MP3 analysed into key frames by a short-time Fourier transform)
+    analysis_rate: int = 22050
+    analysis_fft_size: int = 4096
+    analysis_hop: int = 512  # ~23 ms between analysis frames at 22050 Hz
+    analysis_chunk_seconds: float = 2.0
+    analysis_start_ahead_s: float = 1.0  # analysed audio required before playback starts
+    analysis_lookahead_s: float = 20.0  # worker pauses once this far ahead of the playhead
+    analysis_onset_db: float = 6.0  # per-note energy rise that counts as a key press
+    analysis_range_db: float = 60.0  # notes quieter than the running peak minus this are ignored
+    analysis_frame_range_db: float = 30.0  # ...or quieter than the loudest note of the same frame minus this
+    analysis_max_polyphony: int = 6
+    analysis_hold_s: float = 0.08  # how long a detected onset keeps its key down
+    
 
 @dataclass
 class UIConfig:
@@ -138,6 +180,9 @@ class UIConfig:
     # File dialog
     file_dialog_size: Tuple[int, int] = (800, 800)
     file_dialog_offset_x: int = 50
+    library_browser_enabled: bool = True  # indexed, filterable library instead of the plain file dialog
+    library_index_workers: int = 0  # processes parsing MIDI files for the index, 0 = CPU count
+    library_poll_interval_ms: int = 500  # how often the open browser picks up newly indexed files
     
     # Progress bar and UI effects
     icon_y_offset: int = 20
@@ -179,6 +224,89 @@ class PerformanceConfig:
     numba_nogil: bool = True
     numba_fastmath: bool = True
     
+    # Keyframe seeking (MBC_Keyframes.py)
+    keyframe_interval_s: float = 0.5
+    keyframe_memory_mb: float = 64.0  # LRU budget; older keyframes spill to disk
+    keyframe_seed: int = 0  # RNG is reseeded with seed + frame at every keyframe
+    
+
+@dataclass
+class StreamingConfig:
+    """Frame streaming: Three.js WebSocket, relay and shared-memory ring."""
+    websocket_host: str = "localhost"
+    websocket_port: int = 8765
+    
+    # Relay mode: publish each encoded frame once, relay processes own the viewers
+    relay_enabled: bool = False
+    relay_publish_port: int = 8770
+    relay_process_count: int = 1  # Relay i serves viewers on websocket_port + i
+    relay_authkey: str = "mbc-relay"
+    
+    # Shared-memory particle frame ring for out-of-process consumers
+    frame_ring_enabled: bool = False
+    frame_ring_name: str = "mbc_frames"
+    frame_ring_slots: int = 4
+    frame_ring_max_particles: int = 50000
+    
+
+@dataclass
+class ExportConfig:
+    """Offline export (MBC_Export.py): headless simulation, frames rasterized in a process pool."""
+    width: int = 1000
+    height: int = 1200
+    fps: float = 60.0
+    workers: int = 0  # rasterizer processes, 0 = CPU count
+    frames_in_flight: int = 4  # per worker; bounds memory while keeping the pool busy
+    ffmpeg_path: str = "ffmpeg"
+    video_args: List[str] = field(default_factory=lambda: ["-c:v", "libx264", "-pix_fmt", "yuv420p", "-crf", "18"])
+    gif_colors: int = 256
+
+
+@dataclass
+class BatchConfig:
+    """Catalogue preview rendering (MBC_Batch.py): thumbnail, short clip and statistics per song."""
+    out_dir: str = field(default_factory=lambda: os_path.join(base_path, "mbc_previews"))
+    workers: int = 0  # song processes, 0 = CPU count
+    fps: float = 60.0  # simulation rate for the statistics
+    clip_start_s: float = 20.0  # moved earlier for songs too short to fit the clip
+    clip_seconds: float = 6.0
+    clip_fps: float = 15.0
+    clip_size: Tuple[int, int] = (250, 300)
+    thumbnail_size: Tuple[int, int] = (400, 480)
+
+
+@dataclass
+class SweepConfig:
+    """Physics parameter sweep (MBC_Sweep.py): one headless run of a reference song per setting."""
+    workers: int = 0  # simulation processes, 0 = CPU count; more than the core count skews frame times
+    duration_s: float = 60.0  # simulated seconds of the reference song per setting
+    fps: float = 60.0
+    frame_budget_ms: float = 16.7  # settings whose p95 frame time exceeds this are flagged
+    seed: int = 0  # same jitter for every setting
+
+
+@dataclass
+class SlabConfig:
+    """Domain-decomposed large columns (MBC_SlabSimulation.py): the volume is split into z-slabs, one process each."""
+    emitters: int = 960  # emitter e is driven by key e % pattern_key_count; the layout radius grows with sqrt(emitters)
+    height: int = 2000  # layers
+    workers: int = 0  # slab processes, 0 = CPU count; slabs are at least max_rise_speed layers thick
+    exchange_capacity: int = 65536  # bubbles per slab boundary and direction per step; overflow is dropped and counted
+    max_particles_per_slab: int = 500000  # render output per slab; overflow is dropped and counted
+    timeout_s: float = 120.0  # a step or render not finished by every slab within this is treated as a dead worker
+
+
+@dataclass
+class ServiceConfig:
+    """Local render job service (MBC_RenderService.py): HTTP API in front of headless simulation."""
+    host: str = "127.0.0.1"
+    port: int = 8780
+    workers: int = 2  # simulation processes, each keeps its JIT-compiled kernels warm
+    max_queued: int = 32  # pending jobs beyond this are rejected with 503
+    max_upload_mb: float = 16.0
+    jobs_dir: str = field(default_factory=lambda: os_path.join(base_path, "mbc_jobs"))
+    keep_finished: int = 200  # oldest finished jobs (and their files) are removed beyond this
+
 
 @dataclass
 class AppConfig:
@@ -190,6 +318,12 @@ class AppConfig:
     audio: AudioConfig = field(default_factory=AudioConfig)
     ui: UIConfig = field(default_factory=UIConfig)
     performance: PerformanceConfig = field(default_factory=PerformanceConfig)
+    streaming: StreamingConfig = field(default_factory=StreamingConfig)
+    export: ExportConfig = field(default_factory=ExportConfig)
+    batch: BatchConfig = field(default_factory=BatchConfig)
+    service: ServiceConfig = field(default_factory=ServiceConfig)
+    sweep: SweepConfig = field(default_factory=SweepConfig)
+    slab: SlabConfig = field(default_factory=SlabConfig)
     
     def save_to_file(self, filepath: str = None) -> None:
         """Save configuration to JSON file."""
@@ -1,146 +1,265 @@
 from numba import njit, prange
 import numpy as np
 
+# 物理参数数组（float64）中各项的位置，由MBC_PhysicsInterface.physics_params按PhysicsConfig填写。
+# 参数以数组传入而不是写成常量，修改参数不需要重新编译。
+P_MAX_VOLUME_UP = 0
+P_MAX_VOLUME_DOWN = 1
+P_BASE_RISE_SPEED_UP = 2
+P_MAX_PROGRESS_BONUS = 3
+P_THICKNESS_SPEED_FACTOR = 4
+P_MAX_THICKNESS_BONUS = 5
+P_BASE_RISE_SPEED_DOWN = 6
+P_JITTER_RANGE = 7
+P_MAX_RISE_SPEED = 8
+P_SIZE_INCREASE_FACTOR = 9
+P_MERGE_INTERVAL = 10
+P_GRID_CELL_SIZE = 11
+P_ADJACENT_GRID_THRESHOLD = 12
+P_MERGE_DISTANCE_FACTOR = 13
+P_SNOW_SIZE_MIN = 14
+P_SNOW_SIZE_MAX = 15
+P_SNOW_OPACITY_MIN = 16
+P_SNOW_OPACITY_MAX = 17
+PHYSICS_PARAM_COUNT = 18
+
+
+@njit(nogil=True)
+def _key_thickness(bit_array, volumes, hit_counts, average_volume, final_volume, final_volume_index,
+                   scaler, thickness_list, max_thickness, up):
+    """
+    按音量计算各活动键位本帧的气泡厚度（写入thickness_list），并记录音量历史
 
-@njit
-def add_pattern(bit_array, volumes, average_volume, position_list, final_volume, final_volume_index, scaler, thickness_list, pattern_data, pattern_data_thickness, orientation):
+    hit_counts: 各键位在本帧内被敲击的次数，多次敲击生成更厚的气泡（密集MIDI合并模式）；不合并时全为1
+    Returns:
+        (方差列表, 新的final_volume_index)
+    """
     variances = []
-    active_indices = np.where(bit_array)[0]  # 获取活动索引
-    for i in active_indices:
+    history = len(final_volume)
+    for i in range(len(bit_array)):
+        if not bit_array[i]:
+            continue
         # Handle case when volumes array has a different size than bit_array
         volume_idx = min(i, len(volumes) - 1) if len(volumes) > 0 else 0
-        x_center, y_center = position_list[i]
-        volume_factor = ((volumes[volume_idx] - average_volume) / average_volume) if average_volume else 0
-        final_volume_piece = min((500 if orientation == "up" else 200), (1 + scaler * volume_factor) ** (5 if orientation == "up" else 2.5))
+        volume_factor = ((volumes[volume_idx] - average_volume) / average_volume) if average_volume else 0.0
+        final_volume_piece = min(max_thickness, (1 + scaler * volume_factor) ** (5.0 if up else 2.5))
         final_volume[final_volume_index] = final_volume_piece
-        final_volume_index = (final_volume_index + 1) % 30
+        final_volume_index = (final_volume_index + 1) % history
         if final_volume_index == 0:
-            variance = np.var(final_volume)
-            variances.append(variance)
+            variances.append(np.var(final_volume))
+
+        hits = max(hit_counts[i], 1)
+        thickness_list[i] = int(min(max_thickness, final_volume_piece * (1 + np.log2(hits))))
+    return variances, final_volume_index
+
+
+@njit(nogil=True)
+def _emit_bubble(edge_data, edge_thickness, x, y, key, thickness_list):
+    """在发射层的(x, y)放置键位key的气泡"""
+    edge_data[x, y] = 1
+    edge_thickness[x, y] = thickness_list[key] + (1 * (119 - key)) // 119 + 1
+
+
+@njit(nogil=True)
+def _emit_column(bit_array, volumes, hit_counts, average_volume, position_list, final_volume, final_volume_index,
+                 scaler, thickness_list, edge_data, edge_thickness, max_thickness, up):
+    """
+    一个气泡柱的发射：计算键位厚度，每个活动键位在position_list[i]放置气泡
 
-        thickness_list[i] = int(final_volume_piece)
-        total_thickness = thickness_list[i] + (1 * (119 - i)) // 119
-        pattern_data[-1 if orientation == "down" else 0, x_center, y_center] = 1
-        pattern_data_thickness[-1 if orientation == "down" else 0, x_center, y_center] = total_thickness + 1
+    edge_data/edge_thickness: 发射层 (X, Y)
+    Returns:
+        (方差列表, 新的final_volume_index)
+    """
+    variances, final_volume_index = _key_thickness(
+        bit_array, volumes, hit_counts, average_volume, final_volume, final_volume_index,
+        scaler, thickness_list, max_thickness, up)
+    for i in range(len(bit_array)):
+        if bit_array[i]:
+            x_center, y_center = position_list[i]
+            _emit_bubble(edge_data, edge_thickness, x_center, y_center, i, thickness_list)
+    return variances, final_volume_index
+
+
+@njit
+def add_pattern(bit_array, volumes, hit_counts, average_volume, position_list, final_volume, final_volume_index, scaler, thickness_list, pattern_data, pattern_data_thickness, orientation, params):
+    # hit_counts: 各键位在本帧内被敲击的次数（密集MIDI合并模式），不合并时全为1
+    up = orientation == "up"
+    max_thickness = params[P_MAX_VOLUME_UP] if up else params[P_MAX_VOLUME_DOWN]
+    edge = 0 if up else pattern_data.shape[0] - 1
+    variances, _ = _emit_column(bit_array, volumes, hit_counts, average_volume, position_list,
+                                final_volume, final_volume_index, scaler, thickness_list,
+                                pattern_data[edge], pattern_data_thickness[edge], max_thickness, up)
     return variances
 
 
 @njit
-def calculate_bubble(pattern_data, pattern_data_thickness, data_height, orientation="up"):
+def calculate_bubble(pattern_data, pattern_data_thickness, data_height, orientation, params):
     pattern_data_temp = np.zeros(pattern_data.shape, dtype=np.float32)
     pattern_data_thickness_temp = np.zeros(pattern_data_thickness.shape, dtype=np.float32)
+    return calculate_bubble_into(pattern_data, pattern_data_thickness, data_height, orientation,
+                                 pattern_data_temp, pattern_data_thickness_temp,
+                                 np.zeros(2, dtype=np.int64), params)
+
+
+@njit
+def calculate_bubble_into(pattern_data, pattern_data_thickness, data_height, orientation,
+                          pattern_data_temp, pattern_data_thickness_temp, merge_counts, params):
+    """
+    与calculate_bubble相同，结果写入调用方复用的数组（每帧新分配两个体素数组的缺页开销占大半）
+
+    merge_counts: int64[2]，累加 [移动到同一格而合并的气泡数, 相邻合并的次数]
+    params: 物理参数数组（P_*）
+    """
+    up = orientation == "up"
+    max_thickness = params[P_MAX_VOLUME_UP] if up else params[P_MAX_VOLUME_DOWN]
+    pattern_data_temp[:] = 0
+    pattern_data_thickness_temp[:] = 0
 
     # 遍历方向
-    if orientation == "up":
+    if up:
         layer_range = range(0, data_height - 1)
-        direction = 1
     else:
         layer_range = range(data_height - 1, 0, -1)
-        direction = -1
 
+    last = pattern_data.shape[0] - 1
     for layer in layer_range:
-        x, y = np.nonzero(pattern_data[layer])
-        if x.size == 0:
-            continue
-
-        thickness = pattern_data_thickness[layer]
-        max_x = pattern_data_temp.shape[1] - 1
-        max_y = pattern_data_temp.shape[2] - 1
-
-        # 厚度值
-        th_values = np.empty(x.size, dtype=np.float32)
-        for i in range(x.size):
-            th_values[i] = thickness[x[i], y[i]]
-
-        # 进度因子
-        if orientation == "up":
-            progress = layer / (data_height - 1)
-            rise_speeds = 5.0 + np.minimum(10.0 * progress, 10.0) + np.minimum(th_values * 0.1, 8.0)
-        else:
-            rise_speeds = 6.0 + np.minimum(th_values * 0.1, 8.0) + np.random.randint(-3,4,size=x.size)
-
-        # 计算上升（或下降）速度
-        rise_speeds = np.maximum(0.0, np.minimum(rise_speeds, 18.0))
-
-        # 目标层
-        target_layers = layer + direction * rise_speeds.astype(np.int32)
-
-        # 抖动
-        jitter_x = np.random.randint(-1, 2, size=x.size)
-        jitter_y = np.random.randint(-1, 2, size=y.size)
-        target_x = np.maximum(0, np.minimum(x + jitter_x, max_x))
-        target_y = np.maximum(0, np.minimum(y + jitter_y, max_y))
+        target_layers, target_x, target_y, th_values = _layer_targets(
+            pattern_data, pattern_data_thickness, layer, data_height, up, params)
 
         # 写入目标层
-        for i in range(len(x)):
+        for i in range(len(target_layers)):
             tl = target_layers[i]
-            tx = target_x[i]
-            ty = target_y[i]
-            th = th_values[i]
 
             # 向下方向：越界气泡强制落在最后一层
-            if orientation == "down" and tl < 0:
-                tl = pattern_data.shape[0] - 1
+            if not up and tl < 0:
+                tl = last
 
             # 边界保护
-            tl = max(0, min(tl, pattern_data.shape[0] - 1))
-
-            # 写入
-            if pattern_data_temp[tl, tx, ty] == 1:
-                pattern_data_thickness_temp[tl, tx, ty] += th
-            else:
-                pattern_data_temp[tl, tx, ty] = 1
-                pattern_data_thickness_temp[tl, tx, ty] = th
-
-            # 随高度调整气泡大小
-            if orientation == "up":
-                size_increase = 1.0 + (tl / data_height) * 0.05
-                pattern_data_thickness_temp[tl, tx, ty] *= size_increase
+            tl = max(0, min(tl, last))
+            _place_bubble(pattern_data_temp, pattern_data_thickness_temp, tl, tl,
+                          target_x[i], target_y[i], th_values[i], up, data_height, merge_counts, params)
 
     # 优化气泡合并逻辑：每隔几层才进行合并检查
-    merge_interval = 5  # 每隔5层检查一次合并
+    merge_interval = max(1, int(params[P_MERGE_INTERVAL]))  # 每隔几层检查一次合并
     for layer in range(0, data_height, merge_interval):
-        x, y = np.nonzero(pattern_data_temp[layer])
-        if len(x) < 2:  # 如果气泡数量太少，跳过合并
-            continue
-            
-        # 使用网格法减少需要检查的气泡对
-        grid = np.zeros((pattern_data.shape[1] // 3 + 1, pattern_data.shape[2] // 3 + 1), dtype=np.int32)
-        grid_points = []
-        for i in range(len(x)):
-            grid_x = x[i] // 3
-            grid_y = y[i] // 3
-            grid[grid_x, grid_y] += 1
-            grid_points.append((grid_x, grid_y, i))
-        
-        # 只检查相邻网格中的气泡
-        for i in range(len(grid_points)):
-            gx, gy, idx = grid_points[i]
-            for j in range(i + 1, len(grid_points)):
-                gx2, gy2, idx2 = grid_points[j]
-                
-                # 只检查相邻网格
-                if abs(gx - gx2) <= 1 and abs(gy - gy2) <= 1:
-                    distance = np.sqrt((x[idx] - x[idx2]) ** 2 + (y[idx] - y[idx2]) ** 2)
-                    if 2 * distance < np.sqrt(pattern_data_thickness_temp[layer, x[idx], y[idx]] + 
-                                           pattern_data_thickness_temp[layer, x[idx2], y[idx2]]):
-                        # 合并气泡
-                        new_x = (x[idx] + x[idx2]) // 2
-                        new_y = (y[idx] + y[idx2]) // 2
-                        pattern_data_temp[layer, new_x, new_y] = 1
-                        pattern_data_thickness_temp[layer, new_x, new_y] = np.minimum(
-                            (500 if orientation == "up" else 200), 
-                            pattern_data_thickness_temp[layer, x[idx], y[idx]] + 
-                            pattern_data_thickness_temp[layer, x[idx2], y[idx2]]
-                        )
-                        pattern_data_temp[layer, x[idx], y[idx]] = 0
-                        pattern_data_temp[layer, x[idx2], y[idx2]] = 0
-                        pattern_data_thickness_temp[layer, x[idx], y[idx]] = 0
-                        pattern_data_thickness_temp[layer, x[idx2], y[idx2]] = 0
+        _merge_layer(pattern_data_temp, pattern_data_thickness_temp, layer, max_thickness, merge_counts, params)
 
     return pattern_data_temp, pattern_data_thickness_temp
 
 
+@njit(nogil=True)
+def _layer_targets(pattern_data, pattern_data_thickness, layer, data_height, up, params):
+    """
+    一层气泡的移动目标（calculate_bubble的速度和抖动规则）
+
+    Returns:
+        (目标层, 目标x, 目标y, 厚度)；目标层未做边界处理，向下越界时小于0
+    """
+    x, y = np.nonzero(pattern_data[layer])
+    if x.size == 0:
+        return (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64),
+                np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+
+    speed_factor = params[P_THICKNESS_SPEED_FACTOR]
+    max_thickness_bonus = params[P_MAX_THICKNESS_BONUS]
+    jitter = int(params[P_JITTER_RANGE])
+    thickness = pattern_data_thickness[layer]
+    max_x = pattern_data.shape[1] - 1
+    max_y = pattern_data.shape[2] - 1
+
+    # 厚度值
+    th_values = np.empty(x.size, dtype=np.float32)
+    for i in range(x.size):
+        th_values[i] = thickness[x[i], y[i]]
+
+    # 进度因子
+    if up:
+        progress = layer / (data_height - 1)
+        max_progress_bonus = params[P_MAX_PROGRESS_BONUS]
+        rise_speeds = (params[P_BASE_RISE_SPEED_UP] + np.minimum(max_progress_bonus * progress, max_progress_bonus)
+                       + np.minimum(th_values * speed_factor, max_thickness_bonus))
+    else:
+        rise_speeds = (params[P_BASE_RISE_SPEED_DOWN] + np.minimum(th_values * speed_factor, max_thickness_bonus)
+                       + np.random.randint(-jitter, jitter + 1, size=x.size))
+
+    # 计算上升（或下降）速度
+    rise_speeds = np.maximum(0.0, np.minimum(rise_speeds, params[P_MAX_RISE_SPEED]))
+
+    # 目标层
+    direction = 1 if up else -1
+    target_layers = layer + direction * rise_speeds.astype(np.int32)
+
+    # 抖动
+    jitter_x = np.random.randint(-1, 2, size=x.size)
+    jitter_y = np.random.randint(-1, 2, size=y.size)
+    target_x = np.maximum(0, np.minimum(x + jitter_x, max_x))
+    target_y = np.maximum(0, np.minimum(y + jitter_y, max_y))
+    return target_layers, target_x, target_y, th_values
+
+
+@njit(nogil=True)
+def _place_bubble(pattern_data_temp, pattern_data_thickness_temp, index, layer, tx, ty, th,
+                  up, data_height, merge_counts, params):
+    """把一个气泡写入临时数组的第index层（全局第layer层）；同一格已有气泡时厚度相加"""
+    if pattern_data_temp[index, tx, ty] == 1:
+        merge_counts[0] += 1
+        pattern_data_thickness_temp[index, tx, ty] += th
+    else:
+        pattern_data_temp[index, tx, ty] = 1
+        pattern_data_thickness_temp[index, tx, ty] = th
+
+    # 随高度调整气泡大小
+    if up:
+        size_increase = 1.0 + (layer / data_height) * params[P_SIZE_INCREASE_FACTOR]
+        pattern_data_thickness_temp[index, tx, ty] *= size_increase
+
+
+@njit(nogil=True)
+def _merge_layer(pattern_data_temp, pattern_data_thickness_temp, layer, max_thickness, merge_counts, params):
+    """合并临时数组第layer层中距离足够近的气泡"""
+    cell = max(1, int(params[P_GRID_CELL_SIZE]))
+    adjacent = int(params[P_ADJACENT_GRID_THRESHOLD])
+    distance_factor = params[P_MERGE_DISTANCE_FACTOR]
+    x, y = np.nonzero(pattern_data_temp[layer])
+    if len(x) < 2:  # 如果气泡数量太少，跳过合并
+        return
+
+    # 使用网格法减少需要检查的气泡对
+    grid = np.zeros((pattern_data_temp.shape[1] // cell + 1, pattern_data_temp.shape[2] // cell + 1), dtype=np.int32)
+    grid_points = []
+    for i in range(len(x)):
+        grid_x = x[i] // cell
+        grid_y = y[i] // cell
+        grid[grid_x, grid_y] += 1
+        grid_points.append((grid_x, grid_y, i))
+
+    # 只检查相邻网格中的气泡
+    for i in range(len(grid_points)):
+        gx, gy, idx = grid_points[i]
+        for j in range(i + 1, len(grid_points)):
+            gx2, gy2, idx2 = grid_points[j]
+
+            # 只检查相邻网格
+            if abs(gx - gx2) <= adjacent and abs(gy - gy2) <= adjacent:
+                distance = np.sqrt((x[idx] - x[idx2]) ** 2 + (y[idx] - y[idx2]) ** 2)
+                if distance_factor * distance < np.sqrt(pattern_data_thickness_temp[layer, x[idx], y[idx]] +
+                                       pattern_data_thickness_temp[layer, x[idx2], y[idx2]]):
+                    # 合并气泡
+                    merge_counts[1] += 1
+                    new_x = (x[idx] + x[idx2]) // 2
+                    new_y = (y[idx] + y[idx2]) // 2
+                    pattern_data_temp[layer, new_x, new_y] = 1
+                    pattern_data_thickness_temp[layer, new_x, new_y] = np.minimum(
+                        max_thickness,
+                        pattern_data_thickness_temp[layer, x[idx], y[idx]] +
+                        pattern_data_thickness_temp[layer, x[idx2], y[idx2]]
+                    )
+                    pattern_data_temp[layer, x[idx], y[idx]] = 0
+                    pattern_data_temp[layer, x[idx2], y[idx2]] = 0
+                    pattern_data_thickness_temp[layer, x[idx], y[idx]] = 0
+                    pattern_data_thickness_temp[layer, x[idx2], y[idx2]] = 0
+
+
 @njit('int32[:,:](int32[:,:], int32)', cache=True, nogil=True)
 def _unique_2d(arr, width):
     """
@@ -207,6 +326,7 @@ def calculate_pattern_data_3d(#down 模式下才有积雪
         orientation_int,          # 0=up, 1=down
         snow_ttl,                # (H, W) int32
         max_snow_ttl,            # int32
+        params,                  # float64[PHYSICS_PARAM_COUNT]，这里只用积雪大小和透明度
     ):
     H, W = pattern_data.shape[1], pattern_data.shape[2]
 
@@ -375,9 +495,9 @@ def calculate_pattern_data_3d(#down 模式下才有积雪
                 snow_sz[i] = actual_size
             else:
                 r = ttl_val / np.float32(max_snow_ttl)
-                snow_sz[i] = np.float32(10.0) + r * np.float32(40.0)
+                snow_sz[i] = np.float32(params[P_SNOW_SIZE_MIN]) + r * np.float32(params[P_SNOW_SIZE_MAX] - params[P_SNOW_SIZE_MIN])
 
-            snow_op[i] = np.float32(0.2) + (ttl_val / np.float32(max_snow_ttl)) * np.float32(0.8)
+            snow_op[i] = np.float32(params[P_SNOW_OPACITY_MIN]) + (ttl_val / np.float32(max_snow_ttl)) * np.float32(params[P_SNOW_OPACITY_MAX] - params[P_SNOW_OPACITY_MIN])
 
         snow_x -= offset[0]
         snow_y -= offset[1]
@@ -520,6 +640,12 @@ def calculate_pattern_data_3d(#down 模式下才有积雪
     return all_x, all_y, all_z, all_sz, all_op, all_types, all_color_blend_factors
 
 
+@njit(cache=True, nogil=True)
+def seed_random(seed):
+    """设置njit函数中np.random的种子（numba的随机数状态与numpy的相互独立）"""
+    np.random.seed(seed)
+
+
 @njit(cache=True, nogil=True, fastmath=True)
 def calculate_particle_colors_njit(all_types, all_color_blend_factors, all_opacity, base_color_r, base_color_g, base_color_b):
     """
@@ -568,3 +694,284 @@ def calculate_particle_colors_njit(all_types, all_color_blend_factors, all_opaci
         colors[i, 3] = opacity
     
     return colors
+
+
+@njit(parallel=True)
+def step_columns(bit_arrays, volumes, hit_counts, average_volumes, position_list,
+                 final_volume, final_volume_index, scaler, thickness_list,
+                 pattern_data, pattern_data_thickness, pattern_data_temp, pattern_data_thickness_temp,
+                 data_height, orientation_ints, merge_counts, params, variance_sum, variance_count):
+    """
+    多个气泡柱（第一维为柱）推进一帧：清空发射层、add_pattern、calculate_bubble_into
+    和写回，各柱并行（calculate_bubble本身是串行的，一柱一线程）
+
+    position_list: (N, 2) 各柱共用的发射位置
+    hit_counts: 不合并时全为1
+    final_volume_index: 原地更新；variance_sum/variance_count: 输出本帧方差之和与个数，
+        由调用方按BubbleGenerator.update_scaler_from_variances的规则更新scaler
+    """
+    n_columns = pattern_data.shape[0]
+    for c in prange(n_columns):
+        up = orientation_ints[c] == 0
+        edge = 0 if up else pattern_data.shape[1] - 1
+        pattern_data[c, edge] = 0
+        pattern_data_thickness[c, edge] = 0
+
+        column_params = params[c]
+        max_thickness = column_params[P_MAX_VOLUME_UP] if up else column_params[P_MAX_VOLUME_DOWN]
+        variances, final_volume_index[c] = _emit_column(
+            bit_arrays[c], volumes[c], hit_counts[c], average_volumes[c], position_list,
+            final_volume[c], final_volume_index[c], scaler[c], thickness_list[c],
+            pattern_data[c, edge], pattern_data_thickness[c, edge], max_thickness, up)
+        variance_sum[c] = 0.0
+        variance_count[c] = 0
+        for variance in variances:
+            variance_sum[c] += variance
+            variance_count[c] += 1
+
+        if up:
+            calculate_bubble_into(pattern_data[c], pattern_data_thickness[c], data_height, "up",
+                                  pattern_data_temp[c], pattern_data_thickness_temp[c],
+                                  merge_counts[c], column_params)
+        else:
+            calculate_bubble_into(pattern_data[c], pattern_data_thickness[c], data_height, "down",
+                                  pattern_data_temp[c], pattern_data_thickness_temp[c],
+                                  merge_counts[c], column_params)
+        # 写回第1层到data_height层；按一维逐元素复制，numba对三维切片赋值慢得多
+        layer = pattern_data.shape[2] * pattern_data.shape[3]
+        target, source = pattern_data[c].reshape(-1), pattern_data_temp[c].reshape(-1)
+        target_thickness, source_thickness = pattern_data_thickness[c].reshape(-1), pattern_data_thickness_temp[c].reshape(-1)
+        for i in range(layer, data_height * layer):
+            target[i] = source[i]
+            target_thickness[i] = source_thickness[i]
+
+
+@njit(nogil=True)
+def calculate_pattern_data_3d_columns(pattern_data, pattern_data_thickness, offset,
+                                      all_positions_x, all_positions_y,
+                                      position_index_keys_x, position_index_keys_y, position_index_values,
+                                      opacity_values, data_height, orientation_ints, snow_ttl, max_snow_ttl,
+                                      params, column_x, column_ends):
+    """
+    多个气泡柱的粒子数据，一次调用：逐柱calculate_pattern_data_3d，结果拼接成一个批次
+
+    column_x: 每柱的x平移（并排摆放）；column_ends: 输出，第c柱粒子在结果中的结束位置
+    """
+    parts = []
+    total = 0
+    for c in range(pattern_data.shape[0]):
+        part = calculate_pattern_data_3d(
+            pattern_data[c], pattern_data_thickness[c], offset,
+            all_positions_x, all_positions_y,
+            position_index_keys_x, position_index_keys_y, position_index_values,
+            opacity_values, data_height, orientation_ints[c], snow_ttl[c], max_snow_ttl, params[c]
+        )
+        parts.append(part)
+        total += len(part[0])
+        column_ends[c] = total
+
+    all_x = np.empty(total, dtype=np.float32)
+    all_y = np.empty(total, dtype=np.float32)
+    all_z = np.empty(total, dtype=np.float32)
+    all_sz = np.empty(total, dtype=np.float32)
+    all_op = np.empty(total, dtype=np.float32)
+    all_types = np.empty(total, dtype=np.int32)
+    all_blend = np.empty(total, dtype=np.float32)
+    start = 0
+    for c in range(len(parts)):
+        x, y, z, sz, op, types, blend = parts[c]
+        end = column_ends[c]
+        all_x[start:end] = x + np.float32(column_x[c])
+        all_y[start:end] = y
+        all_z[start:end] = z
+        all_sz[start:end] = sz
+        all_op[start:end] = op
+        all_types[start:end] = types
+        all_blend[start:end] = blend
+        start = end
+    return all_x, all_y, all_z, all_sz, all_op, all_types, all_blend
+
+
+@njit(cache=True, nogil=True)
+def add_pattern_emitters(bit_array, volumes, hit_counts, average_volume, positions, emitter_keys,
+                         final_volume, final_volume_index, scaler, thickness_list,
+                         edge_data, edge_thickness, up, params):
+    """
+    发射点多于键位的大柱（MBC_SlabSimulation）的add_pattern
+
+    音量历史和厚度按键位计算（与120个发射点的单柱相同），第e个发射点使用键位emitter_keys[e]的厚度
+    positions: (N, 2) 发射点；edge_data/edge_thickness: 发射层 (X, Y)
+    Returns:
+        (方差列表, 新的final_volume_index)
+    """
+    max_thickness = params[P_MAX_VOLUME_UP] if up else params[P_MAX_VOLUME_DOWN]
+    variances, final_volume_index = _key_thickness(
+        bit_array, volumes, hit_counts, average_volume, final_volume, final_volume_index,
+        scaler, thickness_list, max_thickness, up)
+    for e in range(len(emitter_keys)):
+        i = emitter_keys[e]
+        if bit_array[i]:
+            _emit_bubble(edge_data, edge_thickness, positions[e, 0], positions[e, 1], i, thickness_list)
+    return variances, final_volume_index
+
+
+@njit(cache=True, nogil=True)
+def move_slab(pattern_data, pattern_data_thickness, layer_counts, z0, z1, data_height, up,
+              temp, temp_thickness, dirty, outbox, exchange_counts, merge_counts, params):
+    """
+    大柱分段模拟的移动阶段：calculate_bubble_into中属于本段 [z0, z1) 的部分
+
+    pattern_data: 整个柱 (H, X, Y)（共享内存），只读取本段的层
+    layer_counts: 每层的气泡数，跳过空层（大柱中绝大多数层是空的）
+    temp: 本段的临时数组 (z1 - z0, X, Y)，留在本段的气泡按原规则写入，dirty标记写入过的层
+        （settle_slab写回后清零这些层，不需要每帧清空整个数组）
+    outbox: (2, capacity, 4) 越过段边界的气泡 [目标层, x, y, 厚度]，0 = 送往下方的段
+        （向下模式落到底部、回到顶层的气泡由最低段经此送往最高段），1 = 送往上方的段
+    exchange_counts: int64[3]，[送往下方的条数, 送往上方的条数, 累计因容量不足丢弃的气泡]
+    """
+    exchange_counts[0] = 0
+    exchange_counts[1] = 0
+    capacity = outbox.shape[1]
+    last = data_height - 1
+
+    if up:
+        layer_range = range(z0, min(z1, last))
+    else:
+        layer_range = range(z1 - 1, max(z0, 1) - 1, -1)
+
+    for layer in layer_range:
+        if layer_counts[layer] == 0:
+            continue
+        target_layers, target_x, target_y, th_values = _layer_targets(
+            pattern_data, pattern_data_thickness, layer, data_height, up, params)
+        for i in range(len(target_layers)):
+            tl = target_layers[i]
+            wrapped = False
+            if not up and tl < 0:
+                tl = last
+                wrapped = True
+            tl = max(0, min(tl, last))
+
+            if z0 <= tl < z1:
+                _place_bubble(temp, temp_thickness, tl - z0, tl, target_x[i], target_y[i], th_values[i],
+                              up, data_height, merge_counts, params)
+                dirty[tl - z0] = True
+                continue
+            side = 0 if wrapped or tl < z0 else 1
+            n = exchange_counts[side]
+            if n < capacity:
+                outbox[side, n, 0] = tl
+                outbox[side, n, 1] = target_x[i]
+                outbox[side, n, 2] = target_y[i]
+                outbox[side, n, 3] = th_values[i]
+                exchange_counts[side] = n + 1
+            else:
+                exchange_counts[2] += 1
+
+
+@njit(cache=True, nogil=True)
+def settle_slab(pattern_data, pattern_data_thickness, layer_counts, z0, z1, data_height, up,
+                temp, temp_thickness, dirty, inbox_below, count_below, inbox_above, count_above,
+                merge_counts, params):
+    """
+    大柱分段模拟的合并阶段（所有段移动完之后）：写入相邻段送来的气泡，
+    合并本段中层号为merge_interval倍数的层，再写回本段（第0层除外，与单柱相同）并更新layer_counts
+
+    inbox_below/inbox_above: 下方/上方的段送来的气泡 (capacity, 4)，各有count条
+    """
+    for inbox, count in ((inbox_below, count_below), (inbox_above, count_above)):
+        for n in range(count):
+            tl = int(inbox[n, 0])
+            _place_bubble(temp, temp_thickness, tl - z0, tl, int(inbox[n, 1]), int(inbox[n, 2]), inbox[n, 3],
+                          up, data_height, merge_counts, params)
+            dirty[tl - z0] = True
+
+    max_thickness = params[P_MAX_VOLUME_UP] if up else params[P_MAX_VOLUME_DOWN]
+    merge_interval = max(1, int(params[P_MERGE_INTERVAL]))
+    for layer in range((z0 + merge_interval - 1) // merge_interval * merge_interval, z1, merge_interval):
+        if dirty[layer - z0]:
+            _merge_layer(temp, temp_thickness, layer - z0, max_thickness, merge_counts, params)
+
+    # 逐层按一维写回：写入过的层复制后清零临时数组，原来有气泡、本帧没有写入的层清空
+    cells = pattern_data.shape[1] * pattern_data.shape[2]
+    target, target_thickness = pattern_data.reshape(-1), pattern_data_thickness.reshape(-1)
+    source, source_thickness = temp.reshape(-1), temp_thickness.reshape(-1)
+    for layer in range(z0, z1):
+        local = (layer - z0) * cells
+        base = layer * cells
+        if dirty[layer - z0]:
+            count = 0
+            for i in range(cells):
+                if layer > 0:
+                    target[base + i] = source[local + i]
+                    target_thickness[base + i] = source_thickness[local + i]
+                    if source[local + i] != 0:
+                        count += 1
+                source[local + i] = 0
+                source_thickness[local + i] = 0
+            dirty[layer - z0] = False
+            if layer > 0:
+                layer_counts[layer] = count
+        elif layer > 0 and layer_counts[layer] != 0:
+            for i in range(cells):
+                target[base + i] = 0
+                target_thickness[base + i] = 0
+            layer_counts[layer] = 0
+
+
+@njit(cache=True, nogil=True, fastmath=True)
+def slab_particles(pattern_data, pattern_data_thickness, layer_counts, z0, z1, data_height, orientation_int,
+                   offset, out):
+    """
+    大柱分段模拟的粒子数据：本段中滚动层的粒子（calculate_pattern_data_3d的step2和灯光混合因子）
+
+    层的顺序与calculate_pattern_data_3d相同（向上时从低到高，向下时从高到低）
+    out: (5, capacity) [x, y, z, 大小, 颜色混合因子]
+    Returns:
+        本段的粒子数（大于capacity时多出的没有写入）
+    """
+    H, W = pattern_data.shape[1], pattern_data.shape[2]
+    capacity = out.shape[1]
+    if orientation_int == 0:
+        layer_range = range(max(z0, 1), z1)
+        max_val = 500.0
+    else:
+        layer_range = range(min(z1, data_height - 1) - 1, z0 - 1, -1)
+        max_val = 200.0
+
+    # 与calculate_pattern_data_3d第11步相同的灯光几何
+    light_center_x = W / 2 - offset[0]
+    light_center_y = H / 2 - offset[1]
+    light_source_z = data_height + 50
+    cone_length = (data_height + 50) * 1
+    max_light_radius_base = W / 1.2
+    min_blend = 0.2
+
+    n = 0
+    for layer in layer_range:
+        if layer_counts[layer] == 0:
+            continue
+        for iy in range(H):
+            for ix in range(W):
+                if pattern_data[layer, iy, ix] == 0:
+                    continue
+                if n < capacity:
+                    px = np.float32(ix) - offset[0]
+                    py = np.float32(iy) - offset[1]
+                    out[0, n] = px
+                    out[1, n] = py
+                    out[2, n] = layer
+                    out[3, n] = min(max(pattern_data_thickness[layer, iy, ix] * 5.0, 0.0), max_val)
+                    blend = 0.0
+                    if orientation_int == 1 and layer < light_source_z and layer > (light_source_z - cone_length):
+                        cone_ratio = (light_source_z - layer) / cone_length
+                        current_max_radius = max_light_radius_base * cone_ratio
+                        dist_to_axis = np.sqrt((px - light_center_x)**2 + (py - light_center_y)**2)
+                        if dist_to_axis < current_max_radius:
+                            blend_factor = ((1.0 - (dist_to_axis / current_max_radius))*0.9)**2
+                            blend = min_blend + (1.0 - min_blend) * blend_factor
+                        else:
+                            blend = min_blend
+                    out[4, n] = blend
+                n += 1
+    return n
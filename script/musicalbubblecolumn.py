@@ -18,6 +18,7 @@ from MBC_UI_widgets import *
 import MBC_app_widgets
 import MBC_Core
 from MBC_config import get_config
+from MBC_Playlist import Playlist
 
 
 if __name__ == "__main__":
@@ -53,6 +54,22 @@ if __name__ == "__main__":
     loading_manager.smooth_transition(50, 100, duration=0.5)
     QApplication.processEvents()  # 确保界面更新
     
+    if config.audio.live_input_enabled:
+        # 实时输入模式：MIDI键盘直接驱动气泡柱，窗口关闭后退出
+        from MBC_LiveMidiInput import LiveMidiInput
+        midi_visualizer = MBC_app_widgets.MidiVisualizer(visualizer)
+        live_input = LiveMidiInput(
+            midi_visualizer.key_state,
+            device_id=config.audio.live_input_device_id,
+            poll_interval=config.audio.live_input_poll_interval_ms / 1000.0,
+            average_window=config.audio.total_volumes_maxlen
+        )
+        while not loading_manager.fully_complete:
+            QApplication.processEvents()
+        if midi_visualizer.visualize_live(live_input):
+            sys.exit(0)
+        print("Falling back to MIDI file playback")
+    
     dialog_manager = FileDialogManager(visualizer)
     visualizer.working = True  # 初始化工作状态
     
@@ -74,7 +91,11 @@ if __name__ == "__main__":
                 QApplication.processEvents()
             # Create and use MidiVisualizer instance
             midi_visualizer = MBC_app_widgets.MidiVisualizer(visualizer)
-            midi_visualizer.visualize(dialog_manager.current_midi_path)
+            if len(dialog_manager.playlist_paths) > 1:
+                # 多选的文件作为播放列表连续播放，下一首在后台预先准备
+                midi_visualizer.visualize_playlist(Playlist(dialog_manager.playlist_paths))
+            else:
+                midi_visualizer.visualize(dialog_manager.current_midi_path)
             dialog_manager.show_dialog()
         
         if not visualizer.working and dialog_manager.user_cancelled: